@@ -17,6 +17,11 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Comma-separated emails allowed to use the admin endpoints and request profiling
+ADMIN_EMAILS = {
+    email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+}
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -75,3 +80,26 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     if not verify_password(password, user.hashed_password):
         return None
     return user
+
+
+def is_admin_email(email: Optional[str]) -> bool:
+    """Whether an email is listed in ADMIN_EMAILS"""
+    return bool(email) and email.lower() in ADMIN_EMAILS
+
+
+def email_from_token(token: str) -> Optional[str]:
+    """Email (subject) of a valid JWT access token, or None"""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Get the current user, requiring them to be an admin"""
+    if not is_admin_email(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
@@ -7,11 +7,16 @@ from typing import List, Optional
 import os
 from datetime import datetime
 
-from app.models import Base, Transaction, User, engine, get_db
-from app.routers import upload, reports, auth, ai_insights
-from app.services.ai_service import AIService
+from app.models import Base, Document, Transaction, User, engine, get_db
+from app.routers import upload, reports, auth, ai_insights, metrics, admin
+from app.services.ai_service import get_ai_service
+from app.services.category_classifier import get_category_classifier
+from app.services.llm_clients import LLMOverloaded, get_llm_clients
 from app.services.ocr_service import OCRService
+from app.services import workers
 from app.auth import get_current_user
+from app.middleware import MetricsMiddleware, ProfilingMiddleware, instrument_engine
+from app.services.profiler import PROFILING_ENABLED
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -31,11 +36,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts, latency and DB time per route (exported at /api/metrics)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+instrument_engine(engine)
+
+# On-demand request profiling; not installed at all unless enabled
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(reports.router, prefix="/api", tags=["reports"])
 app.include_router(ai_insights.router, prefix="/api", tags=["ai-insights"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
 
 # Mount static files for demo images
 demo_images_path = os.path.join(os.path.dirname(__file__), "..", "demo_images")
@@ -43,10 +58,55 @@ if os.path.exists(demo_images_path):
     app.mount("/demo", StaticFiles(directory=demo_images_path), name="demo")
 
 # Initialize services
-ai_service = AIService()
+ai_service = get_ai_service()
 ocr_service = OCRService()
 
 
+def _refresh_category_classifier(classifier):
+    """Unlearn deleted transactions, learn changed ones and save (blocking)"""
+    classifier.prune()
+    classifier.sync(force=True)
+    classifier.save()
+
+
+@app.on_event("startup")
+async def load_category_classifier():
+    """Bring the saved category model up to date with the transactions table"""
+    classifier = get_category_classifier()
+    if classifier is not None:
+        await workers.run_in_thread(_refresh_category_classifier, classifier)
+
+
+@app.on_event("shutdown")
+async def save_category_classifier():
+    """Persist the category model so the next start only reads newer changes"""
+    classifier = get_category_classifier()
+    if classifier is not None:
+        await workers.run_in_thread(classifier.save)
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    """Stop the OCR process pool and AI thread pool"""
+    workers.shutdown_pools()
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    """Close the pooled connections to the AI providers"""
+    await get_llm_clients().aclose()
+
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request, exc: LLMOverloaded):
+    """An AI provider's request queue is full: ask the client to back off"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"AI service is busy, retry in {exc.retry_after}s"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -158,6 +218,12 @@ async def update_transaction(
     
     db.commit()
     db.refresh(transaction)
+
+    # Learn the user's correction straight away
+    classifier = get_category_classifier()
+    if classifier is not None:
+        classifier.observe(transaction.id, transaction.user_id, transaction.vendor,
+                           transaction.description, transaction.category)
     
     return {"message": "Transaction updated successfully", "id": transaction_id}
 
@@ -181,8 +247,14 @@ async def delete_transaction(
     if transaction.document_path and os.path.exists(transaction.document_path):
         os.remove(transaction.document_path)
     
+    # Drop the upload index entries so the file can be uploaded again
+    db.query(Document).filter(Document.transaction_id == transaction.id).delete()
     db.delete(transaction)
     db.commit()
+
+    classifier = get_category_classifier()
+    if classifier is not None:
+        classifier.forget(transaction_id)
     
     return {"message": "Transaction deleted successfully", "id": transaction_id}
 
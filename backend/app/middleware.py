@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+
+from sqlalchemy import event
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+from app.auth import email_from_token, is_admin_email
+from app.services.metrics import add_db_time, request_metrics, track_db_time
+from app.services.profiler import PROFILE_HEADER, PROFILE_SAMPLE_RATE, profile_request
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    Record every HTTP request in app.services.metrics.request_metrics
+
+    Requests are labelled by route template (e.g. /api/transactions/{transaction_id})
+    rather than raw path, so ids do not create new series. Written as plain
+    ASGI middleware so streaming responses are not buffered.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def _route_template(self, scope) -> str:
+        # Matching up front (rather than reading scope["route"] afterwards)
+        # lets the in-flight gauge carry the route too
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", UNMATCHED_ROUTE)
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_template(scope)
+        status = 500  # Reported if the app raises before starting a response
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request_metrics.start(method, route)
+        start = time.perf_counter()
+        with track_db_time() as db_time:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                request_metrics.finish(method, route, status,
+                                       (time.perf_counter() - start) * 1000, db_time[0])
+
+
+class ProfilingMiddleware:
+    """
+    Profile single requests on demand (installed only when PROFILING_ENABLED)
+
+    A request is profiled when an admin (ADMIN_EMAILS) sends the X-Profile
+    header, or at random with probability PROFILE_SAMPLE_RATE. The folded
+    stacks are written to PROFILE_DIR and the file name is returned in the
+    X-Profile-Id response header.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    @staticmethod
+    def _requested_by_admin(headers: Headers) -> bool:
+        if headers.get(PROFILE_HEADER, "").lower() not in ("1", "true", "yes"):
+            return False
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and is_admin_email(email_from_token(token))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and not self._requested_by_admin(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{scope['method']} {scope['path']}"
+        async with profile_request(name) as profile:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", profile.filename.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+        logger.info(f"Profiled {name} in {profile.elapsed_ms:.0f}ms: {profile.path}")
+
+
+def instrument_engine(engine):
+    """Count time spent executing SQL towards the current request's DB time"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        add_db_time((time.perf_counter() - conn.info["query_start"].pop()) * 1000)
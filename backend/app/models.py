@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -59,3 +59,22 @@ class Transaction(Base):
 
     def __repr__(self):
         return f"<Transaction(id={self.id}, vendor='{self.vendor}', amount={self.amount})>"
+
+
+class Document(Base):
+    """Uploaded document indexed by content hash, used to deduplicate uploads"""
+    __tablename__ = "documents"
+    __table_args__ = (UniqueConstraint("user_id", "sha256", name="uq_documents_user_sha256"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    sha256 = Column(String(64), nullable=False)  # Hex digest of the uploaded bytes
+    phash = Column(String(64), nullable=True)  # Perceptual hash of the scanned image
+    file_path = Column(String(500), nullable=False)
+    transaction_id = Column(Integer, nullable=True, index=True)
+    raw_text = Column(Text, nullable=True)  # OCR extracted text
+    parsed_data = Column(Text, nullable=True)  # JSON result of AI parsing
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Document(id={self.id}, sha256='{self.sha256[:12]}', transaction_id={self.transaction_id})>"
@@ -0,0 +1,104 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from app.models import User
+from app.auth import get_admin_user
+from app.services import workers
+from app.services.memory_tracing import (
+    MEMORY_TOP_SITES,
+    MEMORY_TRACE_FRAMES,
+    memory_stats,
+    snapshot_tracker,
+    traced_memory
+)
+from app.services.profiler import PROFILE_DIR, PROFILING_ENABLED, list_profiles
+
+router = APIRouter()
+
+
+@router.get("/admin/profiles")
+async def get_profiles(admin: User = Depends(get_admin_user)):
+    """
+    List saved request profiles
+
+    Set PROFILING_ENABLED=true, then send a request with the header
+    "X-Profile: 1" as an admin (or set PROFILE_SAMPLE_RATE) to record one.
+    """
+    return {"enabled": PROFILING_ENABLED, "profiles": list_profiles()}
+
+
+@router.get("/admin/profiles/{name}")
+async def download_profile(name: str, admin: User = Depends(get_admin_user)):
+    """
+    Download a profile in the folded-stacks format
+
+    Open it in https://www.speedscope.app or render it with
+    flamegraph.pl for a flame graph.
+    """
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not name.endswith(".folded") or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(name))
+
+
+@router.get("/admin/memory")
+async def get_memory(admin: User = Depends(get_admin_user)):
+    """
+    Traced memory of this process, and memory per pipeline stage and document
+
+    Stage figures are the traced peak and net growth of each stage
+    (app.services.metrics.stage_timer) and of each OCR worker task;
+    delta_count counts measurements that overlapped one in another thread
+    or request, whose peak is only their net growth. Worker processes only
+    trace when started with MEMORY_TRACING=true; with
+    OCR_PROCESS_WORKERS=0 everything runs here and start is enough.
+    """
+    return {**traced_memory(), **memory_stats.snapshot()}
+
+
+@router.post("/admin/memory/start")
+async def start_memory_tracing(
+    frames: int = MEMORY_TRACE_FRAMES,
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Start tracemalloc in the API process and take a baseline snapshot
+
+    Args:
+        frames: Stack frames recorded per allocation
+    """
+    return await workers.run_in_thread(snapshot_tracker.start, max(frames, 1))
+
+
+@router.post("/admin/memory/snapshot")
+async def take_memory_snapshot(
+    limit: int = MEMORY_TOP_SITES,
+    key_type: str = "lineno",
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Snapshot traced allocations and diff them against the baseline and the previous snapshot
+
+    Args:
+        limit: Allocation sites to report
+        key_type: Group by "lineno", "filename" or "traceback"
+
+    Returns:
+        Top allocation sites, and the sites that grew most since tracing
+        started and since the last snapshot
+    """
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key_type must be lineno, filename or traceback")
+    try:
+        return await workers.run_in_thread(snapshot_tracker.snapshot, limit, key_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/admin/memory/stop")
+async def stop_memory_tracing(admin: User = Depends(get_admin_user)):
+    """Stop tracemalloc and drop the snapshots"""
+    snapshot_tracker.stop()
+    return {"tracing": False}
@@ -3,12 +3,13 @@ from sqlalchemy.orm import Session
 from typing import Optional
 
 from app.models import User, Transaction, get_db
-from app.services.ai_service import AIService
+from app.services.ai_service import get_ai_service
+from app.services.llm_clients import LLMOverloaded
 from app.services.accounting import AccountingService
 from app.auth import get_current_user
 
 router = APIRouter()
-ai_service = AIService()
+ai_service = get_ai_service()
 accounting_service = AccountingService()
 
 
@@ -49,13 +50,15 @@ async def get_ai_insights(
         ]
         
         # Generate insights using Claude AI
-        insights = ai_service.generate_financial_insights(tx_list, summary)
+        insights = await ai_service.generate_financial_insights(tx_list, summary)
         
         return {
             "success": True,
             **insights
         }
         
+    except LLMOverloaded:
+        raise  # 503 with Retry-After (see main.py)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating insights: {str(e)}")
 
@@ -89,7 +92,7 @@ async def detect_anomalies(
             for tx in transactions
         ]
         
-        anomalies = ai_service.detect_anomalies(tx_list)
+        anomalies = await ai_service.detect_anomalies(tx_list)
         
         return {
             "success": True,
@@ -97,6 +100,8 @@ async def detect_anomalies(
             "count": len(anomalies)
         }
         
+    except LLMOverloaded:
+        raise  # 503 with Retry-After (see main.py)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error detecting anomalies: {str(e)}")
 
@@ -132,7 +137,7 @@ async def find_tax_deductions(
             for tx in transactions
         ]
         
-        deductions = ai_service.find_tax_deductions(
+        deductions = await ai_service.find_tax_deductions(
             tx_list, 
             current_user.account_type or "individual"
         )
@@ -142,6 +147,8 @@ async def find_tax_deductions(
             **deductions
         }
         
+    except LLMOverloaded:
+        raise  # 503 with Retry-After (see main.py)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding deductions: {str(e)}")
 
@@ -182,12 +189,14 @@ async def forecast_spending(
             for tx in transactions
         ]
         
-        forecast = ai_service.forecast_spending(tx_list, months)
+        forecast = await ai_service.forecast_spending(tx_list, months)
         
         return {
             "success": True,
             **forecast
         }
         
+    except LLMOverloaded:
+        raise  # 503 with Retry-After (see main.py)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating forecast: {str(e)}")
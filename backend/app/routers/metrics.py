@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.models import User
+from app.auth import get_admin_user
+from app.services import workers
+from app.services.category_classifier import get_category_classifier
+from app.services.metrics import render_prometheus, stage_metrics
+from app.services.parse_cache import get_parse_cache
+from app.services.receipt_extractor import routing_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format, for scraping
+
+    Includes request counts, in-flight requests, latency and DB time per
+    route template and status code, pipeline stage latencies, worker pool
+    backlog, LLM requests in flight, queued and rejected per provider,
+    receipt parses and transaction categorizations per route, and process
+    CPU, resident memory and thread count. Left unauthenticated so
+    Prometheus can scrape it; the JSON views below are admin-only.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/stages")
+async def get_stage_metrics(admin: User = Depends(get_admin_user)):
+    """
+    Latency histograms for each stage of the document pipeline
+
+    Stages include scan.* (decode, detect, warp, triage, denoise, threshold),
+    ocr.* (Tesseract passes, PDF text layer and rendering, cache lookups),
+    parse.* (local extraction, cache lookups and LLM parsing), llm.*.queue
+    (waits for a provider slot), upload.* and db.commit; blocks that raised
+    are kept apart as <stage>.error. Timings from the OCR worker processes
+    are collected per upload in the API process.
+
+    Returns:
+        Per-stage count, sum, mean, max, estimated p50/p95/p99 (ms) and
+        cumulative bucket counts
+    """
+    return {"stages": stage_metrics.snapshot()}
+
+
+@router.get("/metrics/parsing")
+async def get_parsing_metrics(admin: User = Depends(get_admin_user)):
+    """
+    How receipt parses and transaction categorizations were served
+
+    Returns:
+        Parses per route (local extraction, parse cache, Claude, OpenAI or
+        the local fallback), the local and LLM shares, the local confidence
+        threshold, parse cache hit rates, and categorizations per route
+        (user or global vendor history, n-gram model, parser suggestion or
+        default) with the classifier's size
+    """
+    cache = get_parse_cache()
+    classifier = get_category_classifier()
+    return {
+        "routing": routing_stats.snapshot(),
+        "cache": await workers.run_in_thread(cache.stats) if cache is not None else None,
+        "categorization": classifier.stats() if classifier is not None else None
+    }
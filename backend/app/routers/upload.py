@@ -1,18 +1,27 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import json
 import os
-import shutil
+import tempfile
+import time
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from app.models import Transaction, User, get_db
-from app.services.ocr_service import OCRService
-from app.services.ai_service import AIService
+from app.models import Document, Transaction, User, get_db
+from app.services.ai_service import get_ai_service
+from app.services.category_classifier import get_category_classifier
+from app.services import workers
+from app.services.perceptual_hash import NearDuplicateIndex
+from app.services.memory_tracing import memory_stats
+from app.services.metrics import collect_trace, stage_metrics, stage_timer
 from app.auth import get_current_user
 
 router = APIRouter()
-ocr_service = OCRService()
-ai_service = AIService()
+ai_service = get_ai_service()
+near_duplicate_index = NearDuplicateIndex()
 
 # Ensure upload directory exists
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
@@ -21,145 +30,608 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 MAX_FILE_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10485760))  # 10MB default
 
+# Maximum number of files from one batch processed at the same time
+MAX_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", max(workers.OCR_PROCESS_WORKERS, 1)))
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
 
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@router.post("/upload")
-async def upload_document(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Upload and process a financial document (receipt, invoice, etc.)
-    
-    Args:
-        file: Uploaded file
-        db: Database session
-        
-    Returns:
-        Processed transaction data
-    """
-    # Validate file
+def _validate_upload(file: UploadFile):
+    """Raise an HTTPException if the file is missing, of the wrong type or too large"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
-    
+
     if not allowed_file(file.filename):
         raise HTTPException(
             status_code=400,
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
-    
+
     # Check file size
     file.file.seek(0, 2)  # Seek to end
     file_size = file.file.tell()
     file.file.seek(0)  # Reset to beginning
-    
+
     if file_size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024}MB"
         )
-    
-    try:
-        # Save file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
+
+
+def _hash_upload(file: UploadFile) -> str:
+    """
+    Hash an upload without storing it, so repeats can be answered before any work
+
+    Args:
+        file: Uploaded file
+
+    Returns:
+        SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.file.seek(0)
+    return digest.hexdigest()
+
+
+def _read_upload(file: UploadFile) -> bytes:
+    """Read an upload into memory (size is capped by _validate_upload)"""
+    file.file.seek(0)
+    return file.file.read()
+
+
+def _write_file(data: bytes, file_path: str):
+    """Write bytes to a file"""
+    with stage_timer("upload.persist"):
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Extract text using OCR
-        extracted_text = ocr_service.extract_text(file_path)
-        
-        if not extracted_text:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not extract text from document. Please ensure the image is clear."
-            )
-        
-        # Parse with AI
-        parsed_data = ai_service.parse_receipt(extracted_text)
-        
-        # Create transaction
-        transaction = Transaction(
-            user_id=current_user.id,
-            date=datetime.fromisoformat(parsed_data["date"]) if parsed_data.get("date") else datetime.now(),
-            amount=parsed_data.get("amount") or 0.0,
-            vendor=parsed_data.get("vendor"),
-            category=parsed_data.get("category"),
-            description=parsed_data.get("description"),
-            document_path=file_path,
-            raw_text=extracted_text
+            buffer.write(data)
+
+
+def _persist_upload(data: bytes, file_path: str) -> Tuple[str, asyncio.Future]:
+    """
+    Start writing an upload to a private staging file on the thread pool, off the processing path
+
+    The staging file only replaces the content-addressed file_path once the
+    upload's records are committed (see _publish_upload), so a failed upload
+    never removes a file an identical concurrent upload has committed.
+
+    Args:
+        data: Upload bytes
+        file_path: Content-addressed path the upload is stored at
+
+    Returns:
+        Tuple of (staging path, background write)
+    """
+    extension = os.path.splitext(file_path)[1]
+    fd, staging_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".part" + extension)
+    os.close(fd)
+    return staging_path, asyncio.ensure_future(workers.run_in_thread(_write_file, data, staging_path))
+
+
+def _publish_upload(staging_path: str, file_path: str):
+    """Move a committed upload's staging file to its content-addressed path"""
+    os.replace(staging_path, file_path)
+
+
+async def _discard_upload(persisted: asyncio.Future, staging_path: str):
+    """Remove an upload's staging file once its background write has finished"""
+    await asyncio.gather(persisted, return_exceptions=True)
+    _remove_file(staging_path)
+
+
+def _content_path(user_id: int, sha256: str, filename: str) -> str:
+    """Content-addressed storage path for a user's upload"""
+    user_dir = os.path.join(UPLOAD_DIR, str(user_id))
+    os.makedirs(user_dir, exist_ok=True)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(user_dir, f"{sha256}{extension}")
+
+
+def _remove_file(file_path: Optional[str]):
+    """Delete a file if it exists"""
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _find_document(db: Session, user_id: int, sha256: str) -> Optional[Tuple[Document, Transaction]]:
+    """
+    Look up a previously processed upload by content hash
+
+    Args:
+        db: Database session
+        user_id: Owner of the upload
+        sha256: Hex digest of the uploaded bytes
+
+    Returns:
+        Tuple of (document, transaction), or None if not seen before
+    """
+    return db.query(Document, Transaction).join(
+        Transaction, Transaction.id == Document.transaction_id
+    ).filter(
+        Document.user_id == user_id,
+        Document.sha256 == sha256
+    ).first()
+
+
+async def _analyze_document(db: Session, user_id: int, sha256: str, staging_path: str, data: bytes,
+                            persisted: asyncio.Future, force: bool = False) -> Dict:
+    """
+    Scan, OCR and parse an uploaded document
+
+    Images are decoded from the upload bytes in the worker, without waiting
+    for the copy being written to disk, and scanned, hashed and looked up
+    among the user's documents in the same worker call; a near-duplicate
+    match skips OCR and AI parsing. PDFs are rendered by poppler from the
+    stored file.
+
+    Args:
+        db: Database session
+        user_id: Owner of the upload
+        sha256: Hex digest of the upload
+        staging_path: Path the upload is being written to
+        data: Upload bytes
+        persisted: Background write of the upload to staging_path
+        force: Process the document even if it is a near-duplicate
+
+    Returns:
+        Dictionary with phash and either near_duplicate (document,
+        transaction, distance) or extracted_text, ocr_confidence,
+        preprocessing (scanner profile and timings) and parsed_data
+    """
+    phash = None
+    if staging_path.lower().endswith(".pdf"):
+        await persisted
+        # Extract text using OCR (CPU-bound, runs on the process pool)
+        ocr_result = await workers.run_in_process(workers.extract, staging_path)
+    else:
+        phash, matches, ocr_result = await workers.run_in_process(
+            workers.scan_and_extract, data, sha256, None if force else user_id
         )
-        
-        db.add(transaction)
-        db.commit()
-        db.refresh(transaction)
-        
-        return {
-            "success": True,
-            "message": "Document processed successfully",
-            "transaction": {
-                "id": transaction.id,
-                "date": transaction.date.isoformat() if transaction.date else None,
-                "amount": float(transaction.amount),
-                "vendor": transaction.vendor,
-                "category": transaction.category,
-                "description": transaction.description
-            },
-            "extracted_text": extracted_text[:500]  # First 500 chars for preview
+
+        if matches:
+            match = near_duplicate_index.resolve(db, matches)
+            if match:
+                return {"phash": phash, "near_duplicate": match}
+            # Every match's transaction was deleted since the index was synced
+            ocr_result = await workers.run_in_process(workers.extract_from_scan, data, None, sha256)
+
+    extracted_text = ocr_result.text
+    if not extracted_text:
+        raise HTTPException(
+            status_code=400,
+            detail="Could not extract text from document. Please ensure the image is clear."
+        )
+
+    classifier = get_category_classifier()
+    if classifier is not None:
+        # Pull other workers' categorisations (a query, and now and then a model save)
+        await workers.run_in_thread(classifier.sync)
+    # Parse with AI (async call through the shared, rate-limited LLM clients)
+    parsed_data = await ai_service.parse_receipt(
+        extracted_text, line_confidences=ocr_result.line_confidences, user_id=user_id
+    )
+    if parsed_data.get("source") in ("claude", "openai", "cache"):
+        # A vendor the user (or anyone) has categorised outranks the model's guess; no extra LLM call
+        parsed_data["category"] = ai_service.categorize_locally(
+            parsed_data.get("vendor") or "",
+            parsed_data.get("description") or "",
+            user_id=user_id,
+            suggested=parsed_data.get("category")
+        )
+    return {
+        "phash": phash,
+        "extracted_text": extracted_text,
+        "ocr_confidence": round(ocr_result.confidence, 1),
+        "preprocessing": ocr_result.preprocessing,
+        "parsed_data": parsed_data
+    }
+
+
+def _near_duplicate_records(user_id: int, sha256: str, analysis: Dict) -> Tuple[Transaction, Document]:
+    """Index a near-duplicate upload against the matched document's transaction"""
+    matched, transaction, _ = analysis["near_duplicate"]
+    document = Document(
+        user_id=user_id,
+        sha256=sha256,
+        phash=analysis["phash"],
+        file_path=matched.file_path,
+        transaction_id=transaction.id,
+        raw_text=matched.raw_text,
+        parsed_data=matched.parsed_data
+    )
+    return transaction, document
+
+
+def _build_records(user_id: int, sha256: str, file_path: str, analysis: Dict) -> Tuple[Transaction, Document]:
+    """Create an (unsaved) transaction and its document index entry"""
+    extracted_text = analysis["extracted_text"]
+    parsed_data = analysis["parsed_data"]
+    transaction = Transaction(
+        user_id=user_id,
+        date=datetime.fromisoformat(parsed_data["date"]) if parsed_data.get("date") else datetime.now(),
+        amount=parsed_data.get("amount") or 0.0,
+        vendor=parsed_data.get("vendor"),
+        category=parsed_data.get("category"),
+        description=parsed_data.get("description"),
+        document_path=file_path,
+        raw_text=extracted_text
+    )
+    document = Document(
+        user_id=user_id,
+        sha256=sha256,
+        phash=analysis["phash"],
+        file_path=file_path,
+        raw_text=extracted_text,
+        parsed_data=json.dumps(parsed_data, default=str)
+    )
+    return transaction, document
+
+
+def _upload_response(transaction: Transaction, extracted_text: str, duplicate: bool = False,
+                     near_duplicate: Optional[Tuple[Document, Transaction, int]] = None) -> Dict:
+    """Build the API response for a processed document"""
+    response = {
+        "success": True,
+        "message": "Document already uploaded" if duplicate else "Document processed successfully",
+        "duplicate": duplicate,
+        "transaction": {
+            "id": transaction.id,
+            "date": transaction.date.isoformat() if transaction.date else None,
+            "amount": float(transaction.amount),
+            "vendor": transaction.vendor,
+            "category": transaction.category,
+            "description": transaction.description
+        },
+        "extracted_text": (extracted_text or "")[:500]  # First 500 chars for preview
+    }
+    if near_duplicate:
+        matched, _, distance = near_duplicate
+        response["message"] = "Document looks like one already uploaded"
+        response["near_duplicate"] = {
+            "document_id": matched.id,
+            "transaction_id": matched.transaction_id,
+            "distance": distance
         }
-    
-    except HTTPException:
-        raise
+    return response
+
+
+@router.post("/upload")
+async def upload_document(
+    file: UploadFile = File(...),
+    force: bool = False,
+    include_timings: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload and process a financial document (receipt, invoice, etc.)
+
+    Uploads are hashed first. A file this user has already uploaded returns
+    the existing transaction without OCR or AI parsing, and is not stored a
+    second time. New images are processed from memory while they are written
+    to disk in the background. Images that look like a previous upload (e.g.
+    the same receipt photographed twice) are flagged with near_duplicate and
+    also skip OCR and AI parsing, unless force is set.
+
+    Every pipeline stage is timed into the histograms served by
+    /api/metrics/stages; include_timings adds this upload's stage timings
+    to the response.
+
+    Args:
+        file: Uploaded file
+        force: Process the document even if it is a near-duplicate
+        include_timings: Add per-stage timings (ms) to the response
+        db: Database session
+
+    Returns:
+        Processed transaction data
+    """
+    with collect_trace() as trace:
+        start = time.perf_counter()
+        try:
+            response = await _process_upload(file, force, current_user, db)
+        finally:
+            trace.add("upload.total", (time.perf_counter() - start) * 1000)
+            stage_metrics.record(trace.stages)
+            memory_stats.record(trace.memory)
+
+    if include_timings:
+        response["timings_ms"] = trace.as_dict()
+    return response
+
+
+async def _process_upload(file: UploadFile, force: bool, current_user: User, db: Session) -> Dict:
+    """Hash, deduplicate, analyse and store one upload (see upload_document)"""
+    _validate_upload(file)
+
+    with stage_timer("upload.hash", trace_memory=False):
+        sha256 = await workers.run_in_thread(_hash_upload, file)
+
+    existing = _find_document(db, current_user.id, sha256)
+    if existing:
+        document, transaction = existing
+        return _upload_response(transaction, document.raw_text, duplicate=True)
+
+    data = await workers.run_in_thread(_read_upload, file)
+    file_path = _content_path(current_user.id, sha256, file.filename)
+    staging_path, persisted = _persist_upload(data, file_path)
+
+    try:
+        analysis = await _analyze_document(db, current_user.id, sha256, staging_path, data, persisted, force)
+        await persisted  # The file must be written before its records are committed
+
+        if "near_duplicate" in analysis:
+            transaction, document = _near_duplicate_records(current_user.id, sha256, analysis)
+            db.add(document)
+            with stage_timer("db.commit"):
+                db.commit()
+            _remove_file(staging_path)
+            return _upload_response(
+                transaction, document.raw_text, duplicate=True, near_duplicate=analysis["near_duplicate"]
+            )
+
+        transaction, document = _build_records(current_user.id, sha256, file_path, analysis)
+        with stage_timer("db.commit"):
+            db.add(transaction)
+            db.flush()
+            document.transaction_id = transaction.id
+            db.add(document)
+            db.commit()
+            db.refresh(transaction)
+        _publish_upload(staging_path, file_path)
+    except IntegrityError:
+        # The same file was processed concurrently by another request, which stored it
+        db.rollback()
+        _remove_file(staging_path)
+        existing = _find_document(db, current_user.id, sha256)
+        if not existing:
+            raise HTTPException(status_code=500, detail="Error processing document: duplicate upload")
+        document, transaction = existing
+        return _upload_response(transaction, document.raw_text, duplicate=True)
     except Exception as e:
-        # Clean up file if processing failed
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        db.rollback()
+        await _discard_upload(persisted, staging_path)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+    response = _upload_response(transaction, analysis["extracted_text"])
+    response["ocr_confidence"] = analysis["ocr_confidence"]
+    response["preprocessing"] = analysis["preprocessing"]
+    return response
+
+
+def _add_batch_records(db: Session, pending: List[Dict]):
+    """
+    Add a batch's records to the session and build each file's response (see upload_batch)
+
+    Args:
+        db: Database session
+        pending: Processed batch results still to be saved
+    """
+    db.add_all([r["records"][0] for r in pending if "near_duplicate" not in r])
+    db.flush()
+    for result in pending:
+        transaction, document = result["records"]
+        near_duplicate = result.get("near_duplicate")
+        document.transaction_id = transaction.id
+        db.add(document)
+        data = _upload_response(
+            transaction, document.raw_text, duplicate=bool(near_duplicate), near_duplicate=near_duplicate
+        )
+        if not near_duplicate:
+            data["ocr_confidence"] = result["ocr_confidence"]
+            data["preprocessing"] = result["preprocessing"]
+        if "timings_ms" in result:
+            data["timings_ms"] = result["timings_ms"]
+        result["data"] = data
+
+
+def _resolve_batch_conflicts(db: Session, user_id: int, pending: List[Dict]) -> List[Dict]:
+    """
+    Report batch files another request stored first as duplicates, after a failed commit
+
+    The batch's rolled-back records are reset so the rest can be saved again.
+
+    Args:
+        db: Database session, rolled back
+        user_id: Owner of the uploads
+        pending: Batch results whose commit failed
+
+    Returns:
+        Results still to be saved
+
+    Raises:
+        HTTPException: If no file conflicts with a stored upload
+    """
+    remaining = []
+    for result in pending:
+        existing = _find_document(db, user_id, result["sha256"])
+        if existing:
+            document, transaction = existing
+            _remove_file(result["staging_path"])
+            data = _upload_response(transaction, document.raw_text, duplicate=True)
+            if "timings_ms" in result:
+                data["timings_ms"] = result["timings_ms"]
+            result["data"] = data
+            continue
+        transaction, document = result["records"]
+        if "near_duplicate" not in result:
+            transaction.id = None
+        document.id = None
+        remaining.append(result)
+    if len(remaining) == len(pending):
+        raise HTTPException(status_code=500, detail="Error saving batch: duplicate upload")
+    return remaining
+
 
 @router.post("/upload/batch")
 async def upload_batch(
     files: List[UploadFile] = File(...),
+    concurrency: Optional[int] = None,
+    force: bool = False,
+    include_timings: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Upload and process multiple documents at once
-    
+
+    Files are processed in parallel on the worker pools, at most
+    `concurrency` at a time (capped by UPLOAD_BATCH_CONCURRENCY), and all
+    resulting transactions are saved in a single commit. Files already
+    uploaded, or repeated within the batch, are processed only once; files
+    an identical concurrent upload stores first are reported as duplicates.
+
     Args:
         files: List of uploaded files
+        concurrency: Optional limit on files processed at the same time
+        force: Process documents even if they are near-duplicates
+        include_timings: Add per-stage timings (ms) to each file's result
         db: Database session
-        
+
     Returns:
-        Results for each file
+        Results for each file, in input order, with per-file timing
     """
-    results = []
-    
-    for file in files:
+    limit = min(concurrency or MAX_BATCH_CONCURRENCY, MAX_BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(limit, 1))
+    batch_start = time.perf_counter()
+
+    results: List[Dict] = [{"filename": file.filename} for file in files]
+    first_by_hash: Dict[str, int] = {}
+    to_process: List[int] = []
+
+    # Hash every file first so repeats are resolved before any OCR runs
+    for index, file in enumerate(files):
+        result = results[index]
+        start = time.perf_counter()
         try:
-            result = await upload_document(file, current_user, db)
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "data": result
-            })
+            _validate_upload(file)
+            sha256 = await workers.run_in_thread(_hash_upload, file)
+        except HTTPException as e:
+            result.update({"success": False, "error": e.detail})
+            continue
         except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": str(e)
+            result.update({"success": False, "error": str(e)})
+            continue
+        finally:
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        result["sha256"] = sha256
+        if sha256 in first_by_hash:
+            result["duplicate_of"] = first_by_hash[sha256]
+            continue
+
+        first_by_hash[sha256] = index
+        existing = _find_document(db, current_user.id, sha256)
+        if existing:
+            document, transaction = existing
+            result.update({
+                "success": True,
+                "data": _upload_response(transaction, document.raw_text, duplicate=True)
             })
-    
+            continue
+
+        result["file_path"] = _content_path(current_user.id, sha256, file.filename)
+        to_process.append(index)
+
+    async def process(index: int):
+        result = results[index]
+        async with semaphore:
+            start = time.perf_counter()
+            # Read inside the semaphore so at most `limit` uploads are held in memory
+            persisted = None
+            with collect_trace() as trace:
+                try:
+                    data = await workers.run_in_thread(_read_upload, files[index])
+                    result["staging_path"], persisted = _persist_upload(data, result["file_path"])
+                    analysis = await _analyze_document(
+                        db, current_user.id, result["sha256"], result["staging_path"], data, persisted, force
+                    )
+                    await persisted
+                    if "near_duplicate" in analysis:
+                        result["near_duplicate"] = analysis["near_duplicate"]
+                        result["records"] = _near_duplicate_records(current_user.id, result["sha256"], analysis)
+                    else:
+                        result["records"] = _build_records(
+                            current_user.id, result["sha256"], result["file_path"], analysis
+                        )
+                        result["ocr_confidence"] = analysis["ocr_confidence"]
+                        result["preprocessing"] = analysis["preprocessing"]
+                    result["success"] = True
+                except Exception as e:
+                    if persisted is not None:
+                        await _discard_upload(persisted, result["staging_path"])
+                    result.update({
+                        "success": False,
+                        "error": e.detail if isinstance(e, HTTPException) else str(e)
+                    })
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            trace.add("upload.total", elapsed_ms)
+            stage_metrics.record(trace.stages)
+            memory_stats.record(trace.memory)
+            if include_timings:
+                result["timings_ms"] = trace.as_dict()
+            result["elapsed_ms"] += round(elapsed_ms, 1)
+
+    await asyncio.gather(*(process(index) for index in to_process))
+
+    # Save all new transactions together
+    pending = [results[index] for index in to_process if results[index]["success"]]
+    commit_start = time.perf_counter()
+    try:
+        while pending:
+            try:
+                _add_batch_records(db, pending)
+                db.commit()
+                break
+            except IntegrityError:
+                # Some of these files were stored concurrently by another request
+                db.rollback()
+                pending = _resolve_batch_conflicts(db, current_user.id, pending)
+        stage_metrics.observe("db.batch_commit", (time.perf_counter() - commit_start) * 1000)
+    except Exception as e:
+        db.rollback()
+        for result in pending:
+            _remove_file(result["staging_path"])
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=f"Error saving batch: {str(e)}")
+
+    for result in pending:
+        if result["data"].get("near_duplicate"):
+            # Near-duplicates are indexed against the original file
+            _remove_file(result["staging_path"])
+        else:
+            _publish_upload(result["staging_path"], result["file_path"])
+
+    # Repeats within the batch share the first copy's outcome
+    for result in results:
+        if "duplicate_of" in result:
+            original = results[result.pop("duplicate_of")]
+            if original["success"]:
+                data = {**original["data"], "duplicate": True, "message": "Document already uploaded"}
+                result.update({"success": True, "data": data})
+            else:
+                result.update({"success": False, "error": original["error"]})
+        for key in ("sha256", "file_path", "staging_path", "records", "near_duplicate",
+                    "ocr_confidence", "preprocessing"):
+            result.pop(key, None)
+        if result["success"]:
+            result.pop("timings_ms", None)  # Moved into the file's data
+
+    successful = sum(1 for r in results if r["success"])
     return {
         "total": len(files),
-        "successful": sum(1 for r in results if r["success"]),
-        "failed": sum(1 for r in results if not r["success"]),
+        "successful": successful,
+        "failed": len(files) - successful,
+        "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 1),
         "results": results
     }
@@ -1,63 +1,128 @@
-from openai import OpenAI
-import anthropic
-import os
 import json
-from typing import Dict, Optional, List
+import threading
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import logging
 
+from app.services.category_classifier import (
+    CATEGORIES, CATEGORY_CONFIDENCE_THRESHOLD, Prediction, get_category_classifier
+)
+from app.services import workers
+from app.services.llm_clients import LLMClients, LLMOverloaded, get_llm_clients
+from app.services.metrics import stage_timer
+from app.services.parse_cache import ParseCache, get_parse_cache
+from app.services.receipt_extractor import LOCAL_PARSE_THRESHOLD, Extraction, ReceiptExtractor, routing_stats
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+CLAUDE_MODEL = "claude-3-5-sonnet-20241022"
+OPENAI_PARSE_MODEL = "gpt-4"
+# Bump when a parsing prompt or its post-processing changes, so cached parses are not reused
+PARSE_PROMPT_VERSION = "1"
 
-class AIService:
-    """Service for AI-powered document analysis using OpenAI and Claude AI"""
-
-    def __init__(self):
-        # OpenAI for quick categorization
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            logger.warning("OPENAI_API_KEY not set. Some AI features will be disabled.")
-            self.openai_client = None
-        else:
-            self.openai_client = OpenAI(api_key=openai_key)
-        
-        # Claude for advanced analysis
-        claude_key = os.getenv("ANTHROPIC_API_KEY")
-        if not claude_key:
-            logger.warning("ANTHROPIC_API_KEY not set. Advanced AI features will be disabled.")
-            self.claude_client = None
-        else:
-            self.claude_client = anthropic.Anthropic(api_key=claude_key)
 
-    def parse_receipt(self, text: str) -> Dict:
+class AIService:
+    """
+    Service for AI-powered document analysis using OpenAI and Claude AI
+
+    Model calls are async and go through the shared LLMClients, which pool
+    connections and cap concurrent requests per provider. Use the shared
+    instance from get_ai_service().
+    """
+
+    def __init__(self, llm: Optional[LLMClients] = None):
+        # Claude for advanced analysis, OpenAI as the parsing fallback
+        self.llm = llm or get_llm_clients()
+        self.parse_cache = get_parse_cache()
+        self.extractor = ReceiptExtractor()
+        self.classifier = get_category_classifier()
+
+    async def parse_receipt(self, text: str, line_confidences: Optional[List[Optional[float]]] = None,
+                            user_id: Optional[int] = None) -> Dict:
         """
-        Parse receipt/invoice text and extract structured data using Claude AI
-        
+        Parse receipt/invoice text and extract structured data
+
+        The local ReceiptExtractor runs first; when its amount, date and
+        vendor all clear LOCAL_PARSE_THRESHOLD (after capping each at the OCR
+        confidence of its line) its result is used and no model is called.
+        Otherwise Claude parses the text (then OpenAI), with results cached
+        by normalised text, model and prompt version (see ParseCache). The
+        local result is also the fallback when no model is available; local
+        results are categorised by the CategoryClassifier. Every parse is
+        counted in routing_stats.
+
         Args:
             text: Raw text extracted from document
-            
+            line_confidences: OCRResult.line_confidences of the text, if it was OCR'd
+            user_id: Owner, whose vendor history categorises local results
+
         Returns:
-            Dictionary with extracted fields
+            Dictionary with extracted fields and "source" (the route that served it)
         """
+        with stage_timer("parse.local"):
+            extraction = self.extractor.extract(text, line_confidences=line_confidences)
+        confidence = extraction.confidence
+        if confidence >= LOCAL_PARSE_THRESHOLD:
+            return self._routed(self._local_result(extraction, user_id), "local", confidence)
+
         # Use Claude for better document understanding
-        if self.claude_client:
+        if self.llm.anthropic_enabled:
             try:
-                return self._parse_with_claude(text)
+                result, cached = await self._cached_parse(text, CLAUDE_MODEL, "parse.claude", self._parse_with_claude)
+                return self._routed(result, "cache" if cached else "claude", confidence)
+            except LLMOverloaded as e:
+                logger.warning(f"Skipping Claude parsing: {e}")
             except Exception as e:
                 logger.error(f"Claude parsing failed: {e}")
         
         # Fallback to OpenAI
-        if self.openai_client:
+        if self.llm.openai_enabled:
             try:
-                return self._parse_with_openai(text)
+                result, cached = await self._cached_parse(
+                    text, OPENAI_PARSE_MODEL, "parse.openai", self._parse_with_openai
+                )
+                return self._routed(result, "cache" if cached else "openai", confidence)
+            except LLMOverloaded as e:
+                logger.warning(f"Skipping OpenAI parsing: {e}")
             except Exception as e:
                 logger.error(f"OpenAI parsing failed: {e}")
         
-        return self._fallback_parse(text)
+        return self._routed(self._local_result(extraction, user_id), "fallback", confidence)
+
+    def _local_result(self, extraction: Extraction, user_id: Optional[int]) -> Dict:
+        """The local extraction in parse form, categorised by the classifier"""
+        result = extraction.to_parsed()
+        result["category"] = self.categorize_locally(
+            extraction.fields["vendor"].value or "", result["description"], user_id=user_id
+        )
+        return result
+
+    @staticmethod
+    def _routed(result: Dict, route: str, confidence: float) -> Dict:
+        routing_stats.record(route, confidence)
+        result["source"] = route
+        return result
     
-    def _parse_with_claude(self, text: str) -> Dict:
+    async def _cached_parse(self, text: str, model: str, stage: str, parse) -> Tuple[Dict, bool]:
+        """Return the parse of this text by this model and whether it came from the cache"""
+        if self.parse_cache is None:
+            with stage_timer(stage, trace_memory=False):
+                return await parse(text), False
+
+        # SQLite I/O (and waits on other workers' write locks) stays off the event loop
+        key = ParseCache.make_key(text, model, PARSE_PROMPT_VERSION)
+        with stage_timer("parse.cache_lookup", trace_memory=False):
+            result = await workers.run_in_thread(self.parse_cache.get, key)
+        if result is not None:
+            return result, True
+        with stage_timer(stage, trace_memory=False):
+            result = await parse(text)
+        await workers.run_in_thread(self.parse_cache.put, key, result)
+        return result, False
+
+    async def _parse_with_claude(self, text: str) -> Dict:
         """Parse receipt using Claude AI for superior accuracy"""
         prompt = f"""Analyze this receipt/invoice and extract structured data.
 
@@ -76,8 +141,8 @@ Extract the following in JSON format:
 
 Respond with ONLY valid JSON."""
 
-        message = self.claude_client.messages.create(
-            model="claude-3-5-sonnet-20241022",
+        message = await self.llm.claude(
+            model=CLAUDE_MODEL,
             max_tokens=1024,
             messages=[
                 {"role": "user", "content": prompt}
@@ -98,7 +163,7 @@ Respond with ONLY valid JSON."""
             "payment_method": data.get("payment_method")
         }
     
-    def _parse_with_openai(self, text: str) -> Dict:
+    async def _parse_with_openai(self, text: str) -> Dict:
         """Parse receipt using OpenAI as fallback"""
         prompt = f"""Analyze this receipt/invoice text and extract the following information in JSON format:
 - date (ISO format YYYY-MM-DD, or null if not found)
@@ -112,8 +177,8 @@ Receipt text:
 
 Respond ONLY with valid JSON, no other text."""
 
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4",
+        response = await self.llm.openai_chat(
+            model=OPENAI_PARSE_MODEL,
             messages=[
                 {"role": "system", "content": "You are a financial document analyzer. Extract structured data from receipts and invoices. Always respond with valid JSON only."},
                 {"role": "user", "content": prompt}
@@ -133,76 +198,42 @@ Respond ONLY with valid JSON, no other text."""
             "description": data.get("description", "")
         }
 
-    def _fallback_parse(self, text: str) -> Dict:
-        """
-        Fallback parsing when AI is not available
-        Uses simple heuristics to extract basic information
+    def categorize_locally(self, vendor: str, description: str, user_id: Optional[int] = None,
+                           suggested: Optional[str] = None) -> str:
         """
-        import re
-        
-        # Try to find amount (look for currency patterns)
-        amount_pattern = r'\$?\s*(\d+\.\d{2})'
-        amounts = re.findall(amount_pattern, text)
-        amount = float(amounts[-1]) if amounts else None
-        
-        # Try to find date
-        date_pattern = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
-        dates = re.findall(date_pattern, text)
-        date_str = dates[0] if dates else None
-        
-        # Extract first line as potential vendor
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        vendor = lines[0] if lines else "Unknown"
-        
-        return {
-            "date": date_str,
-            "amount": amount,
-            "vendor": vendor[:100],  # Limit length
-            "category": "other",
-            "description": text[:200]  # First 200 chars
-        }
+        Categorize a transaction with the CategoryClassifier alone (no model call)
+
+        A prediction above CATEGORY_CONFIDENCE_THRESHOLD is used, but only a
+        vendor seen before overrides a suggested category. Otherwise the
+        suggestion is kept ("other" included), or "other" without one.
 
-    def categorize_transaction(self, vendor: str, description: str) -> str:
-        """
-        Categorize a transaction based on vendor and description
-        
         Args:
             vendor: Vendor name
             description: Transaction description
-            
+            user_id: Owner, whose own vendor history is checked first
+            suggested: Category from the parser, if any
+
         Returns:
             Category string
         """
-        if not self.openai_client:
-            return "other"
-
-        try:
-            prompt = f"""Categorize this transaction into ONE of these categories:
-meals, travel, office_supplies, utilities, entertainment, healthcare, other
-
-Vendor: {vendor}
-Description: {description}
-
-Respond with ONLY the category name, nothing else."""
-
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a transaction categorizer. Respond with only the category name."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=20
-            )
+        prediction = Prediction(None, 0.0, "none")
+        if self.classifier is not None:
+            with stage_timer("categorize.local"):
+                prediction = self.classifier.predict(user_id, vendor, description)
+
+        confident = prediction.confidence >= CATEGORY_CONFIDENCE_THRESHOLD
+        if confident and (suggested is None or prediction.source != "model"):
+            category, route = prediction.category, prediction.source
+        elif suggested in CATEGORIES + ["other"]:
+            category, route = suggested, "parse"
+        else:
+            category, route = "other", "default"
 
-            category = response.choices[0].message.content.strip().lower()
-            return category if category in ["meals", "travel", "office_supplies", "utilities", "entertainment", "healthcare"] else "other"
+        if self.classifier is not None:
+            self.classifier.record(route)
+        return category
 
-        except Exception as e:
-            logger.error(f"Error categorizing: {e}")
-            return "other"
-    
-    def detect_anomalies(self, transactions: List[Dict]) -> List[Dict]:
+    async def detect_anomalies(self, transactions: List[Dict]) -> List[Dict]:
         """
         Detect unusual spending patterns and potential fraud using Claude AI
         
@@ -211,8 +242,11 @@ Respond with ONLY the category name, nothing else."""
             
         Returns:
             List of anomalies with explanations
+
+        Raises:
+            LLMOverloaded: Too many Claude requests are queued
         """
-        if not self.claude_client or not transactions:
+        if not self.llm.anthropic_enabled or not transactions:
             return []
         
         try:
@@ -252,8 +286,8 @@ Respond with JSON array of anomalies:
 
 If no anomalies found, return empty array []."""
 
-            message = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+            message = await self.llm.claude(
+                model=CLAUDE_MODEL,
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -262,11 +296,13 @@ If no anomalies found, return empty array []."""
             anomalies = json.loads(result)
             return anomalies if isinstance(anomalies, list) else []
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error detecting anomalies: {e}")
             return []
     
-    def generate_financial_insights(self, transactions: List[Dict], summary: Dict) -> Dict:
+    async def generate_financial_insights(self, transactions: List[Dict], summary: Dict) -> Dict:
         """
         Generate intelligent financial insights and recommendations using Claude AI
         
@@ -276,8 +312,11 @@ If no anomalies found, return empty array []."""
             
         Returns:
             Dictionary with insights and recommendations
+
+        Raises:
+            LLMOverloaded: Too many Claude requests are queued
         """
-        if not self.claude_client:
+        if not self.llm.anthropic_enabled:
             return {"insights": [], "recommendations": []}
         
         try:
@@ -323,8 +362,8 @@ Respond in JSON format:
   "warnings": ["warning 1", "warning 2"]
 }}"""
 
-            message = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+            message = await self.llm.claude(
+                model=CLAUDE_MODEL,
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -332,11 +371,13 @@ Respond in JSON format:
             result = message.content[0].text.strip()
             return json.loads(result)
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error generating insights: {e}")
             return {"insights": [], "recommendations": []}
     
-    def find_tax_deductions(self, transactions: List[Dict], account_type: str = "individual") -> Dict:
+    async def find_tax_deductions(self, transactions: List[Dict], account_type: str = "individual") -> Dict:
         """
         Identify potential tax deductions using Claude AI
         
@@ -346,8 +387,11 @@ Respond in JSON format:
             
         Returns:
             Dictionary with potential deductions
+
+        Raises:
+            LLMOverloaded: Too many Claude requests are queued
         """
-        if not self.claude_client or not transactions:
+        if not self.llm.anthropic_enabled or not transactions:
             return {"deductions": [], "total_potential": 0}
         
         try:
@@ -394,8 +438,8 @@ Respond in JSON:
   "disclaimer": "consult tax professional message"
 }}"""
 
-            message = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+            message = await self.llm.claude(
+                model=CLAUDE_MODEL,
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -403,11 +447,13 @@ Respond in JSON:
             result = message.content[0].text.strip()
             return json.loads(result)
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error finding tax deductions: {e}")
             return {"deductions": [], "total_potential": 0}
     
-    def forecast_spending(self, transactions: List[Dict], months_ahead: int = 3) -> Dict:
+    async def forecast_spending(self, transactions: List[Dict], months_ahead: int = 3) -> Dict:
         """
         Forecast future spending using Claude AI
         
@@ -417,8 +463,11 @@ Respond in JSON:
             
         Returns:
             Forecast data with predictions
+
+        Raises:
+            LLMOverloaded: Too many Claude requests are queued
         """
-        if not self.claude_client or not transactions:
+        if not self.llm.anthropic_enabled or not transactions:
             return {"forecast": [], "confidence": "low"}
         
         try:
@@ -459,8 +508,8 @@ Respond in JSON:
   "overall_confidence": "high|medium|low"
 }}"""
 
-            message = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+            message = await self.llm.claude(
+                model=CLAUDE_MODEL,
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}]
             )
@@ -468,6 +517,21 @@ Respond in JSON:
             result = message.content[0].text.strip()
             return json.loads(result)
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error forecasting: {e}")
             return {"forecast": [], "confidence": "low"}
+
+
+_ai_service: Optional[AIService] = None
+_ai_service_lock = threading.Lock()
+
+
+def get_ai_service() -> AIService:
+    """Return the process-wide AIService shared by all routes"""
+    global _ai_service
+    with _ai_service_lock:
+        if _ai_service is None:
+            _ai_service = AIService()
+        return _ai_service
@@ -0,0 +1,372 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.models import SessionLocal, Transaction
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_CLASSIFIER_ENABLED = os.getenv("CATEGORY_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+CATEGORY_MODEL_PATH = os.getenv("CATEGORY_MODEL_PATH", "./category_model.json")
+# Predictions at least this confident skip the LLM
+CATEGORY_CONFIDENCE_THRESHOLD = float(os.getenv("CATEGORY_CONFIDENCE_THRESHOLD", 0.8))
+# How often transactions changed by other workers are pulled in, and the model saved
+CATEGORY_SYNC_SECONDS = float(os.getenv("CATEGORY_SYNC_SECONDS", 5))
+CATEGORY_SAVE_SECONDS = float(os.getenv("CATEGORY_SAVE_SECONDS", 60))
+
+# Categories the classifier learns; "other" is what is left when it abstains
+CATEGORIES = ["meals", "travel", "office_supplies", "utilities", "entertainment", "healthcare"]
+
+MODEL_VERSION = 1
+NGRAM_SIZES = (3, 4)
+MAX_DESCRIPTION_WORDS = 30
+# Shrinks exact-map confidence for vendors seen only a few times: a user's own
+# single transaction is trusted (1 / 1.2), a single one from anyone is not (1 / 2)
+USER_SMOOTHING = 0.2
+GLOBAL_SMOOTHING = 1.0
+# Naive Bayes smoothing, the examples it needs before predicting, and how
+# strongly per-feature evidence is trusted (lower is more cautious)
+NB_ALPHA = 0.1
+NB_MIN_EXAMPLES = 20
+NB_EVIDENCE_WEIGHT = 4.0
+# Rows re-read on each sync, for commits that landed with an older timestamp
+SYNC_OVERLAP = timedelta(seconds=2)
+
+
+def normalize_vendor(vendor: Optional[str]) -> str:
+    """Lower-case a vendor and drop store numbers and punctuation ("SHELL #114" -> "shell")"""
+    text = re.sub(r"[#*]?\d+", " ", (vendor or "").lower())
+    text = re.sub(r"[^a-z&' ]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def features(vendor_key: str, description: Optional[str]) -> List[str]:
+    """Character n-grams of the vendor plus description words"""
+    padded = f" {vendor_key} "
+    grams = [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    words = re.findall(r"[a-z]{3,}", (description or "").lower())[:MAX_DESCRIPTION_WORDS]
+    return grams + ["w:" + word for word in words]
+
+
+def _bump(counts: Dict[str, int], key: str, delta: int):
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+@dataclass
+class Prediction:
+    """A category guess: source is "user" or "global" (vendor seen before), "model" or "none\""""
+    category: Optional[str]
+    confidence: float
+    source: str
+
+
+class CategoryClassifier:
+    """
+    Vendor -> category classifier learned from users' transactions
+
+    Three tiers, most specific first: the user's own vendor -> category
+    counts, everyone's vendor -> category counts, and a multinomial naive
+    Bayes model over vendor character n-grams and description words (for
+    vendors nobody has categorised yet). Predictions are in-memory lookups
+    (microseconds).
+
+    Transactions are the training data. sync() pulls rows changed since the
+    last sync (new uploads, edits, including those made by other workers)
+    and observe() applies one change straight away, unlearning a row's old
+    category before learning its new one. The counts and per-transaction
+    labels are saved to CATEGORY_MODEL_PATH, so a restart only reads rows
+    changed since the last save.
+    """
+
+    def __init__(self, path: str = CATEGORY_MODEL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.user_vendors: Dict[int, Dict[str, Dict[str, int]]] = {}
+        self.vendors: Dict[str, Dict[str, int]] = {}
+        self.class_counts: Dict[str, int] = {}
+        self.feature_counts: Dict[str, Dict[str, int]] = {}
+        self.feature_totals: Dict[str, int] = {}
+        self.vocabulary: Dict[str, int] = {}
+        # Transaction id -> [user_id, vendor key, description, category] as learned
+        self.labels: Dict[int, list] = {}
+        self.watermark: Optional[datetime] = None
+        self.routes: Dict[str, int] = {}
+        self._last_sync = 0.0
+        self._sync_lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._dirty = False
+
+    def predict(self, user_id: Optional[int], vendor: str, description: Optional[str] = "") -> Prediction:
+        """
+        Guess a transaction's category
+
+        Args:
+            user_id: Owner, whose own history is checked first (None for global only)
+            vendor: Vendor name
+            description: Transaction description
+
+        Returns:
+            The most specific confident guess, else the most confident one
+        """
+        vendor_key = normalize_vendor(vendor)
+        best = Prediction(None, 0.0, "none")
+        with self._lock:
+            if vendor_key:
+                tiers = [
+                    ("user", self.user_vendors.get(user_id, {}).get(vendor_key), USER_SMOOTHING),
+                    ("global", self.vendors.get(vendor_key), GLOBAL_SMOOTHING)
+                ]
+                for source, counts, smoothing in tiers:
+                    if not counts:
+                        continue
+                    category = max(counts, key=counts.get)
+                    prediction = Prediction(category, counts[category] / (sum(counts.values()) + smoothing), source)
+                    if prediction.confidence >= CATEGORY_CONFIDENCE_THRESHOLD:
+                        return prediction
+                    if prediction.confidence > best.confidence:
+                        best = prediction
+
+            prediction = self._naive_bayes(features(vendor_key, description))
+        if prediction is not None and prediction.confidence > best.confidence:
+            return prediction
+        return best
+
+    def _naive_bayes(self, feature_list: List[str]) -> Optional[Prediction]:
+        """Posterior of the best class, with the evidence averaged per feature (lock held)"""
+        examples = sum(self.class_counts.values())
+        if examples < NB_MIN_EXAMPLES or not feature_list:
+            return None
+        vocabulary = len(self.vocabulary)
+        scores = {}
+        for category, count in self.class_counts.items():
+            counts = self.feature_counts[category]
+            denominator = math.log(self.feature_totals[category] + NB_ALPHA * vocabulary)
+            likelihood = sum(math.log(counts.get(f, 0) + NB_ALPHA) for f in feature_list)
+            likelihood -= len(feature_list) * denominator
+            # Averaging stops long vendors from producing near-certain posteriors
+            scores[category] = math.log(count / examples) + NB_EVIDENCE_WEIGHT * likelihood / len(feature_list)
+        top = max(scores.values())
+        weights = {category: math.exp(score - top) for category, score in scores.items()}
+        category = max(weights, key=weights.get)
+        return Prediction(category, weights[category] / sum(weights.values()), "model")
+
+    def observe(self, transaction_id: int, user_id: int, vendor: Optional[str], description: Optional[str],
+                category: Optional[str]):
+        """
+        Learn a transaction's current category (replacing what it taught before)
+
+        Args:
+            transaction_id: Transaction id
+            user_id: Owner
+            vendor: Vendor name
+            description: Description
+            category: Category; anything outside CATEGORIES (e.g. "other") is not learned
+        """
+        vendor_key = normalize_vendor(vendor)
+        label = [user_id, vendor_key, (description or "")[:500], category]
+        with self._lock:
+            previous = self.labels.get(transaction_id)
+            if previous == label:
+                return
+            if previous is not None:
+                self._learn(*previous, sign=-1)
+                del self.labels[transaction_id]
+            if vendor_key and category in CATEGORIES:
+                self._learn(*label, sign=1)
+                self.labels[transaction_id] = label
+            self._dirty = True
+
+    def forget(self, transaction_id: int):
+        """Unlearn a deleted transaction"""
+        with self._lock:
+            previous = self.labels.pop(transaction_id, None)
+            if previous is not None:
+                self._learn(*previous, sign=-1)
+                self._dirty = True
+
+    def _learn(self, user_id: int, vendor_key: str, description: str, category: str, sign: int):
+        """Add (sign=1) or remove (sign=-1) one example (lock held)"""
+        _bump(self.user_vendors.setdefault(user_id, {}).setdefault(vendor_key, {}), category, sign)
+        _bump(self.vendors.setdefault(vendor_key, {}), category, sign)
+        for counts, key in ((self.user_vendors[user_id], vendor_key), (self.vendors, vendor_key)):
+            if not counts[key]:
+                del counts[key]
+        if not self.user_vendors[user_id]:
+            del self.user_vendors[user_id]
+
+        _bump(self.class_counts, category, sign)
+        feature_counts = self.feature_counts.setdefault(category, {})
+        feature_list = features(vendor_key, description)
+        for feature in feature_list:
+            _bump(feature_counts, feature, sign)
+            _bump(self.vocabulary, feature, sign)
+        _bump(self.feature_totals, category, sign * len(feature_list))
+        if category not in self.class_counts:
+            self.feature_counts.pop(category, None)
+            self.feature_totals.pop(category, None)
+
+    def sync(self, force: bool = False) -> int:
+        """
+        Learn transactions added or changed since the last sync
+
+        Runs at most every CATEGORY_SYNC_SECONDS unless forced, and saves the
+        model when it changed and CATEGORY_SAVE_SECONDS have passed. Blocking
+        (database query, file write): call it from a worker thread. It reads
+        through its own session, so no request's session crosses threads,
+        and unless forced it returns at once while another thread is syncing.
+
+        Args:
+            force: Sync even if the last one was recent
+
+        Returns:
+            Number of rows read
+        """
+        now = time.monotonic()
+        if not force and now - self._last_sync < CATEGORY_SYNC_SECONDS:
+            return 0
+        if not self._sync_lock.acquire(blocking=force):
+            return 0
+        db = SessionLocal()
+        try:
+            self._last_sync = now
+            query = db.query(
+                Transaction.id, Transaction.user_id, Transaction.vendor, Transaction.description,
+                Transaction.category, Transaction.updated_at
+            )
+            if self.watermark is not None:
+                query = query.filter(Transaction.updated_at >= self.watermark - SYNC_OVERLAP)
+            rows = query.order_by(Transaction.updated_at).all()
+
+            for transaction_id, user_id, vendor, description, category, updated_at in rows:
+                self.observe(transaction_id, user_id, vendor, description, category)
+                if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+        finally:
+            db.close()
+            self._sync_lock.release()
+
+        if self._dirty and now - self._last_save >= CATEGORY_SAVE_SECONDS:
+            self.save()
+        return len(rows)
+
+    def prune(self) -> int:
+        """
+        Unlearn transactions that no longer exist (deleted while this process was not watching)
+
+        Blocking (database query): call it from a worker thread.
+
+        Returns:
+            Number of transactions forgotten
+        """
+        db = SessionLocal()
+        try:
+            existing = {transaction_id for (transaction_id,) in db.query(Transaction.id).all()}
+        finally:
+            db.close()
+        with self._lock:
+            missing = [transaction_id for transaction_id in self.labels if transaction_id not in existing]
+        for transaction_id in missing:
+            self.forget(transaction_id)
+        return len(missing)
+
+    def record(self, route: str):
+        """Count how a categorisation was answered (user, global, model, parse or default)"""
+        with self._lock:
+            self.routes[route] = self.routes.get(route, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            routes = dict(self.routes)
+            total = sum(routes.values())
+            return {
+                "threshold": CATEGORY_CONFIDENCE_THRESHOLD,
+                "examples": sum(self.class_counts.values()),
+                "vendors": len(self.vendors),
+                "users": len(self.user_vendors),
+                "routes": routes,
+                "local_rate": round(sum(routes.get(r, 0) for r in ("user", "global", "model")) / total, 4)
+                if total else 0.0
+            }
+
+    def save(self):
+        """Write the model to CATEGORY_MODEL_PATH (atomically; blocking, call it from a worker thread)"""
+        with self._lock:
+            state = json.dumps({
+                "version": MODEL_VERSION,
+                "watermark": self.watermark.isoformat() if self.watermark else None,
+                "user_vendors": {str(user_id): vendors for user_id, vendors in self.user_vendors.items()},
+                "vendors": self.vendors,
+                "class_counts": self.class_counts,
+                "feature_counts": self.feature_counts,
+                "feature_totals": self.feature_totals,
+                "vocabulary": self.vocabulary,
+                "labels": {str(transaction_id): label for transaction_id, label in self.labels.items()}
+            })
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Unique per writer: threads and worker processes may save at once
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(state)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save category model to {self.path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self) -> bool:
+        """Read the model saved at CATEGORY_MODEL_PATH; returns False if there is none (or it is stale)"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load category model from {self.path}: {e}")
+            return False
+        if state.get("version") != MODEL_VERSION:
+            return False
+
+        with self._lock:
+            self.watermark = datetime.fromisoformat(state["watermark"]) if state["watermark"] else None
+            self.user_vendors = {int(user_id): vendors for user_id, vendors in state["user_vendors"].items()}
+            self.vendors = state["vendors"]
+            self.class_counts = state["class_counts"]
+            self.feature_counts = state["feature_counts"]
+            self.feature_totals = state["feature_totals"]
+            self.vocabulary = state["vocabulary"]
+            self.labels = {int(transaction_id): label for transaction_id, label in state["labels"].items()}
+        return True
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_category_classifier() -> Optional[CategoryClassifier]:
+    """Return the process-wide classifier (loaded from disk), or None if disabled"""
+    global _classifier
+    if not CATEGORY_CLASSIFIER_ENABLED:
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = CategoryClassifier()
+            _classifier.load()
+        return _classifier
@@ -6,6 +6,30 @@ from app.services.document_scanner import DocumentScanner
 
 class DemoScanner:
     """Create visual demonstrations of OpenCV document scanning"""
+
+    # Text drawn by create_sample_receipt, in reading order (OCR ground truth)
+    SAMPLE_RECEIPT_TEXT = [
+        "ACME STORE",
+        "123 Main Street",
+        "City, ST 12345",
+        "(555) 123-4567",
+        "Date: 11/10/2025",
+        "Time: 14:35:22",
+        "Receipt #: 12345",
+        "ITEMS",
+        "Office Supplies $29.99",
+        "Printer Paper (5 reams) $45.00",
+        "Pens (Box of 50) $12.50",
+        "Notebooks (Pack of 10) $18.75",
+        "Desk Organizer $34.99",
+        "Subtotal: $141.23",
+        "Tax (8.5%): $12.00",
+        "TOTAL: $153.23",
+        "Payment Method: Credit Card",
+        "Card: **** **** **** 4532",
+        "Thank you for shopping!",
+        "Visit us at www.acmestore.com",
+    ]
     
     def __init__(self):
         self.scanner = DocumentScanner()
@@ -0,0 +1,266 @@
+import asyncio
+import os
+import time
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import anthropic
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+from app.services.metrics import record_stages
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Provider endpoints. Point these at a local stub server (see
+# benchmarks/llm_stub.py) to run the AI paths without real API calls.
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Requests sent to each provider at once; this is also the size of the
+# provider's keep-alive connection pool
+LLM_MAX_IN_FLIGHT_ANTHROPIC = int(os.getenv("LLM_MAX_IN_FLIGHT_ANTHROPIC", 8))
+LLM_MAX_IN_FLIGHT_OPENAI = int(os.getenv("LLM_MAX_IN_FLIGHT_OPENAI", 8))
+# Requests waiting for a slot per provider; beyond this new requests are rejected
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", 32))
+# Longest a request waits for a slot before it is rejected
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 30))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", 60))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+
+# Suggested client back-off when a request is rejected
+RETRY_AFTER_SECONDS = 5
+
+
+class LLMOverloaded(Exception):
+    """A provider's request queue is full (or the wait timed out); retry later"""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider} is overloaded: {reason}")
+        self.provider = provider
+        self.retry_after = RETRY_AFTER_SECONDS
+
+
+class ProviderLimiter:
+    """
+    Bounded concurrency for one provider
+
+    At most max_in_flight requests run at once. Further requests wait in
+    FIFO order, up to max_queued of them for at most queue_timeout seconds;
+    beyond that LLMOverloaded is raised straight away, so a slow or
+    rate-limited provider pushes back on callers instead of piling up
+    requests and sockets.
+    """
+
+    def __init__(self, provider: str, max_in_flight: int, max_queued: int = LLM_MAX_QUEUED,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.provider = provider
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def bind(self):
+        """Create the semaphore for the running event loop (requests must have drained)"""
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = self.queued = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of the provider's request slots
+
+        The time spent waiting is recorded as the llm.<provider>.queue stage.
+
+        Raises:
+            LLMOverloaded: The queue is full or the wait timed out
+        """
+        # Counted rather than read from the semaphore: queued requests only
+        # take a slot once their acquire runs
+        if self.in_flight + self.queued >= self.max_in_flight + self.max_queued:
+            self.rejected += 1
+            raise LLMOverloaded(self.provider, f"{self.queued} requests already queued")
+
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMOverloaded(self.provider, f"no free slot after {self.queue_timeout:g}s")
+        finally:
+            self.queued -= 1
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.total_wait_ms += wait_ms
+        record_stages({f"llm.{self.provider}.queue": wait_ms})
+        self.in_flight += 1
+        try:
+            yield
+            self.completed += 1
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        started = self.completed + self.failed
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "mean_wait_ms": round(self.total_wait_ms / started, 2) if started else 0.0
+        }
+
+
+class LLMClients:
+    """
+    Shared async Anthropic and OpenAI clients
+
+    Each provider gets one SDK client over a pooled httpx.AsyncClient, so
+    connections are kept alive and reused across requests, and one
+    ProviderLimiter that caps its in-flight requests. All model calls go
+    through claude() and openai_chat(). Clients are bound to the event loop
+    that first uses them and rebuilt if a different loop calls in (e.g. a
+    fresh test client).
+    """
+
+    def __init__(self, anthropic_api_key: Optional[str] = None, openai_api_key: Optional[str] = None,
+                 anthropic_base_url: Optional[str] = ANTHROPIC_BASE_URL,
+                 openai_base_url: Optional[str] = OPENAI_BASE_URL,
+                 anthropic_max_in_flight: int = LLM_MAX_IN_FLIGHT_ANTHROPIC,
+                 openai_max_in_flight: int = LLM_MAX_IN_FLIGHT_OPENAI,
+                 max_queued: int = LLM_MAX_QUEUED, queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.anthropic_api_key = anthropic_api_key or os.getenv("ANTHROPIC_API_KEY")
+        self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
+        self.anthropic_base_url = anthropic_base_url
+        self.openai_base_url = openai_base_url
+        if not self.openai_api_key:
+            logger.warning("OPENAI_API_KEY not set. Some AI features will be disabled.")
+        if not self.anthropic_api_key:
+            logger.warning("ANTHROPIC_API_KEY not set. Advanced AI features will be disabled.")
+
+        self.limiters = {
+            "anthropic": ProviderLimiter("anthropic", anthropic_max_in_flight, max_queued, queue_timeout),
+            "openai": ProviderLimiter("openai", openai_max_in_flight, max_queued, queue_timeout)
+        }
+        self._anthropic: Optional[anthropic.AsyncAnthropic] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def anthropic_enabled(self) -> bool:
+        return bool(self.anthropic_api_key)
+
+    @property
+    def openai_enabled(self) -> bool:
+        return bool(self.openai_api_key)
+
+    async def claude(self, **kwargs: Any) -> Any:
+        """
+        Create a Claude message (arguments as for messages.create)
+
+        Raises:
+            LLMOverloaded: Too many Claude requests are queued
+        """
+        self._bind()
+        async with self.limiters["anthropic"].slot():
+            return await self._anthropic.messages.create(**kwargs)
+
+    async def openai_chat(self, **kwargs: Any) -> Any:
+        """
+        Create an OpenAI chat completion (arguments as for chat.completions.create)
+
+        Raises:
+            LLMOverloaded: Too many OpenAI requests are queued
+        """
+        self._bind()
+        async with self.limiters["openai"].slot():
+            return await self._openai.chat.completions.create(**kwargs)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per provider: concurrency limit, in-flight and queued requests, and outcome counts"""
+        return {provider: limiter.stats() for provider, limiter in self.limiters.items()}
+
+    async def aclose(self):
+        """Close the pooled connections (call from the loop that used them)"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for client in (self._anthropic, self._openai):
+            if client is not None:
+                await client.close()
+        self._anthropic = self._openai = self._loop = None
+
+    def _http_client(self, max_connections: int) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=LLM_KEEPALIVE_SECONDS
+            ),
+            timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT_SECONDS, connect=10.0),
+            follow_redirects=True
+        )
+
+    def _bind(self):
+        """Create the clients and semaphores for the running loop, if not done yet"""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        if self._loop is not None:
+            # The old loop's connections cannot be closed from here; drop them
+            logger.info("Event loop changed, rebuilding LLM clients")
+
+        if self.anthropic_enabled:
+            self._anthropic = anthropic.AsyncAnthropic(
+                api_key=self.anthropic_api_key,
+                base_url=self.anthropic_base_url,
+                timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=self._http_client(self.limiters["anthropic"].max_in_flight)
+            )
+        if self.openai_enabled:
+            self._openai = AsyncOpenAI(
+                api_key=self.openai_api_key,
+                base_url=self.openai_base_url,
+                timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=self._http_client(self.limiters["openai"].max_in_flight)
+            )
+        for limiter in self.limiters.values():
+            limiter.bind()
+        self._loop = loop
+
+
+_clients: Optional[LLMClients] = None
+_clients_lock = threading.Lock()
+
+
+def get_llm_clients() -> LLMClients:
+    """Return the process-wide LLM clients, creating them on first use"""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = LLMClients()
+        return _clients
+
+
+def llm_stats() -> Dict[str, Dict]:
+    """Limiter statistics per provider (empty before the clients are created)"""
+    return _clients.stats() if _clients is not None else {}
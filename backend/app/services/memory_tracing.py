@@ -0,0 +1,314 @@
+import asyncio
+import gc
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Start tracemalloc in every process at import, including the OCR worker
+# processes (which read the same environment). Tracing slows allocation-heavy
+# code noticeably, so leave it off outside investigations.
+MEMORY_TRACING = os.getenv("MEMORY_TRACING", "false").lower() in ("1", "true", "yes")
+# Stack frames kept per allocation. One is enough to group by line; raise it
+# for key_type=traceback (more frames cost more memory and time).
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", 1))
+MEMORY_TOP_SITES = int(os.getenv("MEMORY_TOP_SITES", 15))
+
+if MEMORY_TRACING and not tracemalloc.is_tracing():
+    tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+_local = threading.local()
+
+# tracemalloc's peak is process-wide, so only one owner at a time may reset
+# and read it: the thread (and asyncio task on it) whose measurements own the
+# peak, and how deeply they are nested. Tasks share the event-loop thread, so
+# a thread alone would let interleaved requests reset each other's peak.
+_peak_lock = threading.Lock()
+_peak_owner: Optional[Tuple[int, Optional[int]]] = None
+_peak_depth = 0
+
+
+class _Measurement:
+    def __init__(self, start: int, exact_peak: bool):
+        self.start = start
+        self.absolute_peak = start
+        self.exact_peak = exact_peak  # False: peak_bytes is only the net growth
+        self.peak_bytes = 0
+        self.net_bytes = 0
+
+
+def _owner() -> Tuple[int, Optional[int]]:
+    """This thread and the asyncio task running on it (None outside a task)"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), id(task) if task is not None else None
+
+
+def _claim_peak(owner: Tuple[int, Optional[int]]) -> bool:
+    """Take (or nest in) ownership of the process-wide peak"""
+    global _peak_owner, _peak_depth
+    with _peak_lock:
+        if _peak_owner not in (None, owner):
+            return False
+        _peak_owner = owner
+        _peak_depth += 1
+        return True
+
+
+def _release_peak():
+    global _peak_owner, _peak_depth
+    with _peak_lock:
+        _peak_depth -= 1
+        if not _peak_depth:
+            _peak_owner = None
+
+
+@contextmanager
+def measure():
+    """
+    Measure the traced memory peak and net growth of a block
+
+    Yields None when tracemalloc is not tracing. Blocks may nest: the
+    process-wide peak is reset on entry, so enclosing measurements take
+    the peak seen so far first. Allocations by other threads during the
+    block count too.
+
+    Only one thread (or asyncio task) at a time can reset the peak. A block
+    that starts while another is measuring would wipe that one's peak, so it
+    does not reset it; its peak_bytes is then the net growth (a lower
+    bound) and exact_peak is False. Blocks that await should not be
+    measured at all: other requests' allocations land in them.
+    """
+    if not tracemalloc.is_tracing():
+        yield None
+        return
+
+    owner = _owner()
+    stacks = _local.__dict__.setdefault("stacks", {})
+    stack = stacks.setdefault(owner[1], [])
+    exact_peak = _claim_peak(owner)
+    current, peak = tracemalloc.get_traced_memory()
+    if exact_peak:
+        for outer in stack:
+            outer.absolute_peak = max(outer.absolute_peak, peak)
+        tracemalloc.reset_peak()
+
+    measurement = _Measurement(current, exact_peak)
+    stack.append(measurement)
+    try:
+        yield measurement
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        stack.pop()
+        if not stack:
+            del stacks[owner[1]]
+        measurement.net_bytes = current - measurement.start
+        if exact_peak:
+            _release_peak()
+            measurement.absolute_peak = max(measurement.absolute_peak, peak)
+            for outer in stack:
+                outer.absolute_peak = max(outer.absolute_peak, measurement.absolute_peak)
+            measurement.peak_bytes = measurement.absolute_peak - measurement.start
+        else:
+            measurement.peak_bytes = max(measurement.net_bytes, 0)
+
+
+class MemoryStats:
+    """Traced memory per pipeline stage and per document"""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict] = {}
+        self._documents = {"count": 0, "max_peak_bytes": 0, "total_peak_bytes": 0, "last_peak_bytes": 0}
+        self._lock = threading.Lock()
+
+    def record(self, memory: Dict[str, Dict[str, int]], document: bool = True):
+        """
+        Record the memory used by pipeline stages
+
+        Args:
+            memory: Stage -> {"peak_bytes", "net_bytes"} (StageTrace.memory), plus
+                "peak_is_delta" when a peak could only be measured as net growth
+            document: The stages processed one document (e.g. one upload's trace)
+        """
+        if not memory:
+            return
+        with self._lock:
+            for stage, usage in memory.items():
+                stats = self._stages.setdefault(
+                    stage, {"count": 0, "delta_count": 0, "max_peak_bytes": 0, "total_peak_bytes": 0,
+                            "total_net_bytes": 0}
+                )
+                stats["count"] += 1
+                stats["delta_count"] += int(bool(usage.get("peak_is_delta")))
+                stats["max_peak_bytes"] = max(stats["max_peak_bytes"], usage["peak_bytes"])
+                stats["total_peak_bytes"] += usage["peak_bytes"]
+                stats["total_net_bytes"] += usage["net_bytes"]
+            if not document:
+                return
+
+            # Stages and worker tasks run one after another, so the document's
+            # peak is the largest of their peaks
+            peak = max(usage["peak_bytes"] for usage in memory.values())
+            documents = self._documents
+            documents["count"] += 1
+            documents["max_peak_bytes"] = max(documents["max_peak_bytes"], peak)
+            documents["total_peak_bytes"] += peak
+            documents["last_peak_bytes"] = peak
+
+    def snapshot(self) -> Dict:
+        """
+        Per-stage and per-document peak (max, mean) and mean net growth, in bytes
+
+        A stage's delta_count is how many of its measurements overlapped one
+        on another thread, so their peak is only the net growth.
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": stats["count"],
+                    "delta_count": stats["delta_count"],
+                    "max_peak_bytes": stats["max_peak_bytes"],
+                    "mean_peak_bytes": stats["total_peak_bytes"] // stats["count"],
+                    "mean_net_bytes": stats["total_net_bytes"] // stats["count"]
+                }
+                for stage, stats in sorted(self._stages.items())
+            }
+            documents = dict(self._documents)
+        count = documents.pop("count")
+        total = documents.pop("total_peak_bytes")
+        documents.update(count=count, mean_peak_bytes=total // count if count else 0)
+        return {"stages": stages, "documents": documents}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._documents.update(count=0, max_peak_bytes=0, total_peak_bytes=0, last_peak_bytes=0)
+
+
+memory_stats = MemoryStats()
+
+
+# Allocations by tracemalloc itself (e.g. earlier snapshots) and the import system
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>",
+                  "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    """Snapshot traced allocations after a full collection"""
+    gc.collect()
+    return tracemalloc.take_snapshot()
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, baseline: Optional[tracemalloc.Snapshot] = None,
+              limit: int = MEMORY_TOP_SITES, key_type: str = "lineno") -> List[Dict]:
+    """
+    Largest allocation sites, or the largest changes since a baseline
+
+    Args:
+        snapshot: Snapshot from take_snapshot
+        baseline: Earlier snapshot to diff against
+        limit: Number of sites to return
+        key_type: "lineno", "filename" or "traceback" (full allocation stack)
+
+    Returns:
+        Sites with size and count (and their change when diffing)
+    """
+    if baseline is None:
+        stats = snapshot.statistics(key_type)
+    else:
+        stats = snapshot.compare_to(baseline, key_type)
+
+    sites = []
+    for stat in stats:
+        if len(sites) == limit:
+            break
+        frame = stat.traceback[0]
+        # Skipped here rather than with Snapshot.filter_traces, which is
+        # slow on large snapshots
+        if frame.filename in _IGNORED_FILES:
+            continue
+        site = {
+            "site": f"{frame.filename}:{frame.lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count
+        }
+        if baseline is not None:
+            site["size_diff_bytes"] = stat.size_diff
+            site["count_diff"] = stat.count_diff
+        if key_type == "traceback":
+            site["traceback"] = stat.traceback.format()
+        sites.append(site)
+    return sites
+
+
+def traced_memory() -> Dict:
+    """Whether tracemalloc is on, with current and peak traced bytes"""
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory()
+    }
+
+
+class SnapshotTracker:
+    """
+    On-demand tracemalloc session: a baseline snapshot, then diffs
+
+    Each snapshot is compared with the baseline (growth since tracing
+    started) and with the previous snapshot (growth since the last look),
+    which separates steady growth from one-off bloat.
+    """
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def start(self, frames: int = MEMORY_TRACE_FRAMES) -> Dict:
+        """Start tracing (if needed), take the baseline and reset the stage statistics"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self.baseline = self.previous = take_snapshot()
+            memory_stats.reset()
+            return traced_memory()
+
+    def snapshot(self, limit: int = MEMORY_TOP_SITES, key_type: str = "lineno") -> Dict:
+        """
+        Take a snapshot and report the top allocation sites
+
+        Returns:
+            Traced memory, the largest sites, and the largest changes since
+            the baseline and since the previous snapshot
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("Memory tracing is not running")
+            snapshot = take_snapshot()
+            if self.baseline is None:
+                # Tracing was started by MEMORY_TRACING rather than start()
+                self.baseline = self.previous = snapshot
+            report = {
+                **traced_memory(),
+                "top": top_sites(snapshot, limit=limit, key_type=key_type),
+                "since_start": top_sites(snapshot, self.baseline, limit, key_type),
+                "since_previous": top_sites(snapshot, self.previous, limit, key_type)
+            }
+            self.previous = snapshot
+            return report
+
+    def stop(self):
+        with self._lock:
+            self.baseline = self.previous = None
+            tracemalloc.stop()
+
+
+snapshot_tracker = SnapshotTracker()
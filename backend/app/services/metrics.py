@@ -0,0 +1,409 @@
+import contextvars
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.memory_tracing import measure, memory_stats
+
+# Histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with estimated percentiles"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation within its bucket"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for i, bucket_count in enumerate(self.counts):
+                if seen + bucket_count >= rank and bucket_count:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) else self.max
+                    return lower + (upper - lower) * (rank - seen) / bucket_count
+                seen += bucket_count
+            return self.max
+
+    def cumulative(self) -> Tuple[List[Tuple[float, int]], int, float]:
+        """Cumulative (upper bound, count) pairs, total count and sum"""
+        with self._lock:
+            pairs = []
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, self.counts):
+                cumulative += bucket_count
+                pairs.append((bound, cumulative))
+            return pairs, self.count, self.sum
+
+    def snapshot(self) -> Dict:
+        """Counts, sum and estimated percentiles"""
+        p50, p95, p99 = (round(self.quantile(q), 2) for q in (0.5, 0.95, 0.99))
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, bucket_count in zip(self.buckets, self.counts):
+                cumulative += bucket_count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.count
+            return {
+                "count": self.count,
+                "sum_ms": round(self.sum, 2),
+                "mean_ms": round(self.sum / self.count, 2) if self.count else 0.0,
+                "max_ms": round(self.max, 2),
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "buckets": buckets
+            }
+
+
+class StageTrace:
+    """
+    Time spent in each pipeline stage for one unit of work (e.g. one upload)
+
+    With memory tracing on (see app.services.memory_tracing) the trace also
+    holds each stage's traced memory peak and net growth, in bytes.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.memory: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, elapsed_ms: float):
+        # Repeated stages (e.g. several Tesseract passes) accumulate
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed_ms
+
+    def add_memory(self, stage: str, peak_bytes: int, net_bytes: int, peak_is_delta: bool = False):
+        # Repeated stages keep their largest peak and total growth
+        with self._lock:
+            usage = self.memory.setdefault(stage, {"peak_bytes": 0, "net_bytes": 0})
+            usage["peak_bytes"] = max(usage["peak_bytes"], peak_bytes)
+            usage["net_bytes"] += net_bytes
+            if peak_is_delta:
+                # Overlapped a measurement on another thread (see memory_tracing.measure)
+                usage["peak_is_delta"] = True
+
+    def merge(self, stages: Dict[str, float], memory: Optional[Dict[str, Dict[str, int]]] = None):
+        for stage, elapsed_ms in stages.items():
+            self.add(stage, elapsed_ms)
+        for stage, usage in (memory or {}).items():
+            self.add_memory(stage, usage["peak_bytes"], usage["net_bytes"], usage.get("peak_is_delta", False))
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(elapsed_ms, 2) for stage, elapsed_ms in self.stages.items()}
+
+
+class StageMetrics:
+    """Per-stage latency histograms for the scan, OCR and parse pipeline"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+        histogram.observe(elapsed_ms)
+
+    def record(self, stages: Dict[str, float]):
+        """Observe every stage of a finished trace"""
+        for stage, elapsed_ms in stages.items():
+            self.observe(stage, elapsed_ms)
+
+    def histograms(self) -> Dict[str, Histogram]:
+        with self._lock:
+            return dict(self._histograms)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        histograms = self.histograms()
+        return {stage: histograms[stage].snapshot() for stage in sorted(histograms)}
+
+
+stage_metrics = StageMetrics()
+
+_current_trace: contextvars.ContextVar[Optional[StageTrace]] = contextvars.ContextVar(
+    "stage_trace", default=None
+)
+
+
+@contextmanager
+def collect_trace():
+    """
+    Collect stage timings in this context into a trace instead of the histograms
+
+    The caller records the finished trace (stage_metrics.record), so
+    timings from worker processes and threads can be combined per document.
+    """
+    trace = StageTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stages(stages: Dict[str, float], memory: Optional[Dict[str, Dict[str, int]]] = None):
+    """Add stage timings (and memory) to the current trace, or to the histograms if there is none"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.merge(stages, memory)
+    else:
+        stage_metrics.record(stages)
+        if memory:
+            memory_stats.record(memory, document=False)
+
+
+@contextmanager
+def stage_timer(stage: str, trace_memory: bool = True):
+    """
+    Time a block as a pipeline stage (and measure its memory when tracing)
+
+    A block that raises (including cancellation and timeouts) is recorded
+    as "<stage>.error", so failures don't skew the stage's latency.
+
+    Args:
+        stage: Stage name, e.g. "scan.detect" or "ocr.tesseract"
+        trace_memory: Measure memory too. Pass False for blocks that await:
+            measurements on one thread must nest, and other tasks would
+            interleave with the block.
+    """
+    usage = None
+    failed = False
+    start = time.perf_counter()
+    try:
+        if not trace_memory:
+            yield
+            return
+        with measure() as usage:
+            yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        name = f"{stage}.error" if failed else stage
+        memory = None
+        if usage is not None:
+            memory = {name: {"peak_bytes": usage.peak_bytes, "net_bytes": usage.net_bytes}}
+            if not usage.exact_peak:
+                memory[name]["peak_is_delta"] = True
+        record_stages({name: (time.perf_counter() - start) * 1000}, memory)
+
+
+class RequestMetrics:
+    """HTTP request counters, in-flight gauges and latency/DB-time histograms"""
+
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self._db_time: Dict[Tuple[str, str, str], Histogram] = {}
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def start(self, method: str, route: str):
+        with self._lock:
+            key = (method, route)
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def finish(self, method: str, route: str, status: int, elapsed_ms: float, db_ms: float):
+        key = (method, route, str(status))
+        with self._lock:
+            self._in_flight[(method, route)] -= 1
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = Histogram()
+                self._db_time[key] = Histogram()
+            db_time = self._db_time[key]
+        latency.observe(elapsed_ms)
+        db_time.observe(db_ms)
+
+    def collect(self) -> Tuple[Dict, Dict, Dict]:
+        with self._lock:
+            return dict(self._latency), dict(self._db_time), dict(self._in_flight)
+
+
+request_metrics = RequestMetrics()
+
+_request_db_time: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "request_db_time", default=None
+)
+
+
+@contextmanager
+def track_db_time():
+    """
+    Accumulate database time in this context (see add_db_time)
+
+    Yields a one-element list holding the milliseconds spent so far. It is
+    shared by copies of the context, so queries run on worker threads (sync
+    endpoints and dependencies) count towards the request.
+    """
+    total = [0.0]
+    token = _request_db_time.set(total)
+    try:
+        yield total
+    finally:
+        _request_db_time.reset(token)
+
+
+def add_db_time(elapsed_ms: float):
+    total = _request_db_time.get()
+    if total is not None:
+        total[0] += elapsed_ms
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape_label(str(value))}"' for name, value in labels.items())
+
+
+def _render_histogram(lines: List[str], name: str, histogram: Histogram, labels: str):
+    """Append a histogram in Prometheus text format (milliseconds exported as seconds)"""
+    pairs, count, total = histogram.cumulative()
+    prefix = f"{labels}," if labels else ""
+    for bound, cumulative in pairs:
+        lines.append(f'{name}_bucket{{{prefix}le="{bound / 1000:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {total / 1000:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {count}")
+
+
+def _process_stats() -> Dict[str, float]:
+    """CPU seconds, resident memory and thread count of this process"""
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = {
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "threads": threading.active_count()
+    }
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_bytes"] = int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # No procfs (e.g. macOS): fall back to the peak resident size
+        stats["rss_bytes"] = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return stats
+
+
+def render_prometheus() -> str:
+    """
+    All metrics in the Prometheus text exposition format
+
+    Covers HTTP requests (count, in-flight, latency and DB time per route
+    template and status), pipeline stage latencies, worker pool backlog,
+    LLM provider concurrency, receipt parse and categorization routing and
+    process CPU, memory and threads.
+    """
+    from app.services.category_classifier import get_category_classifier
+    from app.services.llm_clients import llm_stats
+    from app.services.receipt_extractor import routing_stats
+    from app.services.workers import pool_stats
+
+    latency, db_time, in_flight = request_metrics.collect()
+    lines = []
+
+    lines.append("# HELP http_requests_total HTTP requests by route template and status")
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route, status), histogram in sorted(latency.items()):
+        labels = _labels(method=method, route=route, status=status)
+        lines.append(f"http_requests_total{{{labels}}} {histogram.count}")
+
+    lines.append("# HELP http_requests_in_flight HTTP requests being handled")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    for (method, route), count in sorted(in_flight.items()):
+        lines.append(f"http_requests_in_flight{{{_labels(method=method, route=route)}}} {count}")
+
+    lines.append("# HELP http_request_duration_seconds HTTP request latency")
+    lines.append("# TYPE http_request_duration_seconds histogram")
+    for (method, route, status), histogram in sorted(latency.items()):
+        _render_histogram(lines, "http_request_duration_seconds", histogram,
+                          _labels(method=method, route=route, status=status))
+
+    lines.append("# HELP http_request_db_seconds Time spent in database queries per request")
+    lines.append("# TYPE http_request_db_seconds histogram")
+    for (method, route, status), histogram in sorted(db_time.items()):
+        _render_histogram(lines, "http_request_db_seconds", histogram,
+                          _labels(method=method, route=route, status=status))
+
+    lines.append("# HELP pipeline_stage_duration_seconds Document pipeline stage latency")
+    lines.append("# TYPE pipeline_stage_duration_seconds histogram")
+    stages = stage_metrics.histograms()
+    for stage in sorted(stages):
+        _render_histogram(lines, "pipeline_stage_duration_seconds", stages[stage], _labels(stage=stage))
+
+    pools = pool_stats()
+    for metric, help_text in (
+        ("workers", "Worker pool size"),
+        ("pending", "Tasks submitted to a worker pool and not finished"),
+        ("queued", "Tasks waiting for a free worker")
+    ):
+        lines.append(f"# HELP worker_pool_{metric} {help_text}")
+        lines.append(f"# TYPE worker_pool_{metric} gauge")
+        for pool, stats in pools.items():
+            lines.append(f"worker_pool_{metric}{{{_labels(pool=pool)}}} {stats[metric]}")
+
+    providers = llm_stats()
+    for metric, metric_type, help_text in (
+        ("in_flight", "gauge", "LLM requests being sent to a provider"),
+        ("queued", "gauge", "LLM requests waiting for a provider slot"),
+        ("max_in_flight", "gauge", "Concurrent LLM requests allowed per provider"),
+        ("rejected", "counter", "LLM requests rejected because the provider queue was full")
+    ):
+        name = f"llm_requests_{metric}" + ("_total" if metric_type == "counter" else "")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for provider, stats in sorted(providers.items()):
+            lines.append(f"{name}{{{_labels(provider=provider)}}} {stats[metric]}")
+
+    lines.append("# HELP receipt_parses_total Receipt parses by route (local, cache, claude, openai, fallback)")
+    lines.append("# TYPE receipt_parses_total counter")
+    for route, count in routing_stats.counts().items():
+        lines.append(f"receipt_parses_total{{{_labels(route=route)}}} {count}")
+
+    classifier = get_category_classifier()
+    if classifier is not None:
+        lines.append("# HELP transaction_categorizations_total Categorizations by route "
+                     "(user, global, model, parse, default)")
+        lines.append("# TYPE transaction_categorizations_total counter")
+        for route, count in sorted(classifier.stats()["routes"].items()):
+            lines.append(f"transaction_categorizations_total{{{_labels(route=route)}}} {count}")
+
+    process = _process_stats()
+    lines.append("# HELP process_cpu_seconds_total User and system CPU time of the API process")
+    lines.append("# TYPE process_cpu_seconds_total counter")
+    lines.append(f"process_cpu_seconds_total {process['cpu_seconds']:.3f}")
+    lines.append("# HELP process_resident_memory_bytes Resident memory of the API process")
+    lines.append("# TYPE process_resident_memory_bytes gauge")
+    lines.append(f"process_resident_memory_bytes {process['rss_bytes']}")
+    lines.append("# HELP process_threads Threads in the API process")
+    lines.append("# TYPE process_threads gauge")
+    lines.append(f"process_threads {process['threads']}")
+
+    return "\n".join(lines) + "\n"
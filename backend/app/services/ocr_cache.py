@@ -0,0 +1,257 @@
+import os
+import json
+import hashlib
+import time
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./ocr_cache")
+OCR_CACHE_MEMORY_BYTES = int(os.getenv("OCR_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))  # 32MB
+OCR_CACHE_DISK_BYTES = int(os.getenv("OCR_CACHE_DISK_BYTES", 512 * 1024 * 1024))  # 512MB
+# Seconds between background sweeps that re-measure the disk tier (other
+# worker processes write to it too) and evict down to 90% of its limit
+OCR_CACHE_SWEEP_SECONDS = float(os.getenv("OCR_CACHE_SWEEP_SECONDS", 60))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Two-tier cache of OCR results
+
+    Entries are keyed by the document's content hash plus every setting that
+    affects the output (scanner version, PSM, OEM, DPI, engine), so a change
+    to any of them misses instead of returning stale text. Results live in an
+    in-memory LRU and in JSON files on disk shared by all worker processes;
+    both tiers evict by total size. The disk tier's size is tracked
+    incrementally per process and corrected by a background sweep (at least
+    every OCR_CACHE_SWEEP_SECONDS, sooner once over the limit), so puts
+    never walk the cache directory.
+    """
+
+    def __init__(self, directory: str = OCR_CACHE_DIR,
+                 memory_bytes: int = OCR_CACHE_MEMORY_BYTES,
+                 disk_bytes: int = OCR_CACHE_DISK_BYTES, sweep_seconds: float = OCR_CACHE_SWEEP_SECONDS):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.sweep_seconds = sweep_seconds
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0  # Estimate; the first put triggers a sweep that measures it
+        self._last_sweep = float("-inf")
+        self._sweeping = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_digest: str, config: Dict) -> str:
+        """
+        Build a cache key
+
+        Args:
+            content_digest: Hash of the document bytes
+            config: Preprocessing and OCR settings that affect the result
+
+        Returns:
+            Hex key
+        """
+        payload = json.dumps({"content": content_digest, "config": config}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Look up a cached OCR result
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            OCRResult, or None on a miss
+        """
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._decode(payload)
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)  # Disk eviction removes least recently used first
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except OSError as e:
+            logger.warning(f"OCR cache read failed: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, payload)
+        return self._decode(payload)
+
+    def put(self, key: str, result):
+        """
+        Store an OCR result in both tiers
+
+        Args:
+            key: Cache key from make_key
+            result: OCRResult to store
+        """
+        payload = json.dumps(asdict(result)).encode()
+        with self._lock:
+            self._remember(key, payload)
+
+        path = self._path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique per writer: threads and processes may store the same key at once
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)  # Atomic, safe across worker processes
+        except OSError as e:
+            logger.warning(f"OCR cache write failed: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._disk_size += len(payload)
+            sweep = not self._sweeping and (
+                self._disk_size > self.disk_bytes
+                or time.monotonic() - self._last_sweep >= self.sweep_seconds
+            )
+            if sweep:
+                self._sweeping = True
+        if sweep:
+            threading.Thread(target=self._sweep_disk, name="ocr-cache-sweep", daemon=True).start()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size
+            }
+
+    def _remember(self, key: str, payload: bytes):
+        """Add to the memory tier, evicting least recently used entries (lock held)"""
+        if len(payload) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = payload
+        self._memory_size += len(payload)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _sweep_disk(self):
+        """
+        Measure the disk tier and remove the oldest entries until it is under 90% of its limit
+
+        Runs on a background thread, without the lock held while walking the
+        directory. Files written by other processes are counted, which the
+        per-process estimate misses.
+        """
+        with self._lock:
+            estimate = self._disk_size
+        total = 0
+        try:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue  # Writes in progress
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if total > self.disk_bytes:
+                target = int(self.disk_bytes * 0.9)
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+        except Exception as e:
+            logger.warning(f"OCR cache sweep failed: {e}")
+            total = estimate
+        finally:
+            with self._lock:
+                # Keep what this process wrote while the sweep ran
+                self._disk_size = total + self._disk_size - estimate
+                self._last_sweep = time.monotonic()
+                self._sweeping = False
+
+    @staticmethod
+    def _decode(payload: bytes):
+        from app.services.ocr_service import OCRResult, OCRWord
+
+        data = json.loads(payload)
+        data["words"] = [
+            OCRWord(**{**word, "box": tuple(word["box"])}) for word in data.get("words", [])
+        ]
+        return OCRResult(**data)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[OCRCache]:
+    """Return the process-wide OCR cache, or None if caching is disabled"""
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRCache()
+        return _cache
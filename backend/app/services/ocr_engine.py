@@ -0,0 +1,237 @@
+import pytesseract
+from PIL import Image
+import numpy as np
+import os
+import queue
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+ImageInput = Union[Image.Image, np.ndarray]
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tesserocr
+except ImportError:  # Optional: needs libtesseract, see requirements.txt
+    tesserocr = None
+
+# OCR backend: "auto" (tesserocr when available), "tesserocr" or "pytesseract"
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto").lower()
+# Long-lived Tesseract handles per process (each holds its own loaded model)
+OCR_ENGINE_POOL_SIZE = int(os.getenv("OCR_ENGINE_POOL_SIZE", 1))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class OCREngine(ABC):
+    """
+    Base class for OCR backends
+
+    Engines accept PIL images or numpy arrays (grayscale or RGB) and return
+    word-level data in the same shape as
+    pytesseract.image_to_data(..., output_type=Output.DICT). An optional
+    whitelist restricts the characters Tesseract may output (it must not
+    contain whitespace or quotes).
+    """
+    name = "base"
+
+    @abstractmethod
+    def image_to_data(self, image: ImageInput, psm: int = 6, oem: int = 3,
+                      whitelist: Optional[str] = None) -> Dict[str, List]:
+        """Recognise an image, returning word text, confidences, boxes and layout numbers"""
+
+    def health_check(self) -> bool:
+        """Run OCR on a tiny blank image to verify the backend works"""
+        try:
+            self.image_to_data(Image.new("L", (32, 32), color=255), psm=6)
+            return True
+        except Exception as e:
+            logger.error(f"{self.name} OCR engine health check failed: {e}")
+            return False
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OCREngine):
+    """Runs the tesseract CLI in a new subprocess for every call"""
+    name = "pytesseract"
+
+    def image_to_data(self, image: ImageInput, psm: int = 6, oem: int = 3,
+                      whitelist: Optional[str] = None) -> Dict[str, List]:
+        config = f'--oem {oem} --psm {psm}'
+        if whitelist:
+            config += f' -c tessedit_char_whitelist={whitelist}'
+        return pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine(OCREngine):
+    """
+    Pool of long-lived libtesseract handles
+
+    Each handle loads the traineddata once and is reused for every call,
+    avoiding the process start and model load that pytesseract pays per
+    call. Images are passed in memory. A handle that fails is replaced and
+    the call is retried on the pytesseract fallback.
+    """
+    name = "tesserocr"
+
+    def __init__(self, pool_size: int = OCR_ENGINE_POOL_SIZE, lang: str = OCR_LANG):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.lang = lang
+        self.pool_size = max(pool_size, 1)
+        self.fallback = PytesseractEngine()
+        self._handles: "queue.Queue" = queue.Queue()
+        for _ in range(self.pool_size):
+            self._handles.put(self._create_handle())
+
+    def _create_handle(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+
+    @contextmanager
+    def _acquire(self):
+        """
+        Borrow a handle from the pool, replacing it if the call fails
+
+        Only live handles go back into the pool. If a replacement cannot be
+        created, an empty slot (None) is returned instead and the next
+        borrower retries the creation, so the pool never shrinks.
+        """
+        handle = self._handles.get()
+        if handle is None:
+            try:
+                handle = self._create_handle()
+            except Exception:
+                self._handles.put(None)
+                raise
+        try:
+            yield handle
+        except Exception:
+            handle.End()
+            handle = None
+            try:
+                handle = self._create_handle()
+            except Exception as e:
+                logger.error(f"Could not replace tesserocr handle: {e}")
+            raise
+        finally:
+            if handle is not None:
+                handle.Clear()
+            self._handles.put(handle)
+
+    def _recognize(self, image: ImageInput, psm: int, whitelist: Optional[str] = None) -> Dict[str, List]:
+        with self._acquire() as api:
+            api.SetPageSegMode(psm)
+            # Variables persist on the handle, so always set (or clear) the whitelist
+            api.SetVariable("tessedit_char_whitelist", whitelist or "")
+            if isinstance(image, np.ndarray):
+                # Hand the pixel buffer straight to Tesseract, no PIL conversion
+                image = np.ascontiguousarray(image)
+                height, width = image.shape[:2]
+                channels = 1 if len(image.shape) == 2 else image.shape[2]
+                api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            else:
+                api.SetImage(image)
+            api.Recognize()
+            return self._collect_words(api)
+
+    def image_to_data(self, image: ImageInput, psm: int = 6, oem: int = 3,
+                      whitelist: Optional[str] = None) -> Dict[str, List]:
+        # The OEM is fixed when a handle loads its model
+        try:
+            return self._recognize(image, psm, whitelist)
+        except Exception as e:
+            logger.error(f"tesserocr failed, falling back to pytesseract: {e}")
+            return self.fallback.image_to_data(image, psm=psm, oem=oem, whitelist=whitelist)
+
+    def health_check(self) -> bool:
+        """Check every pooled handle (a failing handle is replaced)"""
+        healthy = True
+        for _ in range(self.pool_size):
+            try:
+                self._recognize(Image.new("L", (32, 32), color=255), psm=6)
+            except Exception as e:
+                logger.error(f"tesserocr handle failed health check: {e}")
+                healthy = False
+        return healthy
+
+    def _collect_words(self, api) -> Dict[str, List]:
+        """Walk the result iterator into pytesseract's DICT layout"""
+        data = {key: [] for key in (
+            'text', 'conf', 'left', 'top', 'width', 'height', 'block_num', 'par_num', 'line_num'
+        )}
+        iterator = api.GetIterator()
+        if iterator is None:
+            return data
+
+        level = tesserocr.RIL.WORD
+        block_num = par_num = line_num = 0
+        for word in tesserocr.iterate_level(iterator, level):
+            if word.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block_num, par_num, line_num = block_num + 1, 0, 0
+            if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par_num, line_num = par_num + 1, 0
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line_num += 1
+
+            bounding_box = word.BoundingBox(level)
+            if bounding_box is None:
+                continue
+            x1, y1, x2, y2 = bounding_box
+            data['text'].append(word.GetUTF8Text(level) or "")
+            data['conf'].append(word.Confidence(level))
+            data['left'].append(x1)
+            data['top'].append(y1)
+            data['width'].append(x2 - x1)
+            data['height'].append(y2 - y1)
+            data['block_num'].append(block_num)
+            data['par_num'].append(par_num)
+            data['line_num'].append(line_num)
+
+        return data
+
+    def close(self):
+        while not self._handles.empty():
+            handle = self._handles.get_nowait()
+            if handle is not None:
+                handle.End()
+
+
+def create_engine(name: str = OCR_ENGINE) -> OCREngine:
+    """
+    Create an OCR engine, falling back to pytesseract if the requested one is unavailable
+
+    Args:
+        name: "auto", "tesserocr" or "pytesseract"
+
+    Returns:
+        A healthy OCR engine
+    """
+    if name in ("auto", "tesserocr") and tesserocr is not None:
+        try:
+            engine = TesserocrEngine()
+            if engine.health_check():
+                logger.info(f"Using tesserocr OCR engine with {engine.pool_size} handle(s)")
+                return engine
+            engine.close()
+        except Exception as e:
+            logger.error(f"Could not start tesserocr engine: {e}")
+
+    if name == "tesserocr":
+        logger.warning("tesserocr unavailable, using pytesseract")
+    return PytesseractEngine()
+
+
+def get_engine() -> OCREngine:
+    """Return the process-wide OCR engine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine()
+        return _engine
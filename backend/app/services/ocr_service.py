@@ -1,134 +1,583 @@
-import pytesseract
 from PIL import Image
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+import io
 import os
+import re
+import string
+import hashlib
 import logging
+import subprocess
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
 from app.services.document_scanner import DocumentScanner
+from app.services.ocr_engine import OCR_ENGINE, OCREngine, get_engine, tesserocr
+from app.services.ocr_cache import OCRCache, file_digest, get_cache
+from app.services.metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
+# Output shorter than this triggers a second pass with automatic page segmentation
+MIN_TEXT_LENGTH = 50
+
+# Resolution used to rasterise PDF pages
+PDF_DPI = int(os.getenv("PDF_DPI", 200))
+
+# Threads rasterising and OCR'ing PDF pages, and the cap on pages held in memory
+PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", 2))
+PDF_MAX_PAGES_IN_FLIGHT = int(os.getenv("PDF_MAX_PAGES_IN_FLIGHT", PDF_OCR_WORKERS))
+
+# PDF pages whose embedded text has at least this many non-space characters skip OCR
+MIN_TEXT_LAYER_CHARS = int(os.getenv("PDF_MIN_TEXT_LAYER_CHARS", 20))
+
+# OCR profile for images: "document" OCRs the whole page, "receipt" only the
+# header and the date/total lines (falling back to the whole page). The receipt
+# profile needs the tesserocr engine: pytesseract would start one tesseract
+# process per line, so images are read with the document profile instead
+OCR_PROFILE = os.getenv("OCR_PROFILE", "document").lower()
+
+# Receipt profile: header lines read for the vendor, and how many lines below
+# the header (for the date) and from the bottom (for the total) are searched
+RECEIPT_HEADER_LINES = 3
+RECEIPT_SEARCH_LINES = int(os.getenv("RECEIPT_SEARCH_LINES", 8))
+RECEIPT_LINE_PADDING = 4
+HEADER_WHITELIST = string.ascii_letters + string.digits + "&.,:/-#()"
+FIELD_WHITELIST = string.ascii_letters + string.digits + "$.,:/-#"
+DATE_PATTERN = re.compile(r"\b(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{1,2}-\d{1,2})\b")
+TOTAL_PATTERN = re.compile(r"\b(total|amount due|balance due)\b\D*\d+[.,]\d{2}", re.IGNORECASE)
+SUBTOTAL_PATTERN = re.compile(r"\bsub\s?-?\s?total", re.IGNORECASE)
+
+# An image given as a file path, encoded bytes (e.g. an upload) or a decoded array
+ImageSource = Union[str, bytes, np.ndarray]
+
+
+@dataclass
+class OCRWord:
+    """A recognised word with its confidence and bounding box"""
+    text: str
+    confidence: float
+    box: Tuple[int, int, int, int]  # left, top, width, height
+    page: int = 1
+
+
+@dataclass
+class OCRResult:
+    """Structured result of one OCR pass over a document"""
+    text: str = ""
+    confidence: float = 0.0  # Mean word confidence (0-100)
+    words: List[OCRWord] = field(default_factory=list)
+    # Lowest word confidence of each line of text (None for blank lines and text not OCR'd)
+    line_confidences: List[Optional[float]] = field(default_factory=list)
+    psm: Optional[int] = None  # Tesseract page segmentation mode used
+    source: str = "ocr"  # "ocr", "text_layer" (embedded PDF text) or "mixed"
+    preprocessing: Dict = field(default_factory=dict)  # Scanner report (profile, quality, timings)
+
+    @property
+    def word_confidences(self) -> List[float]:
+        """Per-word confidence scores"""
+        return [word.confidence for word in self.words]
+
 
 class OCRService:
     """Service for extracting text from images and PDFs using Tesseract OCR with OpenCV preprocessing"""
-    
-    def __init__(self):
+
+    def __init__(self, engine: Optional[OCREngine] = None, cache: Optional[OCRCache] = None,
+                 profile: str = OCR_PROFILE):
         # Configure Tesseract path if needed (for Windows/Mac)
         # pytesseract.pytesseract.tesseract_cmd = r'/usr/local/bin/tesseract'
         self.scanner = DocumentScanner()
+        self._engine = engine
+        self.cache = cache if cache is not None else get_cache()
+        self.profile = profile
+        if profile == "receipt" and engine is None and (tesserocr is None or OCR_ENGINE == "pytesseract"):
+            logger.warning(
+                "OCR_PROFILE=receipt needs the tesserocr engine (pip install tesserocr); "
+                "reading images with the document profile"
+            )
+
+    @property
+    def engine(self) -> OCREngine:
+        """OCR backend: the persistent tesserocr pool when available, pytesseract otherwise"""
+        if self._engine is None:
+            self._engine = get_engine()
+        return self._engine
+
+    @property
+    def receipt_profile(self) -> bool:
+        """Whether images are read with the receipt profile (only on the tesserocr engine)"""
+        return self.profile == "receipt" and self.engine.name == "tesserocr"
+
+    def _cache_config(self, kind: str) -> dict:
+        """Settings that change OCR output, part of the cache key"""
+        return {
+            "kind": kind,
+            "scanner_version": DocumentScanner.VERSION,
+            "scanner_profile": self.scanner.profile,
+            "scanner_max_dimension": self.scanner.max_dimension,
+            "psm": "6>3",
+            "ocr_profile": "receipt" if self.receipt_profile else "document",
+            "oem": 3,
+            "dpi": PDF_DPI if kind == "pdf" else None,
+            "text_layer_min_chars": MIN_TEXT_LAYER_CHARS if kind == "pdf" else None,
+            "engine": self.engine.name,
+            "line_confidences": True  # Results cached before they were recorded lack them
+        }
+
+    @staticmethod
+    def _content_digest(source: ImageSource) -> str:
+        """SHA-256 of a document's contents, matching file_digest for the same bytes"""
+        if isinstance(source, str):
+            return file_digest(source)
+        if isinstance(source, np.ndarray):
+            digest = hashlib.sha256(str(source.shape).encode())
+            digest.update(np.ascontiguousarray(source).data)
+            return digest.hexdigest()
+        return hashlib.sha256(source).hexdigest()
+
+    def _cached(self, source: ImageSource, kind: str, compute, digest: Optional[str] = None,
+                scan_report: Optional[Dict] = None) -> OCRResult:
+        """
+        Return the cached result for this document and configuration, computing it on a miss
+
+        scan_report, when the document was just scanned, replaces the report
+        stored with a cache hit (which describes the scan that filled the entry).
+        """
+        if self.cache is None:
+            return compute()
+
+        try:
+            key = OCRCache.make_key(digest or self._content_digest(source), self._cache_config(kind))
+        except OSError:
+            return compute()
+
+        with stage_timer("ocr.cache_lookup"):
+            result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            if result.text:  # Don't cache failures
+                self.cache.put(key, result)
+        elif scan_report is not None:
+            ocr_profile = result.preprocessing.get("ocr_profile")
+            result.preprocessing = dict(scan_report)
+            if ocr_profile:
+                result.preprocessing["ocr_profile"] = ocr_profile
+        return result
+
+    def recognize(self, image: Union[Image.Image, np.ndarray], psm: int = 6, page: int = 1,
+                  whitelist: Optional[str] = None) -> OCRResult:
+        """
+        Run a single Tesseract pass returning text, confidences and word boxes
+
+        Args:
+            image: Image to recognise
+            psm: Tesseract page segmentation mode
+            page: Page number recorded on the words
+            whitelist: Characters Tesseract may output (all if None)
+
+        Returns:
+            OCRResult for the image
+        """
+        with stage_timer("ocr.tesseract"):
+            data = self.engine.image_to_data(image, psm=psm, oem=3, whitelist=whitelist)
+
+        # Rebuild the text layout from Tesseract's block/paragraph/line numbering
+        words = []
+        lines = []
+        line_confidences = []
+        line_key = None
+        block_key = None
+        for i, word_text in enumerate(data['text']):
+            word_text = word_text.strip()
+            confidence = float(data['conf'][i])
+            if not word_text or confidence < 0:
+                continue
+
+            words.append(OCRWord(
+                text=word_text,
+                confidence=confidence,
+                box=(data['left'][i], data['top'][i], data['width'][i], data['height'][i]),
+                page=page
+            ))
+
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            if key != line_key:
+                if block_key is not None and key[:2] != block_key:
+                    lines.append("")  # Blank line between paragraphs
+                    line_confidences.append(None)
+                lines.append(word_text)
+                line_confidences.append(confidence)
+                line_key = key
+                block_key = key[:2]
+            else:
+                lines[-1] += " " + word_text
+                line_confidences[-1] = min(line_confidences[-1], confidence)
+
+        confidences = [word.confidence for word in words]
+        return OCRResult(
+            text="\n".join(lines),
+            confidence=sum(confidences) / len(confidences) if confidences else 0.0,
+            words=words,
+            line_confidences=line_confidences,
+            psm=psm
+        )
+
+    def recognize_page(self, image: Union[Image.Image, np.ndarray], page: int = 1) -> OCRResult:
+        """
+        OCR one page, retrying with automatic segmentation only if little text is found
+
+        Args:
+            image: Page image
+            page: Page number
+
+        Returns:
+            OCRResult for the page
+        """
+        # LSTM OCR Engine, assume uniform block of text
+        result = self.recognize(image, psm=6, page=page)
+
+        # Try fully automatic page segmentation if the first attempt yields little text
+        if len(result.text) < MIN_TEXT_LENGTH:
+            result = self.recognize(image, psm=3, page=page)
+
+        return result
+
+    def recognize_receipt(self, image: np.ndarray, page: int = 1) -> Optional[OCRResult]:
+        """
+        OCR only the receipt lines that carry the vendor, date and total
+
+        Text lines are found with morphology (scanner.find_text_lines) and
+        read one at a time in single-line mode with a character whitelist:
+        the header lines, then lines below the header until a date is found
+        and lines from the bottom up until the total is found. On long
+        receipts this reads a fraction of the page.
+
+        Args:
+            image: Scanned (binarised) receipt image
+            page: Page number
+
+        Returns:
+            OCRResult of the lines read, or None if the vendor, date or
+            total was not found (the caller falls back to full-page OCR)
+        """
+        lines = self.scanner.find_text_lines(image)
+        if not lines:
+            return None
+
+        results: Dict[int, OCRResult] = {}
+
+        def read(index: int, whitelist: str) -> str:
+            if index not in results:
+                results[index] = self._recognize_line(image, lines[index], page, whitelist)
+            return results[index].text
+
+        header = range(min(RECEIPT_HEADER_LINES, len(lines)))
+        header_text = [read(i, HEADER_WHITELIST) for i in header]
+        has_vendor = any(sum(c.isalpha() for c in text) >= 3 for text in header_text)
+        has_date = any(DATE_PATTERN.search(text) for text in header_text)
+
+        body_start = len(header)
+        if has_vendor and not has_date:
+            for i in range(body_start, min(body_start + RECEIPT_SEARCH_LINES, len(lines))):
+                if DATE_PATTERN.search(read(i, FIELD_WHITELIST)):
+                    has_date = True
+                    break
+
+        has_total = False
+        if has_vendor and has_date:
+            for i in reversed(range(max(body_start, len(lines) - RECEIPT_SEARCH_LINES), len(lines))):
+                text = read(i, FIELD_WHITELIST)
+                if TOTAL_PATTERN.search(text) and not SUBTOTAL_PATTERN.search(text):
+                    has_total = True
+                    break
+
+        if not has_total:
+            return None
 
-    def extract_text_from_image(self, image_path: str) -> str:
+        read_lines = [results[i] for i in sorted(results) if results[i].text]
+        words = [word for result in read_lines for word in result.words]
+        return OCRResult(
+            text="\n".join(result.text for result in read_lines),
+            confidence=sum(word.confidence for word in words) / len(words) if words else 0.0,
+            words=words,
+            line_confidences=[c for result in read_lines for c in result.line_confidences],
+            psm=7
+        )
+
+    def _recognize_line(self, image: np.ndarray, box: Tuple[int, int, int, int], page: int,
+                        whitelist: str) -> OCRResult:
+        """OCR one text line as a single line of text, with word boxes in page coordinates"""
+        x, y, w, h = box
+        left, top = max(x - RECEIPT_LINE_PADDING, 0), max(y - RECEIPT_LINE_PADDING, 0)
+        crop = image[top:y + h + RECEIPT_LINE_PADDING, left:x + w + RECEIPT_LINE_PADDING]
+        result = self.recognize(crop, psm=7, page=page, whitelist=whitelist)
+        for word in result.words:
+            word.box = (word.box[0] + left, word.box[1] + top, word.box[2], word.box[3])
+        return result
+
+    def extract_from_image(self, image: ImageSource, scanned: Optional[np.ndarray] = None,
+                           digest: Optional[str] = None, scan_report: Optional[Dict] = None) -> OCRResult:
         """
-        Extract text from an image file with OpenCV preprocessing
-        
+        Extract text from an image with OpenCV preprocessing
+
         Args:
-            image_path: Path to the image file
-            
+            image: Path to the image file, its encoded bytes, or a decoded array
+            scanned: Output of scanner.scan_document for this image, if already computed
+            digest: SHA-256 of the image bytes, if already known (saves rehashing for the cache)
+            scan_report: Report filled by scan_document when scanned was computed
+
         Returns:
-            Extracted text as string
+            OCRResult for the image
         """
+        return self._cached(
+            image, "image", lambda: self._extract_from_image(image, scanned, scan_report=scan_report), digest,
+            scan_report=scan_report if scanned is not None else None
+        )
+
+    def _extract_from_image(self, image: ImageSource, scanned: Optional[np.ndarray], page: int = 1,
+                            scan_report: Optional[Dict] = None) -> OCRResult:
+        report = dict(scan_report or {})
         try:
             # Preprocess image with OpenCV
-            processed_image = self.scanner.scan_document(image_path)
-            
-            if processed_image is not None:
-                # Convert OpenCV image to PIL Image for Tesseract
-                if len(processed_image.shape) == 2:  # Grayscale
-                    pil_image = Image.fromarray(processed_image)
-                else:  # Color
-                    pil_image = Image.fromarray(cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB))
+            if scanned is not None:
+                processed_image = scanned
             else:
+                processed_image = self.scanner.scan_document(image, report)
+
+            result = None
+            if processed_image is None:
                 # Fallback to original image if preprocessing fails
-                pil_image = Image.open(image_path)
-            
-            # Perform OCR with custom config for better accuracy
-            custom_config = r'--oem 3 --psm 6'  # LSTM OCR Engine, assume uniform block of text
-            text = pytesseract.image_to_string(pil_image, config=custom_config)
-            
-            # Also try with different PSM modes if first attempt yields little text
-            if len(text.strip()) < 50:
-                custom_config = r'--oem 3 --psm 3'  # Fully automatic page segmentation
-                text = pytesseract.image_to_string(pil_image, config=custom_config)
-            
-            return text.strip()
-            
+                processed_image = self._open_image(image)
+            else:
+                if len(processed_image.shape) == 3:
+                    # Tesseract expects RGB channel order; grayscale arrays pass straight through
+                    processed_image = cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB)
+                if self.receipt_profile:
+                    result = self.recognize_receipt(processed_image, page=page)
+                    report["ocr_profile"] = "receipt" if result is not None else "receipt_fallback"
+
+            if result is None:
+                result = self.recognize_page(processed_image, page=page)
+            result.preprocessing = report
+            return result
+
         except Exception as e:
             logger.error(f"Error extracting text from image: {str(e)}")
             # Fallback to basic OCR without preprocessing
             try:
-                image = Image.open(image_path)
-                return pytesseract.image_to_string(image).strip()
+                return self.recognize(self._open_image(image), psm=3, page=page)
             except:
-                return ""
+                return OCRResult()
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    @staticmethod
+    def _open_image(image: ImageSource) -> Union[Image.Image, np.ndarray]:
+        """Open an unprocessed image for OCR"""
+        if isinstance(image, np.ndarray):
+            return image
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return Image.open(io.BytesIO(image))
+        return Image.open(image)
+
+    def extract_from_pdf(self, pdf_path: str) -> OCRResult:
         """
-        Extract text from a PDF file by converting to images first
-        
+        Extract text from a PDF file
+
+        Pages with an embedded text layer (digitally generated invoices) are
+        read directly; only image-only pages are rasterised and OCR'd, page by
+        page and in parallel.
+
         Args:
             pdf_path: Path to the PDF file
-            
+
         Returns:
-            Extracted text as string
+            OCRResult covering all pages
         """
+        return self._cached(pdf_path, "pdf", lambda: self._extract_from_pdf(pdf_path))
+
+    def _extract_from_pdf(self, pdf_path: str) -> OCRResult:
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path)
-            
-            # Extract text from each page
-            full_text = []
-            for i, image in enumerate(images):
-                text = pytesseract.image_to_string(image)
-                full_text.append(f"--- Page {i+1} ---\n{text}")
-            
-            return "\n\n".join(full_text).strip()
+            with stage_timer("ocr.pdf_text_layer"):
+                page_texts = self.read_pdf_text_layer(pdf_path)
+            if page_texts is None:
+                # No text extraction available: OCR every page
+                page_texts = [""] * pdfinfo_from_path(pdf_path)["Pages"]
+
+            page_results = {}
+            ocr_pages = []
+            for page, page_text in enumerate(page_texts, start=1):
+                if len("".join(page_text.split())) >= MIN_TEXT_LAYER_CHARS:
+                    # Digitally generated page: use the embedded text as is
+                    page_results[page] = OCRResult(text=page_text, confidence=100.0, source="text_layer")
+                else:
+                    ocr_pages.append(page)
+
+            page_results.update(self._ocr_pdf_pages(pdf_path, ocr_pages))
+            return self._merge_pages([page_results[page] for page in sorted(page_results)])
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
-            return ""
+            return OCRResult()
 
-    def extract_text(self, file_path: str) -> str:
+    def _ocr_pdf_pages(self, pdf_path: str, pages: List[int]) -> Dict[int, OCRResult]:
+        """
+        Rasterise and OCR PDF pages in parallel with bounded memory
+
+        Each page is rendered on its own to a temporary file and goes through
+        the same scanner preprocessing as uploaded images. At most
+        PDF_MAX_PAGES_IN_FLIGHT pages are rendered or being OCR'd at a time,
+        so memory does not grow with the page count.
+
+        Args:
+            pdf_path: Path to the PDF file
+            pages: 1-based page numbers to OCR
+
+        Returns:
+            OCRResult per page number
+        """
+        if not pages:
+            return {}
+
+        in_flight = threading.BoundedSemaphore(max(PDF_MAX_PAGES_IN_FLIGHT, 1))
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                ThreadPoolExecutor(max_workers=max(PDF_OCR_WORKERS, 1), thread_name_prefix="pdf-ocr") as pool:
+
+            def process(page: int) -> OCRResult:
+                try:
+                    with stage_timer("ocr.pdf_render"):
+                        page_paths = convert_from_path(
+                            pdf_path, dpi=PDF_DPI, first_page=page, last_page=page,
+                            output_folder=tmp_dir, paths_only=True
+                        )
+                    try:
+                        return self._extract_from_image(page_paths[0], None, page=page)
+                    finally:
+                        for page_path in page_paths:
+                            os.remove(page_path)
+                except Exception as e:
+                    logger.error(f"Error extracting text from PDF page {page}: {str(e)}")
+                    return OCRResult()
+                finally:
+                    in_flight.release()
+
+            futures = {}
+            for page in pages:
+                in_flight.acquire()  # Wait for a slot before rendering the next page
+                # Run in a copy of this context so stage timings reach the caller's trace
+                futures[page] = pool.submit(contextvars.copy_context().run, process, page)
+
+            return {page: future.result() for page, future in futures.items()}
+
+    def read_pdf_text_layer(self, pdf_path: str) -> Optional[List[str]]:
+        """
+        Read the embedded text of each PDF page with poppler's pdftotext
+
+        Args:
+            pdf_path: Path to the PDF file
+
+        Returns:
+            Text per page (empty for image-only pages), or None if pdftotext
+            is unavailable or fails
+        """
+        try:
+            completed = subprocess.run(
+                ["pdftotext", "-layout", "-enc", "UTF-8", pdf_path, "-"],
+                capture_output=True, timeout=60, check=True
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Could not read PDF text layer: {e}")
+            return None
+
+        # pdftotext ends every page with a form feed
+        pages = completed.stdout.decode("utf-8", errors="replace").split("\f")[:-1]
+        return ["\n".join(line.rstrip() for line in page.splitlines()).strip("\n") for page in pages]
+
+    def _merge_pages(self, page_results: List[OCRResult]) -> OCRResult:
+        """Combine per-page results into one document result"""
+        full_text = []
+        words = []
+        line_confidences = []
+        psm = None
+        for i, page_result in enumerate(page_results):
+            if i:
+                line_confidences.append(None)  # Blank line between pages
+            full_text.append(f"--- Page {i+1} ---\n{page_result.text}")
+            words.extend(page_result.words)
+            page_lines = len(page_result.text.split("\n"))
+            if len(page_result.line_confidences) == page_lines:
+                line_confidences += [None] + page_result.line_confidences
+            else:
+                line_confidences += [None] * (page_lines + 1)  # Text layer (or no text)
+            psm = page_result.psm or psm
+
+        confidences = [r.confidence for r in page_results if r.text]
+        sources = {r.source for r in page_results}
+        reports = [r.preprocessing for r in page_results]
+        text = "\n\n".join(full_text).strip()
+        return OCRResult(
+            text=text,
+            confidence=sum(confidences) / len(confidences) if confidences else 0.0,
+            words=words,
+            line_confidences=line_confidences[:len(text.splitlines())],
+            psm=psm,
+            source=sources.pop() if len(sources) == 1 else "mixed",
+            preprocessing={"pages": reports} if any(reports) else {}
+        )
+
+    def extract(self, file_path: str) -> OCRResult:
         """
         Extract text from any supported file type with advanced preprocessing
-        
+
         Args:
             file_path: Path to the file
-            
+
         Returns:
-            Extracted text as string
+            OCRResult for the document
         """
         if not os.path.exists(file_path):
-            return ""
-        
+            return OCRResult()
+
         file_extension = os.path.splitext(file_path)[1].lower()
-        
+
         if file_extension == '.pdf':
-            return self.extract_text_from_pdf(file_path)
+            return self.extract_from_pdf(file_path)
         elif file_extension in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp']:
-            return self.extract_text_from_image(file_path)
+            return self.extract_from_image(file_path)
         else:
             logger.warning(f"Unsupported file type: {file_extension}")
-            return ""
-    
-    def get_document_confidence(self, image_path: str) -> float:
+            return OCRResult()
+
+    def extract_text_from_image(self, image_path: ImageSource, scanned: Optional[np.ndarray] = None) -> str:
+        """Extract text from an image file (see extract_from_image)"""
+        return self.extract_from_image(image_path, scanned).text
+
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract text from a PDF file (see extract_from_pdf)"""
+        return self.extract_from_pdf(pdf_path).text
+
+    def extract_text(self, file_path: str) -> str:
+        """Extract text from any supported file type (see extract)"""
+        return self.extract(file_path).text
+
+    def get_document_confidence(self, document: Union[str, OCRResult]) -> float:
         """
         Get OCR confidence score for the document
-        
+
         Args:
-            image_path: Path to the image file
-            
+            document: OCRResult from a previous extraction (no extra OCR pass),
+                or a path to the file
+
         Returns:
             Confidence score (0-100)
         """
+        if isinstance(document, OCRResult):
+            return document.confidence
+
         try:
-            image = Image.open(image_path)
-            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-            confidences = [int(conf) for conf in data['conf'] if conf != '-1']
-            
-            if confidences:
-                return sum(confidences) / len(confidences)
-            return 0.0
-            
+            return self.extract(document).confidence
         except Exception as e:
             logger.error(f"Error calculating confidence: {str(e)}")
             return 0.0
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "./parse_cache.sqlite3")
+PARSE_CACHE_TTL_SECONDS = int(os.getenv("PARSE_CACHE_TTL_SECONDS", 30 * 24 * 3600))  # 30 days
+PARSE_CACHE_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", 100000))
+PARSE_CACHE_MEMORY_ENTRIES = int(os.getenv("PARSE_CACHE_MEMORY_ENTRIES", 2048))
+
+# Puts between checks of the store's size
+EVICTION_CHECK_INTERVAL = 100
+# Memory-tier hits refresh the stored entry's accessed_at at most this often,
+# so hot entries are not the first evicted from the shared store
+TOUCH_INTERVAL_SECONDS = 300
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and collapse whitespace, so re-OCR'd copies of a document share a key"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class ParseCache:
+    """
+    Two-tier cache of structured receipt parses
+
+    Entries are keyed by the normalised OCR text plus the model and prompt
+    version that produced them, so changing either misses instead of
+    returning stale fields. Results live in an in-memory LRU and in a
+    SQLite database (WAL mode) shared by all worker processes. Entries
+    expire after a TTL; every EVICTION_CHECK_INTERVAL writes the database
+    drops expired entries and the least recently used beyond its size limit.
+
+    get() and put() do blocking SQLite I/O (and may wait on other
+    processes' write locks); call them from worker threads, not the event
+    loop.
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_PATH, ttl_seconds: int = PARSE_CACHE_TTL_SECONDS,
+                 max_entries: int = PARSE_CACHE_MAX_ENTRIES, memory_entries: int = PARSE_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, list]" = OrderedDict()  # key -> [expires_at, payload, touched_at]
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # One connection per process, serialised by the lock
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS parse_cache ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS parse_cache_accessed ON parse_cache (accessed_at)")
+
+    @staticmethod
+    def make_key(text: str, model: str, prompt_version: str) -> str:
+        """
+        Build a cache key
+
+        Args:
+            text: OCR text sent to the model
+            model: Model that parses it
+            prompt_version: Version of the parsing prompt
+
+        Returns:
+            Hex key
+        """
+        payload = json.dumps(
+            {"text": normalize_text(text), "model": model, "prompt": prompt_version}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached parse
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            The parsed fields (a fresh dict), or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                if now - entry[2] >= TOUCH_INTERVAL_SECONDS:
+                    entry[2] = now
+                    self._touch(key, now)
+                return json.loads(entry[1])
+
+            try:
+                row = self._db.execute(
+                    "SELECT payload, created_at FROM parse_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] + self.ttl_seconds > now:
+                    self._db.execute("UPDATE parse_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                logger.warning(f"Parse cache read failed: {e}")
+                row = None
+
+            if row is None or row[1] + self.ttl_seconds <= now:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, row[1] + self.ttl_seconds, row[0], now)
+            return json.loads(row[0])
+
+    def put(self, key: str, result: Dict):
+        """
+        Store a parse in both tiers
+
+        Args:
+            key: Cache key from make_key
+            result: Parsed fields (must be JSON-serialisable)
+        """
+        now = time.time()
+        payload = json.dumps(result)
+        with self._lock:
+            self._remember(key, now + self.ttl_seconds, payload, now)
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, payload, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now)
+                )
+                self._puts += 1
+                if self._puts % EVICTION_CHECK_INTERVAL == 1:
+                    self._evict(now)
+            except sqlite3.Error as e:
+                logger.warning(f"Parse cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            try:
+                entries = self._db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+            except sqlite3.Error:
+                entries = None
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": entries
+            }
+
+    def _touch(self, key: str, now: float):
+        """Mark a stored entry as used (lock held)"""
+        try:
+            self._db.execute("UPDATE parse_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Parse cache touch failed: {e}")
+
+    def _remember(self, key: str, expires_at: float, payload: str, touched_at: float):
+        """Add to the memory tier, evicting least recently used entries (lock held)"""
+        self._memory[key] = [expires_at, payload, touched_at]
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used beyond max_entries (lock held)"""
+        self._db.execute("DELETE FROM parse_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        count = self._db.execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            # Trim to 90% of the limit so eviction does not run on every check
+            excess += self.max_entries // 10
+            self._db.execute(
+                "DELETE FROM parse_cache WHERE key IN "
+                "(SELECT key FROM parse_cache ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """Return the process-wide parse cache, or None if caching is disabled"""
+    global _cache
+    if not PARSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ParseCache()
+            except sqlite3.Error as e:
+                logger.error(f"Could not open parse cache at {PARSE_CACHE_PATH}: {e}")
+                return None
+        return _cache
@@ -0,0 +1,197 @@
+import cv2
+import numpy as np
+import os
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from app.models import Document, SessionLocal, Transaction
+
+logger = logging.getLogger(__name__)
+
+# dHash grid size: a 16x16 grid gives a 256-bit hash, which separates
+# different receipts printed from the same template better than 64 bits
+HASH_SIZE = 16
+
+# Maximum Hamming distance (out of HASH_SIZE**2 bits) for a near-duplicate
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", 12))
+
+
+def dhash(image: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """
+    Compute a difference hash (dHash) of an image
+
+    Args:
+        image: Grayscale or BGR image
+        hash_size: Size of the comparison grid
+
+    Returns:
+        Hash as an integer of hash_size**2 bits
+    """
+    gray = image if len(image.shape) == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = resized[:, 1:] > resized[:, :-1]
+    return int.from_bytes(np.packbits(diff.flatten()).tobytes(), "big")
+
+
+def hash_to_hex(value: int, hash_size: int = HASH_SIZE) -> str:
+    """Format a hash as fixed-width hex for storage"""
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree for sub-linear Hamming-distance lookups"""
+
+    def __init__(self):
+        # Each node is [hash, items, {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item: Any):
+        """
+        Insert a hash
+
+        Args:
+            value: Hash value
+            item: Payload returned by searches (e.g. a document id)
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find all items within a Hamming distance
+
+        Args:
+            value: Hash to look up
+            max_distance: Maximum Hamming distance
+
+        Returns:
+            List of (distance, item) sorted by distance
+        """
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_hash, items, children = stack.pop()
+            distance = hamming_distance(value, node_hash)
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in items)
+            # Triangle inequality: only subtrees in this band can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        return sorted(matches, key=lambda match: match[0])
+
+
+class NearDuplicateIndex:
+    """
+    Per-user BK-trees of document perceptual hashes, synced from the database
+
+    Each tree only reads documents newer than the last one it holds, so an
+    index that stays resident (one per OCR worker process, see
+    workers.scan_and_extract) costs a small query per lookup, not a reload.
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._trees: Dict[int, BKTree] = {}
+        self._last_document_id: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _sync(self, db: Session, user_id: int) -> BKTree:
+        """Add documents stored since the last lookup (including by other workers)"""
+        tree = self._trees.setdefault(user_id, BKTree())
+        last_id = self._last_document_id.get(user_id, 0)
+
+        rows = db.query(Document.id, Document.phash).filter(
+            Document.user_id == user_id,
+            Document.id > last_id,
+            Document.phash.isnot(None)
+        ).order_by(Document.id).all()
+
+        for document_id, phash in rows:
+            tree.add(int(phash, 16), document_id)
+            last_id = document_id
+
+        self._last_document_id[user_id] = last_id
+        return tree
+
+    def find(self, db: Session, user_id: int, phash: str) -> Optional[Tuple[Document, Transaction, int]]:
+        """
+        Find the closest stored document within the distance threshold
+
+        Args:
+            db: Database session
+            user_id: Owner of the documents
+            phash: Hex perceptual hash of the new document
+
+        Returns:
+            Tuple of (document, transaction, distance), or None
+        """
+        tree = self._sync(db, user_id)
+        return self.resolve(db, tree.search(int(phash, 16), self.max_distance))
+
+    def matches(self, user_id: int, phash: str) -> List[Tuple[int, int]]:
+        """
+        Stored documents within the distance threshold, without loading them
+
+        Syncs through its own session, so it can run in a worker process or
+        thread (lookups are serialised).
+
+        Args:
+            user_id: Owner of the documents
+            phash: Hex perceptual hash of the new document
+
+        Returns:
+            (distance, document id) pairs sorted by distance; pass them to resolve()
+        """
+        db = SessionLocal()
+        try:
+            with self._lock:
+                return self._sync(db, user_id).search(int(phash, 16), self.max_distance)
+        finally:
+            db.close()
+
+    def resolve(self, db: Session, matches: List[Tuple[int, int]]) -> Optional[Tuple[Document, Transaction, int]]:
+        """
+        Load the closest match that still has a transaction
+
+        Args:
+            db: Database session
+            matches: (distance, document id) pairs sorted by distance
+
+        Returns:
+            Tuple of (document, transaction, distance), or None
+        """
+        for distance, document_id in matches:
+            # Entries whose transaction was deleted are skipped
+            match = db.query(Document, Transaction).join(
+                Transaction, Transaction.id == Document.transaction_id
+            ).filter(Document.id == document_id).first()
+            if match:
+                return match[0], match[1], distance
+        return None
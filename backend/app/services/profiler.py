@@ -0,0 +1,174 @@
+import asyncio
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Opt-in request profiling. When disabled the middleware is not installed at all.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Fraction of requests profiled without being asked (0 = only on request)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Request header an admin sets to profile that request
+PROFILE_HEADER = "x-profile"
+
+MAX_STACK_DEPTH = 128
+
+_active_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ";" separates frames in the folded format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _fold(frame) -> str:
+    """Stack of a frame as "root;...;leaf" (the folded format read by flamegraph.pl and speedscope)"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfile:
+    """
+    Statistical profile of one request
+
+    A sampling thread records the stack of every thread working on the
+    request every PROFILE_INTERVAL_MS: the event loop thread while the
+    request's task is the one running, and pool threads that joined with
+    attribute_thread (run_in_thread tasks). Nothing is traced, so the
+    request itself runs at full speed. Work on the OCR process pool shows
+    as time awaiting run_in_process; see the stage timings for its breakdown.
+    """
+
+    def __init__(self, name: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        self.filename = f"{stamp}-{slug}.folded"
+        self.interval = interval_ms / 1000
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._threads: Dict[int, int] = {}  # Thread id -> nesting depth
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+        self.started = None
+        self.elapsed_ms = 0.0
+        self.path = None
+
+    def start(self):
+        """Start sampling; call from the request's task"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.current_task()
+        self.started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+
+    def add_thread(self, thread_id: int):
+        with self._threads_lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+
+    def remove_thread(self, thread_id: int):
+        with self._threads_lock:
+            self._threads[thread_id] -= 1
+            if not self._threads[thread_id]:
+                del self._threads[thread_id]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._threads_lock:
+            threads = list(self._threads)
+        if asyncio.current_task(self._loop) is self._task:
+            threads.append(self._loop_thread)
+        for thread_id in threads:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+        self.sample_count += 1
+
+    def write(self, directory: str = PROFILE_DIR) -> str:
+        """
+        Save the profile as a folded-stacks file
+
+        Returns:
+            Path of the written file (load it in speedscope, or render with
+            flamegraph.pl)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, self.filename)
+        with open(self.path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return self.path
+
+
+@asynccontextmanager
+async def profile_request(name: str):
+    """Profile the rest of the current request and save it on the thread pool (see RequestProfile)"""
+    from app.services import workers  # workers imports this module
+
+    profile = RequestProfile(name)
+    token = _active_profile.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _active_profile.reset(token)
+        await workers.run_in_thread(profile.write)
+
+
+@contextmanager
+def attribute_thread():
+    """Sample this thread as part of the current request's profile, if one is active"""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profile.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        profile.remove_thread(thread_id)
+
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[Dict]:
+    """Saved profiles, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(".folded"):
+            stat = os.stat(os.path.join(directory, name))
+            profiles.append({
+                "name": name,
+                "bytes": stat.st_size,
+                "created_at": datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+            })
+    return sorted(profiles, key=lambda profile: profile["name"], reverse=True)
@@ -0,0 +1,493 @@
+import os
+import re
+import string
+import threading
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# Receipts whose amount, date and vendor are all at least this confident are
+# parsed locally and never sent to an LLM (above 1 always uses the LLM)
+LOCAL_PARSE_THRESHOLD = float(os.getenv("LOCAL_PARSE_THRESHOLD", 0.85))
+
+# Fields that must clear the threshold for a local parse to be used
+REQUIRED_FIELDS = ("amount", "date", "vendor")
+
+# Lines at the top of the receipt searched for the vendor
+VENDOR_SEARCH_LINES = 6
+
+# Money: 12.34, 1,234.56, 1.234,56 (not percentages or pieces of dates)
+AMOUNT_PATTERN = re.compile(
+    r"(?<![\d.,/:-])(?P<int>\d{1,3}(?:(?P<sep>[,.'])\d{3})+|\d+)(?P<dec>[.,])(?P<frac>\d{2})(?![.,]?\d)(?!\s?%)"
+)
+PERCENT_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s?%")
+
+# Total labels, strongest first; the weak ones only count without a strong one
+TOTAL_LABELS = [
+    (re.compile(r"\b(grand\s+total|total\s+due|amount\s+due|balance\s+due|total\s+amount|amount\s+payable|"
+                r"total\s+to\s+pay|total\s+sale)\b", re.IGNORECASE), 0.85),
+    (re.compile(r"\btotal\b", re.IGNORECASE), 0.8),
+    (re.compile(r"\b(amount|balance|to\s+pay)\b", re.IGNORECASE), 0.5)
+]
+NOT_TOTAL_PATTERN = re.compile(
+    r"sub\s?-?\s?total|total\s+(tax|vat|savings?|discount|items?|qty|quantity|tip)|(tax|vat)\s+total|"
+    r"\b(cash|change|tendered|tip|gratuity)\b",
+    re.IGNORECASE
+)
+SUBTOTAL_PATTERN = re.compile(r"\bsub\s?-?\s?total\b", re.IGNORECASE)
+TAX_PATTERN = re.compile(r"\b(sales\s+tax|tax|vat|gst|hst|pst|qst)\b", re.IGNORECASE)
+NOT_TAX_PATTERN = re.compile(r"\b(tax\s*(id|no|number|invoice|exempt)|taxable|pre-?tax|vat\s*(no|reg|number))\b",
+                             re.IGNORECASE)
+TIP_PATTERN = re.compile(r"\b(tip|gratuity|service\s+charge)\b", re.IGNORECASE)
+TENDER_PATTERN = re.compile(r"\b(cash|change|tendered|paid)\b", re.IGNORECASE)
+
+MONTHS = {name: index for index, names in enumerate(
+    [("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",), ("jun", "june"),
+     ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"), ("oct", "october"),
+     ("nov", "november"), ("dec", "december")], 1) for name in names}
+_MONTH = r"(?P<month>" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?"
+DATE_PATTERNS = [
+    # (pattern, kind): iso is year first, name spells the month, numeric may be day or month first
+    (re.compile(r"\b(?P<year>(?:19|20)\d{2})[-/.](?P<a>\d{1,2})[-/.](?P<b>\d{1,2})\b"), "iso"),
+    (re.compile(r"\b(?P<day>\d{1,2})(?:st|nd|rd|th)?[\s-]+" + _MONTH + r",?[\s-]+(?P<year>\d{2,4})\b",
+                re.IGNORECASE), "name"),
+    (re.compile(r"\b" + _MONTH + r"\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<year>\d{4})\b", re.IGNORECASE),
+     "name"),
+    (re.compile(r"(?<![\d.])(?P<a>\d{1,2})(?P<sep>[/.-])(?P<b>\d{1,2})(?P=sep)(?P<year>\d{2}|\d{4})(?![\d.])"),
+     "numeric")
+]
+DATE_LABEL_PATTERN = re.compile(r"\b(date|dated|issued)\b", re.IGNORECASE)
+# Dates that are not when the purchase was made ("Due date", "Valid until", card expiry)
+NOT_PURCHASE_DATE_PATTERN = re.compile(
+    r"\b(due|pay\s+by|expir\w*|exp|valid\s+(until|thru|through|to)|best\s+before|use\s+by|next\s+\w+\s+date)\b",
+    re.IGNORECASE
+)
+
+CURRENCY_CODES = {"USD", "EUR", "GBP", "CAD", "AUD", "NZD", "CHF", "JPY", "INR", "SGD", "MXN"}
+CURRENCY_SYMBOLS = [("CA$", "CAD"), ("C$", "CAD"), ("AU$", "AUD"), ("A$", "AUD"), ("NZ$", "NZD"),
+                    ("€", "EUR"), ("£", "GBP"), ("¥", "JPY"), ("₹", "INR"), ("$", "USD")]
+CURRENCY_CODE_PATTERN = re.compile(r"\b(" + "|".join(sorted(CURRENCY_CODES)) + r")\b")
+# Currencies whose receipts usually write numeric dates day first
+DAY_FIRST_CURRENCIES = {"EUR", "GBP", "AUD", "NZD", "INR", "SGD", "CHF"}
+
+PAYMENT_PATTERN = re.compile(
+    r"\b(visa|master\s?card|mastercard|amex|american\s+express|discover|debit|credit(?:\s+card)?|"
+    r"cash|apple\s+pay|google\s+pay|paypal|check|cheque)\b",
+    re.IGNORECASE
+)
+
+# Header lines that are not the vendor's name
+NOT_VENDOR_PATTERN = re.compile(
+    r"(www\.|https?:|\.com\b|@|\b(tel|phone|fax|receipt|invoice|order|table|server|cashier|store\s*#|"
+    r"reg(ister)?\s*#?\d|trans(action)?|date|time|welcome)\b)",
+    re.IGNORECASE
+)
+# Street words only count next to a number ("Staple Street Supply" is a name)
+ADDRESS_PATTERN = re.compile(
+    r"^\d+[\s,]+\w+|\d.*\b(street|st|avenue|ave|road|rd|blvd|boulevard|drive|dr|lane|ln|suite|ste|floor)\b|"
+    r"\bp\.?o\.? box\b|,\s*[A-Z]{2}\s+\d{5}|\b\d{5}(-\d{4})?$",
+    re.IGNORECASE
+)
+PHONE_PATTERN = re.compile(r"\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}")
+WELCOME_PATTERN = re.compile(r"^\s*(welcome\s+to|thank\s+you\s+for\s+(shopping|visiting)\s+at)\s+", re.IGNORECASE)
+VENDOR_CHARACTERS = set(string.ascii_letters + string.digits + " &'.,-!/()")
+# A 0, 1, 5 or 8 between letters is usually a misread O, l, S or B ("Te1eCom", "Sh0p")
+MISREAD_LETTER_PATTERN = re.compile(r"[A-Za-z][0158](?=[A-Za-z])")
+
+QUANTITY_PATTERN = re.compile(r"^\s*(\d{1,3})\s*[x@]\s+", re.IGNORECASE)
+
+
+@dataclass
+class ExtractedField:
+    """One extracted value with its confidence (0-1) and the line it came from"""
+    value: Any = None
+    confidence: float = 0.0
+    line: Optional[int] = None
+
+
+@dataclass
+class Extraction:
+    """Fields read from receipt text, each with a confidence score"""
+    fields: Dict[str, ExtractedField] = field(default_factory=dict)
+    line_items: List[Dict] = field(default_factory=list)
+    description: str = ""
+
+    @property
+    def confidence(self) -> float:
+        """Confidence of the whole parse: that of its weakest required field"""
+        return min(self.fields[name].confidence for name in REQUIRED_FIELDS)
+
+    def to_parsed(self) -> Dict:
+        """The fields in the same shape as an LLM parse, plus per-field confidences"""
+        values = {name: f.value for name, f in self.fields.items()}
+        return {
+            "date": values["date"],
+            "amount": values["amount"],
+            "vendor": values["vendor"] or "Unknown",
+            "category": "other",
+            "description": self.description,
+            "line_items": self.line_items,
+            "tax_amount": values["tax_amount"],
+            "currency": values["currency"],
+            "payment_method": values["payment_method"],
+            "confidence": {name: round(f.confidence, 2) for name, f in self.fields.items()}
+        }
+
+
+def _parse_amount(match: re.Match) -> float:
+    integer = match.group("int")
+    if match.group("sep"):
+        if match.group("sep") == match.group("dec"):
+            return None  # 1,234,56: separators do not agree
+        integer = re.sub(r"[,.']", "", integer)
+    return float(f"{integer}.{match.group('frac')}")
+
+
+def _amounts(line: str) -> List[float]:
+    values = [_parse_amount(match) for match in AMOUNT_PATTERN.finditer(line)]
+    return [value for value in values if value is not None]
+
+
+def _close(a: Optional[float], b: Optional[float], tolerance: float = 0.015) -> bool:
+    return a is not None and b is not None and abs(a - b) <= tolerance
+
+
+class ReceiptExtractor:
+    """
+    Rule-based receipt parser with field-level confidence
+
+    Reads the total, subtotal, tax, tip, date, currency, payment method and
+    vendor from OCR text with a small regex/keyword grammar. Each field gets
+    a confidence from how it was found (a "TOTAL DUE" label beats a bare
+    largest amount, an ISO date beats an ambiguous 03/04/24) and from
+    cross-checks between fields (subtotal + tax + tip = total, tax matches
+    the printed rate). Receipts that clear LOCAL_PARSE_THRESHOLD on the
+    amount, date and vendor do not need an LLM.
+
+    Text alone cannot show a misread vendor ("THE JAZ CELLAR"), so when the
+    OCR's per-line confidences are given no field is more confident than
+    the weakest OCR word on the line it was read from.
+    """
+
+    def extract(self, text: str, today: Optional[date] = None,
+                line_confidences: Optional[List[Optional[float]]] = None) -> Extraction:
+        """
+        Extract structured fields from receipt text
+
+        Args:
+            text: Raw OCR text
+            today: Reference date for rejecting future dates (default: today)
+            line_confidences: Lowest OCR word confidence (0-100) of each line
+                of text, None where unknown (OCRResult.line_confidences)
+
+        Returns:
+            Extraction with every field (value None and confidence 0 when not found)
+        """
+        raw_lines = text.splitlines()
+        if not line_confidences or len(line_confidences) != len(raw_lines):
+            line_confidences = [None] * len(raw_lines)
+        lines = []
+        ocr_confidences = []
+        for line, ocr_confidence in zip(raw_lines, line_confidences):
+            line = re.sub(r"\s+", " ", line).strip()
+            if line:
+                lines.append(line)
+                ocr_confidences.append(ocr_confidence)
+
+        currency = self._currency(text)
+        subtotal = self._labelled_amount(lines, SUBTOTAL_PATTERN)
+        tip = self._labelled_amount(lines, TIP_PATTERN)
+        amount = self._total(lines, subtotal)
+        tax = self._tax(lines, subtotal)
+        self._cross_check(amount, subtotal, tax, tip)
+
+        extraction = Extraction(fields={
+            "amount": amount,
+            "subtotal": subtotal,
+            "tax_amount": tax,
+            "tip": tip,
+            "date": self._date(lines, currency.value, today or date.today()),
+            "currency": currency,
+            "vendor": self._vendor(lines),
+            "payment_method": self._payment_method(lines)
+        })
+        for extracted in extraction.fields.values():
+            if extracted.line is not None and ocr_confidences[extracted.line] is not None:
+                extracted.confidence = min(extracted.confidence, ocr_confidences[extracted.line] / 100)
+        extraction.line_items = self._line_items(lines, extraction.fields)
+        extraction.description = self._description(extraction)
+        return extraction
+
+    def _labelled_amount(self, lines: List[str], pattern: re.Pattern) -> ExtractedField:
+        """The amount on the last line matching a label (subtotal, tip)"""
+        for index in range(len(lines) - 1, -1, -1):
+            if pattern.search(lines[index]):
+                amounts = _amounts(lines[index])
+                if amounts:
+                    return ExtractedField(amounts[-1], 0.8, index)
+        return ExtractedField()
+
+    def _total(self, lines: List[str], subtotal: ExtractedField) -> ExtractedField:
+        candidates = []  # (score, index, value)
+        for index, line in enumerate(lines):
+            if NOT_TOTAL_PATTERN.search(line):
+                continue
+            for pattern, score in TOTAL_LABELS:
+                if pattern.search(line):
+                    amounts, amount_line = _amounts(line), index
+                    if not amounts and index + 1 < len(lines):
+                        # Label and amount on separate lines
+                        amounts, amount_line, score = _amounts(lines[index + 1]), index + 1, score - 0.1
+                    if amounts:
+                        candidates.append((score, amount_line, amounts[-1]))
+                    break
+
+        every_amount = [value for index, line in enumerate(lines) if not TENDER_PATTERN.search(line)
+                        for value in _amounts(line)]
+        if not candidates:
+            if not every_amount:
+                return ExtractedField()
+            # No label read: the largest amount is usually the total
+            value = max(every_amount)
+            index = next(i for i, line in enumerate(lines) if value in _amounts(line))
+            return ExtractedField(value, 0.4, index)
+
+        best = max(score for score, _, _ in candidates)
+        # The last of the strongest labels: totals come after subtotals and item lines
+        score, index, value = [c for c in candidates if c[0] == best][-1]
+        confidence = score
+        if len({v for s, _, v in candidates if s == best}) > 1:
+            confidence -= 0.15
+        if every_amount and value < max(every_amount) - 0.005:
+            confidence -= 0.2
+        elif every_amount:
+            confidence += 0.05
+        if subtotal.value is not None and value < subtotal.value - 0.005:
+            confidence -= 0.3
+        return ExtractedField(value, confidence, index)
+
+    def _tax(self, lines: List[str], subtotal: ExtractedField) -> ExtractedField:
+        total = 0.0
+        found = None
+        confidence = 0.75
+        for index, line in enumerate(lines):
+            if not TAX_PATTERN.search(line) or NOT_TAX_PATTERN.search(line) or SUBTOTAL_PATTERN.search(line):
+                continue
+            if re.search(r"\btotal\b", line, re.IGNORECASE) and not re.search(r"total\s+tax|tax\s+total",
+                                                                              line, re.IGNORECASE):
+                continue  # "Total incl. tax" is the total
+            amounts = _amounts(line)
+            if not amounts:
+                continue
+            value = amounts[-1]
+            rate = PERCENT_PATTERN.search(line)
+            if rate and subtotal.value:
+                expected = subtotal.value * float(rate.group(1).replace(",", ".")) / 100
+                confidence = 0.95 if abs(expected - value) <= 0.02 else 0.6
+            total += value
+            found = index if found is None else found
+        if found is None:
+            return ExtractedField()
+        return ExtractedField(round(total, 2), confidence, found)
+
+    def _cross_check(self, amount: ExtractedField, subtotal: ExtractedField, tax: ExtractedField, tip: ExtractedField):
+        """Raise the confidence of fields that add up"""
+        if amount.value is None or subtotal.value is None or amount.line == subtotal.line:
+            return
+        extras = (tax.value or 0) + (tip.value or 0)
+        if _close(subtotal.value + extras, amount.value):
+            amount.confidence = max(amount.confidence, 0.97)
+            subtotal.confidence = max(subtotal.confidence, 0.95)
+            for part in (tax, tip):
+                if part.value is not None:
+                    part.confidence = max(part.confidence, 0.95)
+        elif tax.value is None and not _close(subtotal.value, amount.value):
+            # A total above the subtotal with no tax line: the tax was probably not read
+            tax.confidence = 0.0
+
+    def _date(self, lines: List[str], currency: Optional[str], today: date) -> ExtractedField:
+        candidates = []  # (confidence, index, date)
+        for index, line in enumerate(lines):
+            other_date = bool(NOT_PURCHASE_DATE_PATTERN.search(line))
+            labelled = not other_date and bool(DATE_LABEL_PATTERN.search(line))
+            for pattern, kind in DATE_PATTERNS:
+                for match in pattern.finditer(line):
+                    parsed = self._to_date(match, kind, currency)
+                    if parsed is None:
+                        continue
+                    value, confidence = parsed
+                    if (match.start() and line[match.start() - 1].isalnum()) or \
+                            line[match.end():match.end() + 1].isalpha():
+                        confidence -= 0.2  # Run into other characters: a digit was probably misread
+                    if labelled:
+                        confidence += 0.04
+                    elif other_date:
+                        confidence = min(confidence, 0.5)  # Only if the receipt has no other date
+                    if value > today + timedelta(days=2) or value.year < 2000:
+                        confidence = min(confidence, 0.3)
+                    candidates.append((confidence, index, value))
+        if not candidates:
+            return ExtractedField()
+
+        # Labelled/most certain first, then the earliest line
+        confidence, index, value = max(candidates, key=lambda c: (c[0], -c[1]))
+        if len({c[2] for c in candidates if c[0] >= confidence - 0.1}) > 1:
+            confidence -= 0.15  # Several plausible dates
+        return ExtractedField(value.isoformat(), min(confidence, 0.99), index)
+
+    @staticmethod
+    def _to_date(match: re.Match, kind: str, currency: Optional[str]) -> Optional[Tuple[date, float]]:
+        """Build a date from a pattern match, with the confidence of reading it this way"""
+        groups = match.groupdict()
+        year = int(groups["year"])
+        confidence = 0.95
+        if year < 100:
+            year += 2000
+            confidence -= 0.05
+
+        if kind in ("iso", "numeric"):
+            a, b = groups["a"], groups["b"]
+            if len(a) != len(b) and "0" in (a[0], b[0]):
+                confidence -= 0.2  # "08/1/2024": a zero-padded date with a digit lost
+
+        if kind == "iso":
+            month, day = int(groups["a"]), int(groups["b"])
+        elif kind == "name":
+            month, day = MONTHS[groups["month"].lower()], int(groups["day"])
+            confidence -= 0.02
+        else:
+            a, b = int(groups["a"]), int(groups["b"])
+            if a > 12:
+                day, month = a, b
+            elif b > 12:
+                month, day = a, b
+            elif a == b:
+                month = day = a
+            else:
+                # Ambiguous: follow the receipt's locale, as far as the currency tells
+                day_first = currency in DAY_FIRST_CURRENCIES or (currency is None and groups["sep"] == ".")
+                month, day = (b, a) if day_first else (a, b)
+                confidence -= 0.07 if currency else 0.2
+        try:
+            return date(year, month, day), confidence
+        except ValueError:
+            return None
+
+    def _currency(self, text: str) -> ExtractedField:
+        codes = CURRENCY_CODE_PATTERN.findall(text)
+        if codes:
+            return ExtractedField(max(set(codes), key=codes.count), 0.97)
+        for symbol, code in CURRENCY_SYMBOLS:
+            if symbol in text:
+                # "$" alone could be any dollar
+                return ExtractedField(code, 0.8 if symbol == "$" else 0.95)
+        return ExtractedField()
+
+    def _vendor(self, lines: List[str]) -> ExtractedField:
+        for index, line in enumerate(lines[:VENDOR_SEARCH_LINES]):
+            name = WELCOME_PATTERN.sub("", line)
+            if name == line and NOT_VENDOR_PATTERN.search(line):
+                continue
+            if ADDRESS_PATTERN.search(name) or PHONE_PATTERN.search(name) or _amounts(name):
+                continue
+            if any(pattern.search(name) for pattern, _ in DATE_PATTERNS):
+                continue
+            letters = sum(char.isalpha() for char in name)
+            if letters < 3:
+                continue
+
+            confidence = 0.92 - 0.08 * index
+            if letters / len(name.replace(" ", "")) < 0.7:
+                confidence -= 0.3
+            if sum(char in VENDOR_CHARACTERS for char in name) / len(name) < 0.95:
+                confidence -= 0.25  # OCR noise
+            if MISREAD_LETTER_PATTERN.search(name):
+                confidence -= 0.25
+            name = name.strip(" .,:;-*=#")
+            if name.isupper():
+                name = string.capwords(name)
+            return ExtractedField(name[:100], max(confidence, 0.1), index)
+        return ExtractedField()
+
+    def _payment_method(self, lines: List[str]) -> ExtractedField:
+        for index in range(len(lines) - 1, -1, -1):
+            match = PAYMENT_PATTERN.search(lines[index])
+            if match:
+                return ExtractedField(re.sub(r"\s+", " ", match.group(1).lower()), 0.8, index)
+        return ExtractedField()
+
+    def _line_items(self, lines: List[str], fields: Dict[str, ExtractedField]) -> List[Dict]:
+        """Priced lines between the header and the first subtotal/total/tax line"""
+        start = max((f.line for f in (fields["vendor"], fields["date"]) if f.line is not None), default=-1) + 1
+        ends = [f.line for f in (fields["subtotal"], fields["amount"], fields["tax_amount"]) if f.line is not None]
+        end = min(ends) if ends else len(lines)
+
+        items = []
+        for line in lines[start:end]:
+            matches = list(AMOUNT_PATTERN.finditer(line))
+            if not matches or TOTAL_LABELS[1][0].search(line) or TAX_PATTERN.search(line):
+                continue
+            description = line[:matches[-1].start()].strip(" .:$€£-*")
+            if sum(char.isalpha() for char in description) < 2:
+                continue
+            quantity = 1
+            count = QUANTITY_PATTERN.match(description)
+            if count:
+                quantity = int(count.group(1))
+                description = description[count.end():]
+            items.append({"description": description, "quantity": quantity,
+                          "amount": _parse_amount(matches[-1])})
+        return items
+
+    @staticmethod
+    def _description(extraction: Extraction) -> str:
+        vendor = extraction.fields["vendor"].value or "Unknown vendor"
+        names = [item["description"] for item in extraction.line_items[:3]]
+        if len(extraction.line_items) > 3:
+            names.append(f"{len(extraction.line_items) - 3} more")
+        return f"{vendor}: {', '.join(names)}" if names else f"Purchase at {vendor}"
+
+
+class RoutingStats:
+    """How receipt parses were served: locally, from the parse cache, by an LLM or by the fallback"""
+
+    ROUTES = ("local", "cache", "claude", "openai", "fallback")
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.ROUTES, 0)
+        self._confidence_sum = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, route: str, confidence: float):
+        """
+        Count one parse
+
+        Args:
+            route: One of ROUTES
+            confidence: Local extraction confidence of the receipt (whatever served it)
+        """
+        with self._lock:
+            self._counts[route] += 1
+            self._confidence_sum += confidence
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def snapshot(self) -> Dict:
+        """Parses per route, the share served without an LLM call and the mean local confidence"""
+        with self._lock:
+            counts = dict(self._counts)
+            confidence_sum = self._confidence_sum
+        total = sum(counts.values())
+        return {
+            "threshold": LOCAL_PARSE_THRESHOLD,
+            "total": total,
+            "routes": counts,
+            "local_rate": round(counts["local"] / total, 4) if total else 0.0,
+            "llm_rate": round((counts["claude"] + counts["openai"]) / total, 4) if total else 0.0,
+            "mean_local_confidence": round(confidence_sum / total, 4) if total else 0.0
+        }
+
+
+routing_stats = RoutingStats()
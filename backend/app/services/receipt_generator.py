@@ -0,0 +1,386 @@
+"""
+Synthetic receipt corpus with ground-truth labels
+
+Generates varied receipts (vendor, address, date format, line items, tax,
+tip, payment, font, size, layout; utility bills also print a due date),
+optionally photographed with the DemoScanner distortions (angle, shadow,
+cluttered background). Each image gets a JSON sidecar with the labels the
+parser should recover (vendor, date, amount, category) plus the full text
+for OCR accuracy checks.
+
+Every document is generated from its own seed (derived from the corpus
+seed and its index), so a corpus is identical however many processes
+build it. Fonts are picked from the TrueType files installed on the
+machine (sorted by path), so corpora match across runs on the same
+machine; set RECEIPT_FONT_DIR to pin them across machines.
+
+Usage (from backend/):
+    python -m app.services.receipt_generator ./corpus --count 5000 --seed 7
+    python -m app.services.receipt_generator ./corpus --count 200 --workers 4 --distortion-rate 0
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from app.services.category_classifier import CATEGORIES as CLASSIFIER_CATEGORIES
+from app.services.demo_scanner import DemoScanner
+
+# Categories the parsers and AIService.categorize_locally assign
+CATEGORIES = CLASSIFIER_CATEGORIES + ["other"]
+
+# Category -> vendors and (item, min price, max price) catalogue
+CATALOGUE: Dict[str, Dict] = {
+    "meals": {
+        "vendors": ["Blue Fern Bistro", "Corner Deli", "Golden Wok", "Luigi's Trattoria", "Daily Grind Cafe",
+                    "Sakura Sushi Bar", "Harbor Grill", "Taco Loco"],
+        "items": [("Cappuccino", 3.5, 5.5), ("Club Sandwich", 9, 14), ("Caesar Salad", 8, 13),
+                  ("Margherita Pizza", 12, 18), ("Pad Thai", 11, 16), ("Soup of the Day", 5, 8),
+                  ("Iced Tea", 2.5, 4), ("Cheesecake", 6, 9), ("Burrito Bowl", 10, 14), ("Espresso", 2.5, 4)]
+    },
+    "travel": {
+        "vendors": ["Metro Cab Co", "Skyline Airways", "Grand Plaza Hotel", "QuickPark Garage",
+                    "Coastal Rail", "Shell Station 114", "Budget Car Rental"],
+        "items": [("Airport Transfer", 35, 90), ("Room Night", 110, 320), ("Parking 1 Day", 15, 45),
+                  ("Unleaded Fuel", 30, 85), ("Baggage Fee", 30, 60), ("Rail Ticket", 20, 140),
+                  ("Toll Charge", 3, 15), ("Resort Fee", 20, 45)]
+    },
+    "office_supplies": {
+        "vendors": ["Staple Street Supply", "Paper Trail Co", "OfficeHub", "Desk & Drawer", "Ink Depot"],
+        "items": [("Printer Paper", 6, 12), ("Ballpoint Pens 12pk", 4, 9), ("Toner Cartridge", 45, 120),
+                  ("Sticky Notes", 3, 7), ("Binder 2in", 5, 11), ("Desk Lamp", 18, 45),
+                  ("USB Flash Drive", 8, 25), ("Stapler", 7, 19), ("Notebook", 3, 8)]
+    },
+    "utilities": {
+        "vendors": ["City Water Dept", "Bright Power Electric", "FiberNet Internet", "Metro Gas Co",
+                    "TeleCom Mobile"],
+        "items": [("Monthly Service", 40, 150), ("Usage Charge", 20, 120), ("Line Rental", 10, 30),
+                  ("Equipment Fee", 5, 15), ("Late Fee", 5, 25)]
+    },
+    "entertainment": {
+        "vendors": ["Starlight Cinema", "Riverside Bowling", "The Jazz Cellar", "Arcadia Games",
+                    "City Museum Shop"],
+        "items": [("Movie Ticket", 11, 18), ("Popcorn Large", 6, 10), ("Lane Rental", 20, 45),
+                  ("Cover Charge", 10, 25), ("Cocktail", 9, 15), ("Exhibit Pass", 15, 30)]
+    },
+    "healthcare": {
+        "vendors": ["Wellness Pharmacy", "CareFirst Clinic", "Bright Smile Dental", "Vision Plus Optical"],
+        "items": [("Prescription", 10, 80), ("Office Visit Copay", 20, 50), ("Vitamins", 8, 25),
+                  ("First Aid Kit", 12, 30), ("Dental Cleaning", 80, 160), ("Contact Lenses", 40, 120)]
+    },
+    "other": {
+        "vendors": ["Hometown Hardware", "Green Thumb Garden", "QuickShip Post", "Fresh Mart"],
+        "items": [("Shipping Label", 5, 40), ("Potting Soil", 6, 15), ("Light Bulbs 4pk", 6, 14),
+                  ("Cleaning Supplies", 8, 25), ("Batteries AA 8pk", 7, 15), ("Duct Tape", 4, 9)]
+    }
+}
+
+STREETS = ["Main St", "Oak Ave", "Market St", "2nd Ave", "Elm St", "Harbor Blvd", "Park Rd", "Lake Dr"]
+CITIES = [("Springfield", "IL"), ("Portland", "OR"), ("Austin", "TX"), ("Columbus", "OH"),
+          ("Madison", "WI"), ("Denver", "CO"), ("Raleigh", "NC"), ("Fresno", "CA")]
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%d %b %Y", "%b %d, %Y", "%m-%d-%y"]
+DUE_DAYS = [14, 21, 30]
+TOTAL_LABELS = ["TOTAL", "Total", "TOTAL DUE", "Amount Due", "BALANCE DUE"]
+PAYMENTS = ["VISA **** {card}", "MASTERCARD **** {card}", "AMEX **** {card}", "CASH", "DEBIT **** {card}"]
+FOOTERS = ["Thank you!", "Thank you for your business", "Please come again", "Keep this receipt",
+           "Returns accepted within 30 days"]
+
+FONT_DIRS = [
+    os.getenv("RECEIPT_FONT_DIR", ""),
+    "/usr/share/fonts", "/usr/local/share/fonts", "/System/Library/Fonts", "/Library/Fonts", "C:/Windows/Fonts"
+]
+
+START_DATE = date(2023, 1, 1)
+DATE_RANGE_DAYS = 3 * 365
+
+# Receipt line: (left text, right-aligned text), or (text, None) to centre it
+Line = Tuple[str, Optional[str]]
+
+
+def find_fonts() -> List[str]:
+    """TrueType fonts available for rendering, in a stable order"""
+    for directory in FONT_DIRS:
+        if directory and os.path.isdir(directory):
+            fonts = sorted(
+                path for path in glob.glob(os.path.join(directory, "**", "*.tt[fc]"), recursive=True)
+                # Symbol fonts render receipts unreadable
+                if not any(skip in os.path.basename(path).lower() for skip in ("symbol", "emoji", "wingding"))
+            )
+            if fonts:
+                return fonts
+    return []
+
+
+def _money(cents: int) -> str:
+    return f"${cents / 100:,.2f}"
+
+
+def make_receipt(rng: random.Random) -> Dict:
+    """
+    Draw the contents of one receipt
+
+    Returns:
+        Labels (vendor, date, amount, category, ...) and the text lines
+    """
+    category = rng.choice(CATEGORIES)
+    catalogue = CATALOGUE[category]
+    vendor = rng.choice(catalogue["vendors"])
+    city, state = rng.choice(CITIES)
+    receipt_date = START_DATE + timedelta(days=rng.randrange(DATE_RANGE_DAYS))
+
+    items = []
+    for name, low, high in rng.sample(catalogue["items"], rng.randint(1, min(6, len(catalogue["items"])))):
+        quantity = 1 if rng.random() < 0.7 else rng.randint(2, 4)
+        unit_cents = int(rng.uniform(low, high) * 100)
+        items.append({"name": name, "quantity": quantity, "unit_price": unit_cents / 100,
+                      "amount": quantity * unit_cents / 100})
+
+    subtotal = sum(int(round(item["amount"] * 100)) for item in items)
+    tax_rate = rng.choice([0, 0.05, 0.0625, 0.07, 0.0825, 0.1])
+    tax = int(round(subtotal * tax_rate))
+    tip = int(round(subtotal * rng.choice([0.15, 0.18, 0.2]))) if category == "meals" and rng.random() < 0.5 else 0
+    total = subtotal + tax + tip
+
+    lines: List[Line] = [
+        (vendor.upper() if rng.random() < 0.5 else vendor, None),
+        (f"{rng.randint(10, 9999)} {rng.choice(STREETS)}", None),
+        (f"{city}, {state} {rng.randint(10000, 99999)}", None),
+        ("", None)
+    ]
+    date_format = rng.choice(DATE_FORMATS)
+    if category == "utilities":
+        # Bills carry a due date after the invoice date; only the invoice date is the label
+        due_date = receipt_date + timedelta(days=rng.choice(DUE_DAYS))
+        lines.append((f"Invoice date: {receipt_date.strftime(date_format)}", None))
+        lines.append((f"Due date: {due_date.strftime(date_format)}", None))
+    else:
+        lines.append((f"Date: {receipt_date.strftime(date_format)}",
+                      f"{rng.randint(7, 22):02d}:{rng.randint(0, 59):02d}"))
+    lines.append((f"Receipt #{rng.randint(1000, 999999)}", None if rng.random() < 0.5 else f"Reg {rng.randint(1, 9)}"))
+    lines.append(("", None))
+    for item in items:
+        label = item["name"] if item["quantity"] == 1 else f"{item['quantity']} x {item['name']}"
+        lines.append((label, _money(int(round(item["amount"] * 100)))))
+    lines.append(("", None))
+    lines.append(("Subtotal", _money(subtotal)))
+    if tax:
+        lines.append((f"Tax {tax_rate * 100:g}%", _money(tax)))
+    if tip:
+        lines.append(("Tip", _money(tip)))
+    lines.append((rng.choice(TOTAL_LABELS), _money(total)))
+    lines.append(("", None))
+    lines.append((rng.choice(PAYMENTS).format(card=rng.randint(1000, 9999)), None))
+    lines.append((rng.choice(FOOTERS), None))
+
+    return {
+        "vendor": vendor,
+        "date": receipt_date.isoformat(),
+        "amount": total / 100,
+        "category": category,
+        "subtotal": subtotal / 100,
+        "tax": tax / 100,
+        "tip": tip / 100,
+        "currency": "USD",
+        "items": items,
+        "text": [" ".join(part for part in line if part) for line in lines if line[0]],
+        "lines": lines
+    }
+
+
+def render_receipt(lines: List[Line], rng: random.Random, fonts: List[str]) -> Tuple[np.ndarray, Dict]:
+    """
+    Render receipt lines with a random font, size, width and margins
+
+    Returns:
+        BGR image and the rendering parameters
+    """
+    font_path = rng.choice(fonts) if fonts else None
+    font_size = rng.randint(18, 34)
+    if font_path:
+        font = ImageFont.truetype(font_path, font_size)
+    else:
+        font = ImageFont.load_default()
+    line_height = int(font_size * rng.uniform(1.25, 1.6))
+    margin = rng.randint(20, 60)
+
+    draw_probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+    widest = max(
+        draw_probe.textlength(left, font=font) + (draw_probe.textlength(right, font=font) + 40 if right else 0)
+        for left, right in lines
+    )
+    width = int(max(widest + 2 * margin, rng.randint(450, 900)))
+    height = line_height * len(lines) + 2 * margin
+
+    paper = rng.randint(238, 255)
+    ink = rng.randint(0, 50)
+    image = Image.new("L", (width, height), color=paper)
+    draw = ImageDraw.Draw(image)
+    y = margin
+    for left, right in lines:
+        if right is None:
+            x = (width - draw.textlength(left, font=font)) / 2
+            draw.text((x, y), left, fill=ink, font=font)
+        else:
+            draw.text((margin, y), left, fill=ink, font=font)
+            draw.text((width - margin - draw.textlength(right, font=font), y), right, fill=ink, font=font)
+        y += line_height
+
+    render = {"font": os.path.basename(font_path) if font_path else "default", "font_size": font_size,
+              "width": width, "height": height}
+    return cv2.cvtColor(np.array(image), cv2.COLOR_GRAY2BGR), render
+
+
+def distort(image: np.ndarray, rng: random.Random, rate: float, demo: DemoScanner) -> Tuple[np.ndarray, Dict]:
+    """
+    Apply the DemoScanner distortions, each with probability `rate`
+
+    Returns:
+        Distorted image and the distortions applied
+    """
+    applied = {}
+    if rng.random() < rate:
+        applied["angle"] = round(rng.uniform(-30, 30), 1)
+        image = demo.create_angled_document(image, applied["angle"])
+    if rng.random() < rate:
+        applied["shadow"] = True
+        image = demo.add_shadow(image)
+    if rng.random() < rate:
+        applied["background"] = True
+        # add_background draws from numpy's global generator; seed it per document
+        np.random.seed(rng.randrange(2 ** 32))
+        image = demo.add_background(image)
+    return image, applied
+
+
+def document_seed(seed: int, index: int) -> str:
+    return f"{seed}:{index}"
+
+
+def generate_document(index: int, seed: int, output_dir: str, distortion_rate: float = 0.7,
+                      fonts: Optional[List[str]] = None) -> Dict:
+    """
+    Generate one receipt image and its JSON sidecar
+
+    Args:
+        index: Position in the corpus (with seed, fixes the document)
+        seed: Corpus seed
+        output_dir: Directory for receipt_<index>.{png,jpg,json}
+        distortion_rate: Probability of each distortion
+        fonts: Font files to choose from (default: find_fonts())
+
+    Returns:
+        The sidecar labels
+    """
+    rng = random.Random(document_seed(seed, index))
+    receipt = make_receipt(rng)
+    image, render = render_receipt(receipt.pop("lines"), rng, find_fonts() if fonts is None else fonts)
+    image, distortions = distort(image, rng, distortion_rate, _get_demo())
+
+    # Photos are JPEG like phone uploads; flat scans PNG
+    extension = ".jpg" if distortions else ".png"
+    name = f"receipt_{index:06d}"
+    params = [cv2.IMWRITE_JPEG_QUALITY, rng.randint(70, 95)] if extension == ".jpg" else []
+    cv2.imwrite(os.path.join(output_dir, name + extension), image, params)
+
+    labels = {
+        "file": name + extension,
+        "index": index,
+        "seed": document_seed(seed, index),
+        **receipt,
+        "render": render,
+        "distortions": distortions
+    }
+    with open(os.path.join(output_dir, name + ".json"), "w") as f:
+        json.dump(labels, f, indent=2)
+    return labels
+
+
+_demo = None
+
+
+def _get_demo() -> DemoScanner:
+    """One DemoScanner per process"""
+    global _demo
+    if _demo is None:
+        _demo = DemoScanner()
+    return _demo
+
+
+def _generate_chunk(indices: List[int], seed: int, output_dir: str, distortion_rate: float,
+                    fonts: List[str]) -> List[Dict]:
+    return [generate_document(index, seed, output_dir, distortion_rate, fonts) for index in indices]
+
+
+def generate_corpus(output_dir: str, count: int, seed: int = 0, workers: Optional[int] = None,
+                    distortion_rate: float = 0.7, start: int = 0, chunk_size: int = 25) -> str:
+    """
+    Generate a corpus in parallel
+
+    Args:
+        output_dir: Destination directory
+        count: Number of receipts
+        seed: Corpus seed; the same seed, count and start give the same corpus
+        workers: Processes (default: CPU count; 0 generates in this process)
+        distortion_rate: Probability of each distortion per receipt
+        start: First index, to extend an existing corpus
+        chunk_size: Receipts per task
+
+    Returns:
+        Path of labels.jsonl, one sidecar per line in index order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    fonts = find_fonts()  # Found once so every worker picks from the same list
+    indices = list(range(start, start + count))
+    chunks = [indices[i:i + chunk_size] for i in range(0, len(indices), chunk_size)]
+
+    if workers == 0:
+        results = [_generate_chunk(chunk, seed, output_dir, distortion_rate, fonts) for chunk in chunks]
+    else:
+        # Spawn like the OCR pool: fork after OpenCV has started threads can deadlock
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_generate_chunk, chunk, seed, output_dir, distortion_rate, fonts) for chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+
+    manifest = os.path.join(output_dir, "labels.jsonl")
+    with open(manifest, "a" if start else "w") as f:
+        for chunk in results:
+            for labels in chunk:
+                f.write(json.dumps({key: labels[key] for key in (
+                    "file", "vendor", "date", "amount", "category"
+                )}) + "\n")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count, 0 = no pool)")
+    parser.add_argument("--distortion-rate", type=float, default=0.7,
+                        help="Probability of each of angle, shadow and background")
+    parser.add_argument("--start", type=int, default=0, help="First index (to extend a corpus)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manifest = generate_corpus(args.output_dir, args.count, args.seed, args.workers,
+                               args.distortion_rate, args.start)
+    elapsed = time.perf_counter() - started
+    print(f"Generated {args.count} receipts in {elapsed:.1f}s ({args.count / elapsed:.1f}/s): {manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.services.memory_tracing import measure
+from app.services.metrics import collect_trace, record_stages, stage_timer
+from app.services.profiler import PROFILING_ENABLED, attribute_thread
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing. OCR_PROCESS_WORKERS=0 runs the CPU-bound stages on the thread
+# pool instead (useful for local development and constrained containers).
+OCR_PROCESS_WORKERS = int(os.getenv("OCR_PROCESS_WORKERS", os.cpu_count() or 1))
+AI_THREAD_WORKERS = int(os.getenv("AI_THREAD_WORKERS", 8))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+# Tasks submitted to each pool and not yet finished (queued or running)
+_pending = {"process": 0, "thread": 0}
+_pending_lock = threading.Lock()
+
+# Per-process service instances used by the pool workers
+_worker_ocr_service = None
+_worker_duplicate_index = None
+_worker_duplicate_index_lock = threading.Lock()
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared process pool, creating it on first use"""
+    global _process_pool
+    if OCR_PROCESS_WORKERS <= 0:
+        return None
+    if _process_pool is None:
+        # Spawn rather than fork: the API process runs threads (thread pool,
+        # HTTP clients) and forking a threaded process can deadlock children.
+        _process_pool = ProcessPoolExecutor(
+            max_workers=OCR_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Started OCR process pool with {OCR_PROCESS_WORKERS} workers")
+    return _process_pool
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Return the shared thread pool for blocking I/O such as upload reads"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=AI_THREAD_WORKERS,
+            thread_name_prefix="ai-worker"
+        )
+    return _thread_pool
+
+
+async def run_in_process(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a CPU-bound function on the process pool without blocking the event loop
+
+    Stage timings (and memory, when tracing) recorded in the worker are
+    returned with the result and added to the caller's trace (see
+    app.services.metrics).
+
+    Args:
+        func: Module-level (picklable) function to run
+        *args, **kwargs: Arguments passed to the function
+
+    Returns:
+        The function's return value
+    """
+    global _process_pool
+    pool = get_process_pool()
+    if pool is None:
+        return await run_in_thread(func, *args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    _track("process", 1)
+    try:
+        result, stages, memory = await loop.run_in_executor(pool, partial(_traced, func, args, kwargs))
+        record_stages(stages, memory)
+        return result
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); replace the pool so later
+        # requests are not all failed by this one document.
+        logger.error("OCR process pool broke, restarting it")
+        _process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        _track("process", -1)
+
+
+async def run_in_thread(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking function on the shared thread pool
+
+    The function runs in a copy of the caller's context, so stage timings
+    land in the caller's trace (and its samples in the request's profile,
+    see app.services.profiler).
+
+    Args:
+        func: Function to run
+        *args, **kwargs: Arguments passed to the function
+
+    Returns:
+        The function's return value
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    if PROFILING_ENABLED:
+        task = partial(context.run, _attributed, func, args, kwargs)
+    else:
+        task = partial(context.run, func, *args, **kwargs)
+    _track("thread", 1)
+    try:
+        return await loop.run_in_executor(get_thread_pool(), task)
+    finally:
+        _track("thread", -1)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Size and backlog of each worker pool
+
+    Returns:
+        Per pool ("process", "thread"): workers, pending (submitted and not
+        finished) and queued (pending tasks waiting for a free worker).
+        With OCR_PROCESS_WORKERS=0 process tasks count against the thread pool.
+    """
+    with _pending_lock:
+        pending = dict(_pending)
+    workers = {
+        "process": max(OCR_PROCESS_WORKERS, 0),
+        "thread": AI_THREAD_WORKERS
+    }
+    return {
+        name: {
+            "workers": workers[name],
+            "pending": pending[name],
+            "queued": max(pending[name] - workers[name], 0)
+        }
+        for name in pending
+    }
+
+
+def shutdown_pools():
+    """Shut down the worker pools (called on application shutdown)"""
+    global _process_pool, _thread_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+
+
+def _track(pool: str, delta: int):
+    with _pending_lock:
+        _pending[pool] += delta
+
+
+def _attributed(func: Callable, args: Tuple, kwargs: Dict) -> Any:
+    """Run a thread pool task as part of the calling request's profile"""
+    with attribute_thread():
+        return func(*args, **kwargs)
+
+
+def _traced(func: Callable, args: Tuple, kwargs: Dict) -> Tuple[Any, Dict[str, float], Dict[str, Dict]]:
+    """Run a task in the worker process, returning its result, stage timings and stage memory"""
+    with collect_trace() as trace:
+        with measure() as usage:
+            result = func(*args, **kwargs)
+        if usage is not None:
+            # The whole task, including what the stages don't cover (e.g. unpickling)
+            trace.add_memory(f"worker.{func.__name__}", usage.peak_bytes, usage.net_bytes, not usage.exact_peak)
+    return result, trace.stages, trace.memory
+
+
+def _get_worker_ocr_service():
+    """Lazily create the OCR service inside the worker process"""
+    global _worker_ocr_service
+    if _worker_ocr_service is None:
+        from app.services.ocr_service import OCRService
+        _worker_ocr_service = OCRService()
+    return _worker_ocr_service
+
+
+def extract(file_path: str):
+    """
+    Worker task: scan and OCR a document
+
+    Args:
+        file_path: Path to the stored upload
+
+    Returns:
+        OCRResult for the document
+    """
+    return _get_worker_ocr_service().extract(file_path)
+
+
+def scan_document(source: Union[str, bytes]) -> Tuple[Optional[Any], Optional[str], Dict]:
+    """
+    Worker task: scan an image and compute its perceptual hash
+
+    Args:
+        source: Path to the stored image, or the encoded upload bytes
+            (decoded in memory, no disk round-trip)
+
+    Returns:
+        Tuple of (scanned image array or None, hex perceptual hash or None,
+        scanner report)
+    """
+    from app.services.perceptual_hash import dhash, hash_to_hex
+
+    report = {}
+    scanned = _get_worker_ocr_service().scanner.scan_document(source, report)
+    if scanned is None:
+        return None, None, report
+    return scanned, hash_to_hex(dhash(scanned)), report
+
+
+def _get_worker_duplicate_index():
+    """Lazily create the near-duplicate index inside the worker process (it stays resident)"""
+    global _worker_duplicate_index
+    with _worker_duplicate_index_lock:
+        if _worker_duplicate_index is None:
+            from app.services.perceptual_hash import NearDuplicateIndex
+            _worker_duplicate_index = NearDuplicateIndex()
+        return _worker_duplicate_index
+
+
+def scan_and_extract(source: Union[str, bytes], digest: Optional[str] = None,
+                     user_id: Optional[int] = None) -> Tuple[Optional[str], List[Tuple[int, int]], Optional[Any]]:
+    """
+    Worker task: scan an image, look it up among near-duplicates and OCR it unless one matches
+
+    Scanning, hashing and OCR happen in one call, so the upload bytes cross
+    the process boundary once and the scanned image never does. The lookup
+    uses this worker's resident NearDuplicateIndex, which only reads the
+    user's documents added since its last lookup.
+
+    Args:
+        source: Path to the stored image, or the encoded upload bytes
+        digest: SHA-256 of the image bytes, if already known
+        user_id: Owner whose documents are searched, or None to skip the lookup
+
+    Returns:
+        Tuple of (hex perceptual hash or None, (distance, document id)
+        matches sorted by distance, OCRResult or None if there were matches)
+    """
+    scanned, phash, report = scan_document(source)
+    if phash and user_id is not None:
+        with stage_timer("upload.near_duplicate_lookup"):
+            matches = _get_worker_duplicate_index().matches(user_id, phash)
+        if matches:
+            return phash, matches, None
+    return phash, [], extract_from_scan(source, scanned, digest, report)
+
+
+def extract_from_scan(source: Union[str, bytes], scanned: Optional[Any], digest: Optional[str] = None,
+                      scan_report: Optional[Dict] = None):
+    """
+    Worker task: OCR an image that has already been scanned
+
+    Args:
+        source: Path to the stored image, or the encoded upload bytes
+        scanned: Output of scan_document, or None to scan again
+        digest: SHA-256 of the image bytes, if already known
+        scan_report: Scanner report returned with scanned
+
+    Returns:
+        OCRResult for the image
+    """
+    return _get_worker_ocr_service().extract_from_image(source, scanned, digest, scan_report)
@@ -0,0 +1,140 @@
+"""
+Deskew benchmark: projection-profile estimate vs full-resolution Hough lines
+
+Rotates the demo receipt by known angles at several sizes and times the
+angle estimate and the full DocumentScanner.deskew_image call (estimate
+plus one full-resolution rotation) for each method, reporting the angle
+error and the speedups overall and per size. Hough lines are binned at
+1 degree, so their error reaches 0.5 degree on fractional rotations such
+as 2.5; the projection estimate refines to 0.05 degree. The rotation is
+shared by both methods and dominates the total at large sizes.
+
+Usage (from backend/):
+    python -m benchmarks.deskew
+    python -m benchmarks.deskew --scales 1 2 4 --angles -10 -3 2 8 --repeat 5 --json results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from app.services.demo_scanner import DemoScanner
+from app.services.document_scanner import DocumentScanner
+
+METHODS = ("projection", "hough")
+
+
+def rotate(image: np.ndarray, angle: float) -> np.ndarray:
+    """Rotate an image about its centre, filling with white"""
+    h, w = image.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(image, M, (w, h), borderValue=(255, 255, 255))
+
+
+def run(scales: List[float], angles: List[float], repeat: int) -> List[Dict]:
+    """
+    Time both deskew methods on rotated copies of the demo receipt
+
+    Args:
+        scales: Receipt scale factors (1 = 800x1000)
+        angles: Rotations applied to the receipt, in degrees
+        repeat: Timed runs per case (the median is reported)
+
+    Returns:
+        One row per scale, angle and method
+    """
+    scanner = DocumentScanner()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        receipt_path = DemoScanner().create_sample_receipt(os.path.join(tmp_dir, "receipt.png"))
+        receipt = cv2.imread(receipt_path)
+
+    rows = []
+    for scale in scales:
+        scaled = cv2.resize(receipt, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        for angle in angles:
+            skewed = rotate(scaled, angle)
+            for method in METHODS:
+                estimate_skew = scanner.estimate_skew if method == "projection" else scanner._hough_skew_angle
+                estimate_timings = []
+                total_timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    estimate = estimate_skew(skewed)
+                    estimate_timings.append((time.perf_counter() - start) * 1000)
+                    start = time.perf_counter()
+                    scanner.deskew_image(skewed, method=method)
+                    total_timings.append((time.perf_counter() - start) * 1000)
+                rows.append({
+                    "width": skewed.shape[1],
+                    "height": skewed.shape[0],
+                    "angle": angle,
+                    "method": method,
+                    "estimate_ms": round(statistics.median(estimate_timings), 2),
+                    "total_ms": round(statistics.median(total_timings), 2),
+                    # A correct estimate undoes the applied rotation
+                    "error": None if estimate is None else round(abs(estimate + angle), 2)
+                })
+    return rows
+
+
+def _speedup(rows: List[Dict], key: str) -> float:
+    """Hough's median time over the projection estimate's (above 1: projection is faster)"""
+    medians = {method: statistics.median(row[key] for row in rows if row["method"] == method)
+               for method in METHODS}
+    return round(medians["hough"] / medians["projection"], 2)
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    """Median times and worst angle error per method, and the speedups overall and per size"""
+    summary = {}
+    for method in METHODS:
+        method_rows = [row for row in rows if row["method"] == method]
+        errors = [row["error"] for row in method_rows if row["error"] is not None]
+        summary[method] = {
+            "median_estimate_ms": round(statistics.median(row["estimate_ms"] for row in method_rows), 2),
+            "median_total_ms": round(statistics.median(row["total_ms"] for row in method_rows), 2),
+            "max_error": max(errors) if errors else None,
+            "failures": len(method_rows) - len(errors)
+        }
+    summary["estimate_speedup"] = _speedup(rows, "estimate_ms")
+    summary["total_speedup"] = _speedup(rows, "total_ms")
+    summary["by_size"] = {}
+    for size in dict.fromkeys(f"{row['width']}x{row['height']}" for row in rows):
+        size_rows = [row for row in rows if f"{row['width']}x{row['height']}" == size]
+        summary["by_size"][size] = {
+            "estimate_speedup": _speedup(size_rows, "estimate_ms"),
+            "total_speedup": _speedup(size_rows, "total_ms")
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--angles", type=float, nargs="+", default=[-12, -4, -1, 2.5, 7, 15])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write rows and summary to this file")
+    args = parser.parse_args()
+
+    rows = run(args.scales, args.angles, args.repeat)
+    print(f"{'size':>11} {'angle':>6} {'method':>10} {'estimate ms':>12} {'total ms':>9} {'error':>6}")
+    for row in rows:
+        error = "-" if row["error"] is None else f"{row['error']:.2f}"
+        print(f"{row['width']:>5}x{row['height']:<5} {row['angle']:>6} {row['method']:>10} "
+              f"{row['estimate_ms']:>12.2f} {row['total_ms']:>9.2f} {error:>6}")
+
+    summary = summarize(rows)
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": rows, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
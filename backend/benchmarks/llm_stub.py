@@ -0,0 +1,118 @@
+"""
+Local stub of the Anthropic and OpenAI APIs for exercising the AI paths
+
+Answers Claude messages and OpenAI chat completions with canned JSON after
+a configurable delay, and counts the requests and connections it sees, so
+the shared LLM clients (pooling, in-flight limits, queueing and 503
+backpressure) can be tested and load-tested without API keys or cost.
+
+Usage (from backend/):
+    python -m benchmarks.llm_stub --port 8089 --latency 0.5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 OPENAI_BASE_URL=http://127.0.0.1:8089/v1 \\
+        ANTHROPIC_API_KEY=stub OPENAI_API_KEY=stub uvicorn app.main:app
+    curl http://127.0.0.1:8089/stats
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+
+RECEIPT = {
+    "date": "2024-01-15",
+    "amount": 42.5,
+    "vendor": "Stub Coffee Co",
+    "category": "meals",
+    "description": "Coffee and pastries",
+    "line_items": [],
+    "tax_amount": 3.5,
+    "payment_method": "card"
+}
+
+
+def reply_for(prompt: str) -> str:
+    """Canned model output matching what each AIService prompt asks for"""
+    if "Categorize this transaction" in prompt:
+        return "meals"
+    if "JSON array of anomalies" in prompt:
+        return "[]"
+    if "tax deductions" in prompt:
+        return json.dumps({"deductions": [], "total_potential": 0, "disclaimer": "stub"})
+    if "forecast" in prompt:
+        return json.dumps({"forecast": [], "trends": [], "overall_confidence": "low"})
+    if "financial advisor" in prompt:
+        return json.dumps({"insights": [], "recommendations": [], "opportunities": [], "warnings": []})
+    return json.dumps(RECEIPT)
+
+
+def create_app(latency: float) -> FastAPI:
+    app = FastAPI(title="LLM stub")
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "connections": set()}
+
+    async def respond(request: Request, body: dict):
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        stats["connections"].add(request.client)
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+        return reply_for(json.dumps(body.get("messages", [])))
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        text = await respond(request, body)
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": 0}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        text = await respond(request, body)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        """Requests served, peak concurrency and distinct client connections"""
+        return {
+            "requests": stats["requests"],
+            "in_flight": stats["in_flight"],
+            "max_in_flight": stats["max_in_flight"],
+            "connections": len(stats["connections"])
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each reply")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
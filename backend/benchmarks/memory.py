@@ -0,0 +1,127 @@
+"""
+Memory profile of the scanning and OCR pipeline, one document at a time
+
+Runs documents through the pipeline in this process with tracemalloc on.
+Every pipeline stage reports its traced peak and net growth. A snapshot is
+taken after each document, so the report shows each document's peak and
+the allocation sites that grew with it. Sites that keep growing across
+the run (comparing the first document's snapshot with the last) point at
+leaks rather than per-document bloat.
+
+Usage (from backend/):
+    python -m benchmarks.memory                       # demo receipts
+    python -m benchmarks.memory uploads/*.jpg statement.pdf --repeat 3 --ocr
+    python -m benchmarks.memory scan.png --top 20 --key-type traceback --json memory.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+from typing import Dict, List
+
+from app.services.memory_tracing import MEMORY_TRACE_FRAMES, measure, take_snapshot, top_sites
+from app.services.metrics import collect_trace
+
+
+def demo_documents(directory: str) -> List[str]:
+    """Write the demo receipt, flat and photographed at an angle on a background"""
+    import cv2
+    from app.services.demo_scanner import DemoScanner
+
+    demo = DemoScanner()
+    receipt_path = demo.create_sample_receipt(os.path.join(directory, "receipt.png"))
+    photo = demo.add_background(demo.add_shadow(demo.create_angled_document(cv2.imread(receipt_path), 8)))
+    photo_path = os.path.join(directory, "photo.jpg")
+    cv2.imwrite(photo_path, photo)
+    return [receipt_path, photo_path]
+
+
+def process(path: str, ocr: bool):
+    """Scan (and optionally OCR) one document the way the upload workers do"""
+    from app.services import workers
+
+    if ocr:
+        return workers.extract(path)
+    if path.lower().endswith(".pdf"):
+        raise ValueError("PDFs are only rendered by the OCR stage; pass --ocr")
+    return workers.scan_document(path)
+
+
+def run(paths: List[str], repeat: int, ocr: bool, top: int, key_type: str) -> Dict:
+    """
+    Process each document `repeat` times under tracemalloc
+
+    Returns:
+        Per-document rows (peak, stage memory, sites that grew) and the
+        sites that grew between the first and last document
+    """
+    rows = []
+    first = None
+    previous = take_snapshot()
+    for iteration in range(repeat):
+        for path in paths:
+            with collect_trace() as trace:
+                with measure() as usage:
+                    process(path, ocr)
+            snapshot = take_snapshot()
+            rows.append({
+                "document": os.path.basename(path),
+                "iteration": iteration,
+                "peak_bytes": usage.peak_bytes,
+                "retained_bytes": usage.net_bytes,
+                "stages": dict(sorted(trace.memory.items(), key=lambda item: -item[1]["peak_bytes"])),
+                "grew": top_sites(snapshot, previous, top, key_type)
+            })
+            if first is None:
+                first = snapshot
+            previous = snapshot
+
+    return {
+        "documents": rows,
+        # The first document warms caches and imports; growth after it is suspicious
+        "growth_after_first_document": top_sites(previous, first, top, key_type),
+        "traced": dict(zip(("current_bytes", "peak_bytes"), tracemalloc.get_traced_memory()))
+    }
+
+
+def _mb(value: int) -> str:
+    return f"{value / (1024 * 1024):8.2f}MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="Images or PDFs (default: generated demo receipts)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the documents")
+    parser.add_argument("--ocr", action="store_true", help="Run OCR too (needs Tesseract)")
+    parser.add_argument("--top", type=int, default=10, help="Allocation sites to report")
+    parser.add_argument("--key-type", default="lineno", choices=("lineno", "filename", "traceback"))
+    parser.add_argument("--frames", type=int, default=MEMORY_TRACE_FRAMES,
+                        help="Stack frames per allocation (raise for --key-type traceback)")
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(args.frames)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = args.paths or demo_documents(tmp_dir)
+        report = run(paths, args.repeat, args.ocr, args.top, args.key_type)
+
+    print(f"{'document':>24} {'pass':>4} {'peak':>10} {'retained':>10}  largest stage peak")
+    for row in report["documents"]:
+        stage, usage = next(iter(row["stages"].items()), ("-", {"peak_bytes": 0}))
+        print(f"{row['document'][:24]:>24} {row['iteration']:>4} {_mb(row['peak_bytes'])} "
+              f"{_mb(row['retained_bytes'])}  {stage} {_mb(usage['peak_bytes']).strip()}")
+
+    print("\nGrowth after the first document:")
+    for site in report["growth_after_first_document"]:
+        print(f"{site['size_diff_bytes'] / 1024:+10.1f}KB {site['count_diff']:+8d} blocks  {site['site']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Accuracy and routing of the local receipt extractor at several thresholds
+
+Runs ReceiptExtractor over labelled receipts and reports per-field accuracy,
+extraction latency and, for each confidence threshold, the share of
+receipts that would skip the LLM and how many of those were wrong. Use it
+to pick LOCAL_PARSE_THRESHOLD. Receipts come from the synthetic generator
+(text only, optionally with simulated OCR errors) or from a corpus built
+by app.services.receipt_generator, read back with OCR.
+
+Simulated OCR errors come with simulated word confidences (misread words
+score lower, as Tesseract's do, but not always below the threshold); pass
+--no-ocr-confidence to see how the extractor does on the text alone. With
+--corpus --ocr the real confidences are used.
+
+Usage (from backend/):
+    python -m benchmarks.parse_routing --count 2000 --noise 0.01
+    python -m benchmarks.parse_routing --corpus ./corpus --ocr --json routing.json
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.receipt_extractor import LOCAL_PARSE_THRESHOLD, REQUIRED_FIELDS, ReceiptExtractor
+from app.services.receipt_generator import START_DATE, DATE_RANGE_DAYS, make_receipt
+
+# Common OCR confusions, applied in both directions
+CONFUSIONS = {"0": "O", "1": "l", "5": "S", "8": "B", "O": "0", "l": "1", "S": "5", "B": "8", "e": "c", "a": "o"}
+# Simulated word confidences (0-100): correctly read words, and words with an injected error
+CLEAN_WORD_CONFIDENCE = (85.0, 97.0)
+MISREAD_WORD_CONFIDENCE = (40.0, 92.0)
+
+
+def add_noise(text: str, rng: random.Random, rate: float) -> str:
+    """Swap easily confused characters and drop others, each at roughly `rate` per character"""
+    out = []
+    for char in text:
+        roll = rng.random()
+        if roll < rate and char in CONFUSIONS:
+            out.append(CONFUSIONS[char])
+        elif roll < rate * 1.3 and not char.isspace():
+            continue
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def simulate_ocr(lines: List[str], rng: random.Random, rate: float) -> Tuple[str, List[Optional[float]]]:
+    """
+    Add noise word by word and score each word like an OCR engine would
+
+    Returns:
+        The noisy text and the lowest word confidence of each line (None for
+        lines that lost every character)
+    """
+    noisy_lines = []
+    line_confidences = []
+    for line in lines:
+        words = []
+        confidences = []
+        for word in line.split():
+            noisy = add_noise(word, rng, rate)
+            if noisy:
+                words.append(noisy)
+                confidences.append(rng.uniform(*(CLEAN_WORD_CONFIDENCE if noisy == word
+                                                 else MISREAD_WORD_CONFIDENCE)))
+        noisy_lines.append(" ".join(words))
+        line_confidences.append(min(confidences) if confidences else None)
+    return "\n".join(noisy_lines), line_confidences
+
+
+def synthetic_receipts(count: int, seed: int, noise: float, ocr_confidence: bool = True) -> List[Dict]:
+    receipts = []
+    for index in range(count):
+        rng = random.Random(seed * 1_000_003 + index)
+        receipt = make_receipt(rng)
+        text, line_confidences = simulate_ocr(receipt["text"], rng, noise)
+        receipts.append({**receipt, "ocr_text": text,
+                         "line_confidences": line_confidences if ocr_confidence else None})
+    return receipts
+
+
+def corpus_receipts(directory: str, ocr: bool) -> List[Dict]:
+    from app.services.ocr_service import OCRService
+
+    service = OCRService() if ocr else None
+    receipts = []
+    with open(os.path.join(directory, "labels.jsonl")) as f:
+        for line in f:
+            name = os.path.splitext(json.loads(line)["file"])[0]
+            # The manifest has the headline labels; the sidecar also has tax and the text
+            with open(os.path.join(directory, name + ".json")) as sidecar:
+                receipt = json.load(sidecar)
+            if service is not None:
+                result = service.extract(os.path.join(directory, receipt["file"]))
+                receipt["ocr_text"], receipt["line_confidences"] = result.text, result.line_confidences
+            else:
+                receipt["ocr_text"] = "\n".join(receipt["text"])
+            receipts.append(receipt)
+    return receipts
+
+
+def correct(parsed: Dict, receipt: Dict) -> Dict[str, bool]:
+    return {
+        "amount": parsed["amount"] is not None and abs(parsed["amount"] - receipt["amount"]) < 0.005,
+        "date": parsed["date"] == receipt["date"],
+        "vendor": parsed["vendor"].lower() == receipt["vendor"].lower(),
+        "tax_amount": round(parsed["tax_amount"] or 0, 2) == round(receipt.get("tax", 0), 2),
+        "currency": parsed["currency"] == receipt.get("currency", "USD")
+    }
+
+
+def run(receipts: List[Dict], thresholds: List[float]) -> Dict:
+    """
+    Extract every receipt and score it against its labels
+
+    Returns:
+        Field accuracy, extraction latency percentiles and, per threshold,
+        the local share and the error rate among local parses
+    """
+    extractor = ReceiptExtractor()
+    # Synthetic dates run up to three years after START_DATE; none are in the future
+    today = max(date.today(), START_DATE + timedelta(days=DATE_RANGE_DAYS))
+    rows = []
+    timings = []
+    for receipt in receipts:
+        start = time.perf_counter()
+        extraction = extractor.extract(receipt["ocr_text"], today=today,
+                                       line_confidences=receipt.get("line_confidences"))
+        timings.append((time.perf_counter() - start) * 1000)
+        rows.append((extraction.confidence, correct(extraction.to_parsed(), receipt)))
+
+    fields = rows[0][1].keys() if rows else []
+    routing = {}
+    for threshold in thresholds:
+        local = [checks for confidence, checks in rows if confidence >= threshold]
+        wrong = sum(not all(checks[name] for name in REQUIRED_FIELDS) for checks in local)
+        routing[f"{threshold:g}"] = {
+            "local_rate": round(len(local) / len(rows), 4) if rows else 0.0,
+            "local_error_rate": round(wrong / len(local), 4) if local else 0.0,
+            "local_errors": wrong
+        }
+    return {
+        "receipts": len(rows),
+        "accuracy": {name: round(sum(checks[name] for _, checks in rows) / len(rows), 4) for name in fields},
+        "extract_ms": {
+            "p50": round(float(np.percentile(timings, 50)), 3),
+            "p95": round(float(np.percentile(timings, 95)), 3),
+            "max": round(max(timings), 3)
+        } if timings else {},
+        "routing": routing
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000, help="Synthetic receipts (without --corpus)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.0, help="Simulated OCR error rate per character")
+    parser.add_argument("--no-ocr-confidence", action="store_true",
+                        help="Extract synthetic receipts without simulated OCR word confidences")
+    parser.add_argument("--corpus", help="Directory written by app.services.receipt_generator")
+    parser.add_argument("--ocr", action="store_true", help="OCR the corpus images instead of using their text")
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=sorted({0.7, 0.8, 0.85, 0.9, 0.95, LOCAL_PARSE_THRESHOLD}))
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        receipts = corpus_receipts(args.corpus, args.ocr)
+    else:
+        receipts = synthetic_receipts(args.count, args.seed, args.noise, not args.no_ocr_confidence)
+    results = run(receipts, args.thresholds)
+
+    print(f"{results['receipts']} receipts, extraction p50 {results['extract_ms']['p50']}ms "
+          f"p95 {results['extract_ms']['p95']}ms")
+    print("Field accuracy: " + ", ".join(f"{name} {value:.3f}" for name, value in results["accuracy"].items()))
+    print(f"\n{'threshold':>10} {'local':>8} {'local errors':>13}")
+    for threshold, stats in results["routing"].items():
+        print(f"{threshold:>10} {stats['local_rate']:>8.1%} {stats['local_error_rate']:>12.2%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
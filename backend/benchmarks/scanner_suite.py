@@ -0,0 +1,295 @@
+"""
+Scanner and OCR benchmark suite over synthetic distortions and image sizes
+
+Renders the demo receipt at several sizes, applies the DemoScanner
+distortions (angle, shadow, cluttered background and all three together)
+and runs every case through DocumentScanner and OCRService. Each case
+reports per-stage latency percentiles (the stage_timer stages plus deskew,
+text-line detection and shadow removal on the scanned page), peak traced
+memory, and OCR character accuracy against DemoScanner.SAMPLE_RECEIPT_TEXT.
+Random distortions are seeded, so runs are reproducible and their JSON
+results can be compared across changes.
+
+Usage (from backend/):
+    python -m benchmarks.scanner_suite --json before.json
+    python -m benchmarks.scanner_suite --json after.json --compare before.json
+    python -m benchmarks.scanner_suite --scales 1 2 --distortions flat photo --repeat 10 --no-ocr
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from app.services.demo_scanner import DemoScanner
+from app.services.document_scanner import DocumentScanner
+from app.services.memory_tracing import measure
+from app.services.metrics import collect_trace, stage_timer
+from app.services.ocr_service import OCRService
+
+
+def _angled(demo: DemoScanner, image: np.ndarray) -> np.ndarray:
+    return demo.create_angled_document(image)
+
+
+def _shadow(demo: DemoScanner, image: np.ndarray) -> np.ndarray:
+    return demo.add_shadow(image)
+
+
+def _background(demo: DemoScanner, image: np.ndarray) -> np.ndarray:
+    return demo.add_background(image)
+
+
+def _photo(demo: DemoScanner, image: np.ndarray) -> np.ndarray:
+    return demo.add_background(demo.add_shadow(demo.create_angled_document(image)))
+
+
+# Distortion name -> transform applied to the flat receipt
+DISTORTIONS: Dict[str, Optional[Callable]] = {
+    "flat": None,
+    "angled": _angled,
+    "shadow": _shadow,
+    "background": _background,
+    "photo": _photo
+}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def char_accuracy(truth: str, text: str) -> float:
+    """1 - character error rate, with whitespace runs collapsed (0 when nothing matches)"""
+    truth = re.sub(r"\s+", " ", truth).strip()
+    text = re.sub(r"\s+", " ", text).strip()
+    if not truth:
+        return 1.0 if not text else 0.0
+    return max(0.0, 1 - edit_distance(truth, text) / len(truth))
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(np.mean(values)), 2),
+        "n": len(values)
+    }
+
+
+def make_cases(scales: List[float], distortions: List[str], seed: int) -> List[Dict]:
+    """
+    Render the receipt once per size and distortion
+
+    Returns:
+        Cases with the encoded image (PNG when flat, JPEG like a phone photo otherwise)
+    """
+    demo = DemoScanner()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        receipt = cv2.imread(demo.create_sample_receipt(os.path.join(tmp_dir, "receipt.png")))
+
+    cases = []
+    for scale in scales:
+        scaled = cv2.resize(receipt, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        for index, distortion in enumerate(distortions):
+            # add_background draws from numpy's global generator
+            np.random.seed(seed + index)
+            transform = DISTORTIONS[distortion]
+            image = scaled if transform is None else transform(demo, scaled)
+            extension = ".png" if distortion == "flat" else ".jpg"
+            cases.append({
+                "scale": scale,
+                "distortion": distortion,
+                "width": image.shape[1],
+                "height": image.shape[0],
+                "data": cv2.imencode(extension, image)[1].tobytes()
+            })
+    return cases
+
+
+def run_case(service: Optional[OCRService], scanner: DocumentScanner, data: bytes) -> Dict:
+    """
+    Run one image through the pipeline inside a stage trace
+
+    Returns:
+        Stage timings and memory, the OCR text (None without OCR) and the scanner report
+    """
+    with collect_trace() as trace:
+        start = time.perf_counter()
+        # Scan first and hand the page to OCR, as the upload workers do
+        report = {}
+        scanned = scanner.scan_document(data, report)
+        text = None
+        if service is not None:
+            result = service.extract_from_image(data, scanned, scan_report=report)
+            text = result.text
+            report = result.preprocessing or report
+
+        # Stages that are not part of the upload path
+        if scanned is not None:
+            with stage_timer("scan.deskew"):
+                scanner.deskew_image(scanned)
+            with stage_timer("scan.find_text_lines"):
+                scanner.find_text_lines(scanned)
+        with stage_timer("scan.remove_shadows"):
+            scanner.remove_shadows(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+        trace.add("total", (time.perf_counter() - start) * 1000)
+    return {"stages": trace.stages, "memory": trace.memory, "text": text, "report": report}
+
+
+def run(scales: List[float], distortions: List[str], repeat: int, seed: int,
+        ocr: bool = True, memory: bool = True) -> Dict:
+    """
+    Run the benchmark matrix
+
+    Args:
+        scales: Receipt scale factors (1 = 800x1000)
+        distortions: Names from DISTORTIONS
+        repeat: Timed runs per case
+        seed: Seed for the random distortions
+        ocr: Run OCR (needs a working Tesseract) and score accuracy
+        memory: Add one run per case under tracemalloc for peak memory
+
+    Returns:
+        Metadata, per-case results and per-stage percentiles over all cases
+    """
+    scanner = DocumentScanner()
+    service = None
+    if ocr:
+        service = OCRService()
+        service.cache = None  # Every run must do the work
+        if not service.engine.health_check():
+            print("OCR engine unavailable, skipping OCR stages and accuracy")
+            service = None
+    truth = "\n".join(DemoScanner.SAMPLE_RECEIPT_TEXT)
+
+    results = []
+    all_timings: Dict[str, List[float]] = {}
+    for case in make_cases(scales, distortions, seed):
+        data = case.pop("data")
+        timings: Dict[str, List[float]] = {}
+        runs = [run_case(service, scanner, data) for _ in range(repeat)]
+        for stages in (r["stages"] for r in runs):
+            for stage, elapsed_ms in stages.items():
+                timings.setdefault(stage, []).append(elapsed_ms)
+                all_timings.setdefault(stage, []).append(elapsed_ms)
+
+        case["stages"] = {stage: percentiles(values) for stage, values in sorted(timings.items())}
+        last = runs[-1]
+        case["profile"] = last["report"].get("profile")
+        case["detection"] = last["report"].get("detection", {}).get("stage")
+        if last["text"] is not None:
+            case["char_accuracy"] = round(char_accuracy(truth, last["text"]), 4)
+
+        if memory:
+            # Separate run: tracing slows allocation-heavy stages
+            tracemalloc.start()
+            try:
+                with measure() as usage:
+                    traced = run_case(service, scanner, data)
+                case["peak_bytes"] = usage.peak_bytes
+                case["stage_peak_bytes"] = {
+                    stage: usage["peak_bytes"] for stage, usage in sorted(traced["memory"].items())
+                }
+            finally:
+                tracemalloc.stop()
+        results.append(case)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "seed": seed,
+            "repeat": repeat,
+            "scanner_version": DocumentScanner.VERSION,
+            "ocr_engine": service.engine.name if service is not None else None,
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count()
+        },
+        "cases": results,
+        "stages": {stage: percentiles(values) for stage, values in sorted(all_timings.items())}
+    }
+
+
+def compare(current: Dict, baseline: Dict):
+    """Print p50 stage latencies, peak memory and accuracy against a baseline run"""
+    print(f"\n{'stage':>24} {'baseline p50':>13} {'p50':>9} {'change':>8}")
+    for stage, stats in current["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is None or not before["p50"]:
+            print(f"{stage:>24} {'-':>13} {stats['p50']:>9.2f}")
+            continue
+        change = (stats["p50"] - before["p50"]) / before["p50"] * 100
+        print(f"{stage:>24} {before['p50']:>13.2f} {stats['p50']:>9.2f} {change:>+7.1f}%")
+
+    baseline_cases = {(case["scale"], case["distortion"]): case for case in baseline["cases"]}
+    print(f"\n{'case':>18} {'peak MB':>15} {'accuracy':>15}")
+    for case in current["cases"]:
+        before = baseline_cases.get((case["scale"], case["distortion"]), {})
+        peak = "/".join(
+            "-" if c.get("peak_bytes") is None else f"{c['peak_bytes'] / 2**20:.1f}" for c in (before, case)
+        )
+        accuracy = "/".join(
+            "-" if c.get("char_accuracy") is None else f"{c['char_accuracy']:.3f}" for c in (before, case)
+        )
+        print(f"{case['distortion']:>12} x{case['scale']:<4} {peak:>15} {accuracy:>15}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--distortions", nargs="+", default=list(DISTORTIONS), choices=list(DISTORTIONS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-ocr", action="store_true", help="Only run the scanner stages")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file from an earlier run")
+    args = parser.parse_args()
+
+    results = run(args.scales, args.distortions, args.repeat, args.seed,
+                  ocr=not args.no_ocr, memory=not args.no_memory)
+
+    print(f"{'case':>18} {'size':>11} {'profile':>8} {'detection':>10} {'total p50':>10} "
+          f"{'p95':>9} {'peak MB':>8} {'accuracy':>8}")
+    for case in results["cases"]:
+        total = case["stages"]["total"]
+        peak = "-" if "peak_bytes" not in case else f"{case['peak_bytes'] / 2**20:.1f}"
+        accuracy = "-" if "char_accuracy" not in case else f"{case['char_accuracy']:.3f}"
+        print(f"{case['distortion']:>12} x{case['scale']:<4} {case['width']:>5}x{case['height']:<5} "
+              f"{str(case['profile']):>8} {str(case['detection']):>10} {total['p50']:>10.1f} "
+              f"{total['p95']:>9.1f} {peak:>8} {accuracy:>8}")
+
+    print(f"\n{'stage':>24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'n':>5}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:>24} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f} {stats['n']:>5}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()